@@ -17,12 +17,13 @@ function LoginPage() {
         event.target.getElementsByTagName("input")[0].value = "";
         event.target.getElementsByTagName("input")[1].value = "";
 
-        const url = `${REACT_APP_SERVER_URL}/validate/${cisUsername}/${password}`;
-        const response = await fetch(url, {
-            method: "GET",
+        // the credentials go in the body rather than the URL so that the password doesn't end up in any logs
+        const response = await fetch(`${REACT_APP_SERVER_URL}/validate`, {
+            method: "POST",
             headers: {
                 "Content-Type": "application/json"
-            }
+            },
+            body: JSON.stringify({username: cisUsername, password: password})
         });
 
         // `true` or `false`
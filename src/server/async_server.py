@@ -0,0 +1,510 @@
+'''
+An ASGI version of the Flask server in `server.py`, for running in production.
+
+`server()` runs on Flask's development server, where every request holds a thread for as long as it's waiting on
+the upstream Durham server and then parsing the HTML with BeautifulSoup. So one slow `/get-module-timetables` request
+can hold up quick ones like `/get-module-names`.
+
+Here, the routes are `async`:
+- the requests to the Durham server are awaited (see `Scraper.handle_request_async`), so the event loop can serve
+  other requests in the meantime.
+- the BeautifulSoup parsing is pushed to a pool of worker processes, so it doesn't block the event loop either - as is
+  the rest of the CPU-bound work (finding clashes and free time, encoding clash matrices, and compressing responses).
+
+---
+
+### Running:
+
+From `src/server/` (so that `load_environment_variables` can find the `.env` file):
+
+```
+uvicorn async_server:async_server --factory --workers 4 --host 0.0.0.0 --port 5000
+```
+
+- `--workers` is the number of server processes. Each one has its own event loop and its own parsing pool.
+- The size of each parsing pool is set by the `APP_PARSE_WORKERS` environment variable (defaults to the number of CPUs).
+'''
+
+import os
+import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import quart
+from quart_cors import cors
+from quart.wrappers.response import DataBody
+from werkzeug.exceptions import BadRequest, NotFound, ServiceUnavailable
+
+from scraper import Scraper, UpstreamError
+from request_args import get_local_now, get_local_datetime, get_window, get_coming_week, get_flag, get_time_of_day, get_slot, get_module_codes, get_module_sets, get_credentials
+from env import load_environment_variables
+from cache import cache_from_environment
+from mapped_snapshot import MappedSnapshot
+from store import TimetableStore
+from credential_validator import CredentialValidator, RateLimited
+import metrics
+from profiling import Profiler
+import wire_format
+from clashes import find_clashes
+import clash_matrix
+from room_index import RoomIndex
+from staff_index import StaffIndex, normalise_staff_name
+import occupancy
+import upcoming
+import snapshot_diff
+from snapshot import get_versions
+import free_time
+import batch
+
+# ============================================================
+
+def async_server():
+    '''
+    Returns the ASGI app. The routes are the same as in `server()` (see `server.py`).
+    '''
+    app = quart.Quart(__name__)
+    app = cors(app, allow_origin="*")
+
+    load_environment_variables()
+
+    scraper = Scraper(
+        os.environ.get("APP_SCRAPER_USERNAME"),
+        os.environ.get("APP_SCRAPER_PASSWORD"),
+        # set `APP_CACHE_BACKEND=sqlite` to share the cache between worker processes
+        cache = cache_from_environment(),
+        # set `APP_STORE_PATH` (see `store.py`) and/or `APP_SNAPSHOT_DIR` to serve timetables from the latest snapshot written by `crawl.py`
+        # (the snapshot is memory-mapped, so the server is ready straight away and its workers share one copy - see `mapped_snapshot.py`)
+        snapshot = TimetableStore.from_environment() or MappedSnapshot.from_environment(),
+    )
+
+    # the style of report timetables are requested in - see `Scraper.configure_report_style`. By default the cheapest is picked,
+    # in the background as it makes a few requests upstream
+    scraper.configure_report_style(os.environ.get("APP_REPORT_STYLE", "auto"), background=True)
+
+    validator = CredentialValidator(scraper)
+
+    # opt-in per-request profiling - see `profiling.py` for the environment variables that switch it on
+    # (only the sampled profiler can be used on the event loop)
+    profiler = Profiler.from_environment(event_loop=True)
+
+    # the modules being got from upstream by `/batch-module-timetables`, `/clash-matrix` and `/free-time` right now, so that concurrent requests share them (see `batch.py`)
+    in_flight = batch.InFlight()
+
+    # index class (e.g. `RoomIndex`) --> the index of the snapshot. Each is built the first time it's needed,
+    # as it goes through every activity in the snapshot (see `room_index.py` and `staff_index.py`)
+    indexes = dict()
+
+    async def get_index(index_class:'type') -> 'RoomIndex|StaffIndex':
+        if scraper.snapshot is None:
+            raise ServiceUnavailable("This can only be looked up when serving from a snapshot (see `crawl.py`).")
+        if index_class not in indexes:
+            indexes[index_class] = await asyncio.to_thread(index_class.from_snapshot, scraper.snapshot)
+        return indexes[index_class]
+
+    # ----------
+
+    async def get_staff_activities(name:'str') -> 'list[dict]':
+        ''' The activities taught by `name` - from the snapshot if they're in it, otherwise from the upstream staff report. '''
+
+        if scraper.snapshot is not None:
+            staff_index = await get_index(StaffIndex)
+            if staff_index.has_staff(name):
+                return staff_index.get_activities(name)
+
+        return await scraper.get_staff_timetable_async([normalise_staff_name(name)], "list", executor=parse_pool)
+
+    # the pool of processes that the HTML parsing is handed off to.
+    # it's created once the server starts (rather than here) so that it isn't forked along with the uvicorn workers.
+    parse_pool = None
+
+    # ------------------------------
+
+    @app.before_serving
+    async def start_parse_pool() -> None:
+        nonlocal parse_pool
+        max_workers = int(os.environ.get("APP_PARSE_WORKERS", os.cpu_count()))
+        parse_pool = ProcessPoolExecutor(max_workers=max_workers)
+
+    @app.after_serving
+    async def stop_parse_pool() -> None:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run_in_pool(func:'typing.Callable', *args, **kwargs) -> 'object':
+        ''' Runs `func(*args, **kwargs)` in `parse_pool`, so that it doesn't block the event loop. `func` and its arguments must be picklable. '''
+        return await asyncio.get_running_loop().run_in_executor(parse_pool, functools.partial(func, *args, **kwargs))
+
+    # ------------------------------
+
+    @app.before_request
+    async def start_request_timer() -> None:
+        quart.g.request_start = time.perf_counter()
+
+    # registered before `compress_response`, so that it runs after it (and the compression is included in the time)
+    @app.after_request
+    async def record_request_time(response:'quart.Response') -> 'quart.Response':
+        # the route's rule (e.g. "/validate/<username>/<password>") is used rather than the path, so that each route is one set of metrics
+        rule = quart.request.url_rule.rule if (quart.request.url_rule is not None) else "unmatched"
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - quart.g.request_start,
+            route=rule, method=quart.request.method, status=response.status_code,
+        )
+        return response
+
+    # ------------------------------
+
+    @app.before_request
+    async def start_profile() -> None:
+        quart.g.profile = profiler.start(quart.request.headers.get("X-Profile"))
+
+    @app.after_request
+    async def finish_profile(response:'quart.Response') -> 'quart.Response':
+        if quart.g.profile is not None:
+            # the profile is tagged with the module codes, if the body is a list of them (e.g. `/get-module-timetables`)
+            body_data = await quart.request.get_json(silent=True)
+            module_codes = body_data if isinstance(body_data, list) else None
+
+            rule = quart.request.url_rule.rule if (quart.request.url_rule is not None) else "unmatched"
+            profiler.finish(quart.g.profile, time.perf_counter() - quart.g.request_start, rule, module_codes)
+
+        return response
+
+    # ------------------------------
+
+    @app.after_request
+    async def compress_response(response:'quart.Response') -> 'quart.Response':
+        ''' Compresses the response body if the client accepts gzip (or brotli). See `wire_format.compress`. '''
+
+        # streamed responses, error pages and anything that's already been encoded are left alone
+        if (not isinstance(response.response, DataBody)) or (response.status_code != 200) or ("Content-Encoding" in response.headers):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        # (bodies too small to be compressed aren't worth sending to the pool)
+        body = await response.get_data()
+        if len(body) < wire_format.MINIMUM_COMPRESSIBLE_SIZE:
+            return response
+
+        body, encoding = await run_in_pool(wire_format.compress, body, quart.request.accept_encodings)
+        if encoding is not None:
+            response.set_data(body)
+            response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    # ------------------------------
+
+    @app.route("/")
+    async def index():
+        return quart.jsonify("Welcome to my Flask server. Make yourself at home :)")
+
+    # ------------------------------
+
+    @app.errorhandler(RateLimited)
+    async def rate_limited(error:'RateLimited') -> 'quart.Response':
+        response = quart.jsonify(str(error))
+        response.status_code = 429
+        response.headers["Retry-After"] = str(int(error.retry_after) + 1)
+        return response
+
+    @app.errorhandler(UpstreamError)
+    async def upstream_error(error:'UpstreamError') -> 'quart.Response':
+        response = quart.jsonify(str(error))
+        response.status_code = 502
+        return response
+
+    # ------------------------------
+
+    @app.route("/validate", methods=["POST"])
+    async def validate() -> bool:
+        username, password = get_credentials(await quart.request.get_json(silent=True))
+
+        data = await validator.validate_async(username, password)
+        return quart.jsonify(data)
+
+    # ------------------------------
+
+    @app.route("/validate/<username>/<password>")
+    async def validate_from_url(username:str, password:str) -> bool:
+        data = await validator.validate_async(username, password)
+        return quart.jsonify(data)
+
+    # ------------------------------
+
+    @app.route("/get-module-names", methods=["GET"])
+    async def get_module_names() -> list:
+
+        all_params = await scraper.get_module_timetable_url_parameters_async(parse_pool)
+        module_names = [sublist[0] for sublist in all_params["Select Module(s) to View:"]]
+
+        return quart.jsonify(module_names)
+
+    # ------------------------------
+
+    @app.route("/get-module-timetables", methods=["GET", "POST"])
+    async def get_module_timetables() -> list:
+
+        # list of module codes
+        body_data = await quart.request.get_json()
+
+        # the optional `from` and `to` query parameters restrict the timetables to a window of dates - see `server.py`
+        window = get_window(quart.request.args)
+
+        if window is None:
+            timetables = await scraper.get_module_timetable_async(body_data, executor=parse_pool)
+        else:
+            timetables = await scraper.get_module_timetable_window_async(body_data, *window, executor=parse_pool)
+
+        # clients can opt in to a more compact format using the `Accept` header - see `wire_format.py`
+        mimetype = wire_format.negotiate_format(quart.request.accept_mimetypes)
+
+        with metrics.span("encode"):
+            if mimetype == wire_format.JSON_MIMETYPE:
+                response = quart.jsonify(timetables)
+            else:
+                response = quart.Response(wire_format.encode_timetables(timetables, mimetype), mimetype=mimetype)
+
+        response.vary.add("Accept")
+        return response
+
+    # ------------------------------
+
+    @app.route("/batch-module-timetables", methods=["POST"])
+    async def get_batch_module_timetables() -> quart.Response:
+
+        # set name --> list of module codes
+        module_sets = get_module_sets(await quart.request.get_json())
+        window = get_window(quart.request.args)
+
+        with metrics.span("batch"):
+            modules = await batch.get_module_activities_async(scraper, batch.get_batch_module_codes(module_sets), in_flight, parse_pool)
+
+        if quart.request.accept_mimetypes.best_match(["application/json", batch.NDJSON_MIMETYPE]) == batch.NDJSON_MIMETYPE:
+            async def stream_sets():
+                for line in batch.iter_ndjson(modules, module_sets, window):
+                    yield line.encode("utf-8")
+
+            return quart.Response(stream_sets(), mimetype=batch.NDJSON_MIMETYPE)
+
+        return quart.jsonify({name: batch.get_set_timetable(modules, module_codes, window) for name, module_codes in module_sets.items()})
+
+    # ------------------------------
+
+    @app.route("/clashes", methods=["GET", "POST"])
+    async def get_clashes() -> list:
+
+        # list of module codes
+        body_data = get_module_codes(await quart.request.get_json(silent=True))
+
+        # the same `from`/`to` window as `/get-module-timetables`
+        window = get_window(quart.request.args)
+
+        # the timetables are fetched in the same way as `/get-module-timetables`, so they come from the same cache entries
+        if window is None:
+            timetables = await scraper.get_module_timetable_async(body_data, executor=parse_pool)
+        else:
+            timetables = await scraper.get_module_timetable_window_async(body_data, *window, executor=parse_pool)
+
+        activities = [activity for day in timetables.values() for activity in day]
+        include_same_module = get_flag(quart.request.args, "same-module")
+
+        with metrics.span("find_clashes"):
+            clashes = await run_in_pool(find_clashes, activities, include_same_module)
+
+        return quart.jsonify(clashes)
+
+    # ------------------------------
+
+    @app.route("/clash-matrix", methods=["GET", "POST"])
+    async def get_clash_matrix() -> quart.Response:
+
+        # either a list of module codes in the body, or every module of `?department=`
+        department = quart.request.args.get("department")
+        if department is not None:
+            module_codes = clash_matrix.get_department_module_codes(await scraper.get_module_timetable_url_parameters_async(parse_pool), department)
+        else:
+            module_codes = await quart.request.get_json(silent=True) or []
+
+        with metrics.span("clash_matrix"):
+            matrix = await clash_matrix.get_clash_matrix_async(scraper, module_codes, in_flight, parse_pool)
+
+        # (a department's matrix can be hundreds of modules square, so it's encoded in the pool too)
+        if quart.request.args.get("format") == "csv":
+            return quart.Response(await run_in_pool(matrix.to_csv), mimetype="text/csv")
+
+        body = await run_in_pool(json.dumps, matrix.to_dict(), separators=(",", ":"))
+        return quart.Response(body, mimetype="application/json")
+
+    # ------------------------------
+
+    @app.route("/rooms", methods=["GET"])
+    async def get_rooms() -> list:
+        rooms = (await get_index(RoomIndex)).get_rooms(quart.request.args.get("building"))
+        return quart.jsonify(rooms)
+
+    # ------------------------------
+
+    @app.route("/rooms/<path:room>", methods=["GET"])
+    async def get_room_busy(room:str) -> list:
+
+        # the whole year, unless `from`/`to` are given
+        start_date, end_date = get_window(quart.request.args, default_whole_year=True)
+
+        busy = (await get_index(RoomIndex)).get_busy(room, start_date, end_date)
+        return quart.jsonify(busy)
+
+    # ------------------------------
+
+    @app.route("/free-rooms", methods=["GET"])
+    async def get_free_rooms() -> list:
+
+        building = quart.request.args.get("building")
+        if building is None:
+            raise BadRequest("`building` must be given (e.g. TLC).")
+
+        date, start, end = get_slot(quart.request.args)
+
+        free_rooms = (await get_index(RoomIndex)).find_free_rooms(building.upper(), date, start, end)
+        return quart.jsonify(free_rooms)
+
+    # ------------------------------
+
+    @app.route("/free-time", methods=["POST"])
+    async def get_free_time() -> list:
+
+        # a list of module codes for each member of the group
+        module_sets = await quart.request.get_json()
+        if (not isinstance(module_sets, list)) or (not all(isinstance(module_set, list) for module_set in module_sets)):
+            raise BadRequest("The body must be a list of lists of module codes.")
+
+        # the coming week, unless `from`/`to` are given - otherwise the longest periods would all be in the holidays
+        start_date, end_date = get_window(quart.request.args) or get_coming_week()
+
+        args = quart.request.args
+        earliest = get_time_of_day(args, "earliest")
+        latest = get_time_of_day(args, "latest")
+        try:
+            min_minutes = int(args.get("min-minutes", 60))
+            limit = int(args.get("limit", 20))
+        except ValueError:
+            raise BadRequest("`min-minutes` and `limit` must be whole numbers.")
+
+        # each module is got on its own (from the snapshot, its own cache entry, or upstream in URL-length batches - see `batch.py`),
+        # so a big group doesn't need one huge report, and members' modules are shared with everything else asking for them
+        module_codes = free_time.get_module_codes(module_sets)
+        with metrics.span("batch"):
+            modules = await batch.get_module_activities_async(scraper, module_codes, in_flight, parse_pool)
+        activities = [activity for code in module_codes for activity in modules[code]]
+
+        with metrics.span("find_common_free_time"):
+            periods = await run_in_pool(
+                free_time.find_common_free_time,
+                module_sets, activities, start_date, end_date,
+                earliest = earliest, latest = latest, min_minutes = min_minutes,
+                include_weekends = get_flag(args, "weekends"), limit = limit,
+            )
+
+        return quart.jsonify(periods)
+
+    # ------------------------------
+
+    @app.route("/staff", methods=["GET"])
+    async def get_staff() -> list:
+        staff = (await get_index(StaffIndex)).get_staff(quart.request.args.get("search"))
+        return quart.jsonify(staff)
+
+    # ------------------------------
+
+    @app.route("/staff/<name>", methods=["GET"])
+    async def get_staff_timetable(name:str) -> list:
+
+        activities = await get_staff_activities(name)
+
+        window = get_window(quart.request.args)
+        if window is not None:
+            activities = Scraper.slice_module_timetable(activities, *window)
+
+        return quart.jsonify(activities)
+
+    # ------------------------------
+
+    @app.route("/staff/<name>/busy", methods=["GET"])
+    async def get_staff_busy(name:str) -> list:
+
+        activities = await get_staff_activities(name)
+
+        # the whole year, unless `from`/`to` are given
+        start_date, end_date = get_window(quart.request.args, default_whole_year=True)
+
+        busy = occupancy.get_busy_periods(occupancy.union(occupancy.get_activity_bitmaps(activities)), activities, start_date, end_date)
+        return quart.jsonify(busy)
+
+    # ------------------------------
+
+    @app.route("/upcoming", methods=["GET", "POST"])
+    async def get_upcoming() -> dict:
+
+        args = quart.request.args
+
+        # `?modules=COMP2221,COMP2261` (so that it can be polled with a plain GET), or a list of module codes in the body
+        if "modules" in args:
+            module_codes = [code for code in args["modules"].split(",") if code]
+        else:
+            module_codes = await quart.request.get_json(silent=True) or []
+
+        # the timetables' times are in Durham (and naive), whatever the timezone of the server or the client
+        after = get_local_datetime(args, "after") or get_local_now()
+        try:
+            count = int(args.get("count", 5))
+        except ValueError:
+            raise BadRequest("`count` must be a whole number.")
+
+        index = await upcoming.get_occurrence_index_async(scraper, module_codes, executor=parse_pool)
+
+        return quart.jsonify({
+            "After": after.isoformat(timespec="seconds"),
+            "Next": index.get_next(after, count),
+            "Today": index.get_day(after.date()),
+        })
+
+    # ------------------------------
+
+    @app.route("/changes", methods=["GET"])
+    async def get_changes() -> dict:
+
+        directory = os.environ.get("APP_SNAPSHOT_DIR")
+        if (scraper.snapshot is None) or (directory is None):
+            raise ServiceUnavailable("Changes can only be looked up when serving from the snapshots in `APP_SNAPSHOT_DIR` (see `crawl.py`).")
+
+        args = quart.request.args
+
+        # (checked against the snapshots that exist, as it becomes part of a path)
+        since = args.get("since")
+        if since not in get_versions(directory):
+            raise NotFound(f"There's no snapshot with the version `{since}`.")
+
+        # `?modules=COMP2221,COMP2261`, or every module if not given
+        module_codes = [code for code in args["modules"].split(",") if code] if ("modules" in args) else None
+
+        with metrics.span("get_changes"):
+            changes = await asyncio.to_thread(snapshot_diff.get_changes, scraper, directory, since, module_codes)
+
+        return quart.jsonify(changes)
+
+    # ------------------------------
+
+    @app.route("/metrics")
+    async def get_metrics() -> str:
+        ''' The metrics in `metrics.py`, in the Prometheus text format. '''
+        return quart.Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+    # ------------------------------
+
+    return app
+
+# ============================================================
+
+if __name__ == "__main__":
+    async_server().run(debug=True)
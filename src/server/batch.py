@@ -0,0 +1,246 @@
+'''
+The timetables of many sets of modules at once - e.g. every student on a tutor's dashboard - for `/batch-module-timetables`
+(see `server.py`).
+
+Students on the same course mostly take the same modules, so rather than getting each set's timetable on its own, the modules
+of every set are put together (each only once) and each module is got once:
+- from the snapshot, if it's in it.
+- otherwise from its own cache entry (`Scraper.get_module_timetable_cache_key([code], "list")`), so that it's shared by every
+batch, and by `clash_matrix.get_clash_matrix`, whichever other modules they ask for.
+- otherwise from upstream, with as many modules as fit in each report's URL (see `Scraper.get_module_batches`), and then cached one by one.
+
+Each set's timetable is then put together from its modules' activities. So the time a batch takes depends on the number of
+different modules in it, not on the number of sets.
+
+Concurrent batches wanting the same module share one request for it (see `InFlight`), rather than each making their own.
+
+```python
+modules = get_module_activities(scraper, get_batch_module_codes(module_sets), in_flight)
+{name: get_set_timetable(modules, module_codes) for name, module_codes in module_sets.items()}
+```
+'''
+
+import json
+import threading
+import concurrent.futures
+
+from cache import MISSING
+from scraper import Scraper, CACHE_TTLS
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# The most reports `get_module_activities_async` requests from upstream at once, for any one batch.
+MAX_CONCURRENT_REPORTS = 4
+
+# ============================================================
+
+class InFlight:
+    '''
+    The modules whose timetables are being got from upstream right now, so that a batch wanting one of them waits for that request
+    rather than making its own.
+
+    A batch `claim`s the modules it's about to request, gets them, and then `finish`es them (with their activities, or the error
+    that stopped it getting them). Anything that wanted them in the meantime gets the same result.
+    '''
+
+    def __init__(self) -> 'None':
+        # module code --> `concurrent.futures.Future` of its activities
+        self.futures = dict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def claim(self, module_codes:'list[str]') -> 'tuple[list[str], dict[str, concurrent.futures.Future]]':
+        '''
+        Returns the module codes of `module_codes` that the caller now has to get (and `finish`), and the futures of the rest
+        (those that something else is already getting).
+        '''
+
+        claimed = []
+        waiting = dict()
+
+        with self.lock:
+            for code in module_codes:
+                if code in self.futures:
+                    waiting[code] = self.futures[code]
+                else:
+                    self.futures[code] = concurrent.futures.Future()
+                    claimed.append(code)
+
+        return claimed, waiting
+
+    # ----------
+
+    def finish(self, module_codes:'list[str]', modules:'dict[str, list[dict]]' = None, error:'BaseException' = None) -> 'None':
+        ''' Gives anything waiting on `module_codes` their activities from `modules` - or `error`, if they couldn't be got. '''
+
+        with self.lock:
+            futures = [(code, self.futures.pop(code)) for code in module_codes if code in self.futures]
+
+        for code, future in futures:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(modules.get(code, []))
+
+# ============================================================
+
+def get_batch_module_codes(module_sets:'dict[str, list[str]]') -> 'list[str]':
+    ''' Every module code in `module_sets` (set name --> module codes), each only once, sorted. '''
+    return sorted({code for module_codes in module_sets.values() for code in module_codes})
+
+# ----------
+
+def get_known_module_activities(scraper:'Scraper', module_codes:'list[str]') -> 'tuple[dict[str, list[dict]], list[str]]':
+    ''' The activities of each of `module_codes` that are in the snapshot or cache (see the top of this file), and the codes of the rest. '''
+
+    modules = dict()
+    unknown = []
+
+    for code in module_codes:
+        if scraper.snapshot_has_modules([code]):
+            modules[code] = scraper.snapshot.get_module_timetable([code], "list")
+            continue
+
+        activities = scraper.cache.get(Scraper.get_module_timetable_cache_key([code], "list"))
+        if activities is MISSING:
+            unknown.append(code)
+        else:
+            modules[code] = activities
+
+    return modules, unknown
+
+# ----------
+
+def claim_modules(scraper:'Scraper', module_codes:'list[str]', in_flight:'InFlight') -> 'tuple[dict[str, list[dict]], list[str], dict[str, concurrent.futures.Future]]':
+    '''
+    The activities of the modules of `module_codes` that are already known (see `get_known_module_activities`), the codes of the rest
+    that the caller has `claim`ed from `in_flight` (and so has to get), and the futures of those that something else is getting.
+    '''
+
+    modules, unknown = get_known_module_activities(scraper, module_codes)
+    claimed, waiting = in_flight.claim(unknown)
+
+    # something else may have got (and cached) some of them between looking in the cache and claiming them
+    cached, claimed = get_known_module_activities(scraper, claimed)
+    in_flight.finish(list(cached), cached)
+    modules.update(cached)
+
+    return modules, claimed, waiting
+
+# ----------
+
+def group_by_module(module_codes:'list[str]', activities:'list[dict]') -> 'dict[str, list[dict]]':
+    ''' module code --> its activities, for each of `module_codes` (those with no activities get an empty `list`). '''
+
+    modules = {code: [] for code in module_codes}
+    for activity in activities:
+        if activity["Module"] in modules:
+            modules[activity["Module"]].append(activity)
+
+    return modules
+
+# ----------
+
+def cache_modules(scraper:'Scraper', modules:'dict[str, list[dict]]') -> 'None':
+    for code, activities in modules.items():
+        scraper.cache.set(Scraper.get_module_timetable_cache_key([code], "list"), activities, CACHE_TTLS["timetable"])
+
+# ----------
+
+def get_module_activities(scraper:'Scraper', module_codes:'list[str]', in_flight:'InFlight') -> 'dict[str, list[dict]]':
+    ''' module code --> its activities, for each of `module_codes`, got as described at the top of this file. '''
+
+    modules, claimed, waiting = claim_modules(scraper, module_codes, in_flight)
+
+    try:
+        for batch in scraper.get_module_batches(claimed):
+            report_style = scraper.report_style
+            url = scraper.get_module_timetable_url(batch, report_style=report_style)
+
+            batch_modules = group_by_module(batch, scraper.get_report_activities(url, report_style, "list"))
+            cache_modules(scraper, batch_modules)
+
+            in_flight.finish(batch, batch_modules)
+            modules.update(batch_modules)
+    except BaseException as error:
+        in_flight.finish(claimed, error=error)
+        raise
+
+    for code, future in waiting.items():
+        modules[code] = future.result()
+
+    return modules
+
+# ----------
+
+async def get_module_activities_async(scraper:'Scraper', module_codes:'list[str]', in_flight:'InFlight', executor:'concurrent.futures.Executor' = None) -> 'dict[str, list[dict]]':
+    '''
+    Awaitable version of `get_module_activities`. Up to `MAX_CONCURRENT_REPORTS` reports are requested at the same time (so that
+    one batch of many modules doesn't send every request upstream at once), and they're parsed in `executor` (see `Scraper.get_module_timetable_async`).
+    '''
+
+    import asyncio
+
+    modules, claimed, waiting = claim_modules(scraper, module_codes, in_flight)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REPORTS)
+
+    async def get_batch(batch:'list[str]') -> 'dict[str, list[dict]]':
+        report_style = scraper.report_style
+        url = scraper.get_module_timetable_url(batch, report_style=report_style)
+
+        async with semaphore:
+            activities = await scraper.get_report_activities_async(url, report_style, "list", executor)
+
+        batch_modules = group_by_module(batch, activities)
+        cache_modules(scraper, batch_modules)
+
+        in_flight.finish(batch, batch_modules)
+        return batch_modules
+
+    try:
+        for batch_modules in await asyncio.gather(*[get_batch(batch) for batch in scraper.get_module_batches(claimed)]):
+            modules.update(batch_modules)
+    except BaseException as error:
+        in_flight.finish(claimed, error=error)
+        raise
+
+    for code, future in waiting.items():
+        modules[code] = await asyncio.wrap_future(future)
+
+    return modules
+
+# ============================================================
+
+def get_set_timetable(modules:'dict[str, list[dict]]', module_codes:'list[str]', window:'tuple[datetime.date, datetime.date]' = None) -> 'dict[list[dict]]':
+    '''
+    The timetable of one set of modules, as returned by `Scraper.get_module_timetable(module_codes)` (or `Scraper.get_module_timetable_window`
+    if `window` - a start and end date - is given), from `modules` (see `get_module_activities`).
+    '''
+
+    activities = [activity for code in dict.fromkeys(module_codes) for activity in modules.get(code, [])]
+    activities.sort(key = lambda activity: activity["Start"])
+
+    if window is not None:
+        activities = Scraper.slice_module_timetable(activities, *window)
+
+    timetable = {day: [] for day in DAYS_OF_THE_WEEK}
+    for activity in activities:
+        timetable[activity["Day Of The Week"]].append(activity)
+
+    return timetable
+
+# ----------
+
+def iter_ndjson(modules:'dict[str, list[dict]]', module_sets:'dict[str, list[str]]', window:'tuple[datetime.date, datetime.date]' = None) -> 'typing.Iterator[str]':
+    '''
+    One line of JSON per set - `{"Name": ..., "Timetable": ...}` - so that a client can parse (and show) each set as it's read,
+    rather than only once the whole response has been.
+
+    NB: the lines are made from `modules`, so nothing is sent until every module of every set has been got - this saves the
+    client from holding the whole response, but it doesn't make the first set arrive any sooner.
+    '''
+    for name, module_codes in module_sets.items():
+        yield json.dumps({"Name": name, "Timetable": get_set_timetable(modules, module_codes, window)}) + "\n"
@@ -0,0 +1,57 @@
+'''
+Lets the benchmarks run offline: `FixtureScraper` answers every request from the recorded pages in `fixtures/`.
+
+If `fixtures/` is empty, generate stand-ins with `python make_fixtures.py` (or record the real pages with `record_fixtures.py`).
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import Scraper
+from module_calendar import ModuleCalendar
+from cache import MemoryCache
+from fixture_pages import get_fixture_name, read_fixture, read_building_location_urls
+
+# ============================================================
+
+class FixtureScraper(Scraper):
+    ''' A `Scraper` whose requests are answered from `fixtures/` rather than the network. '''
+
+    def __init__(self, cache:'CacheBackend' = None) -> 'None':
+        super().__init__("fixture", "fixture", cache)
+
+    def handle_request(self, base_url:'str') -> 'str':
+        return read_fixture(get_fixture_name(base_url))
+
+    def get_week_patterns_page_source(self) -> 'str':
+        return read_fixture("week_patterns.htm")
+
+# ============================================================
+
+@pytest.fixture
+def scraper() -> 'FixtureScraper':
+    ''' A `FixtureScraper` with an empty cache, so that every call actually parses its page. '''
+    return FixtureScraper(MemoryCache())
+
+# ----------
+
+@pytest.fixture
+def module_calendar(monkeypatch:'pytest.MonkeyPatch', tmp_path:'pathlib.Path') -> 'ModuleCalendar':
+    '''
+    A `ModuleCalendar` using a `FixtureScraper`.
+
+    `Scraper.get_building_locations_urls` makes a request per building to unshorten their URLs (which can't be recorded as a page),
+    so its result is put straight into the cache. The `.ics` file is written to a temporary directory.
+    '''
+
+    module_calendar = ModuleCalendar("fixture", "fixture")
+    module_calendar.scraper = FixtureScraper(MemoryCache())
+    module_calendar.scraper.cache.set("building location urls", read_building_location_urls())
+
+    monkeypatch.chdir(tmp_path)
+
+    return module_calendar
@@ -0,0 +1,87 @@
+'''
+The recorded pages in `fixtures/`, and which upstream URL each of them stands in for.
+
+- `module.htm` --> https://timetable.dur.ac.uk/module.htm
+- `{style}_{size}.htm` --> the `/reporting/{style}` report of the modules in `REPORTS[size]`, for each style in `scraper.REPORT_STYLE_PARSERS`
+  (e.g. `textspreadsheet_small.htm`)
+- `facilities.htm` --> https://www.dur.ac.uk/cis/local/facilities/location/?location_id=1
+- `dates.htm` --> https://www.dur.ac.uk/dates/
+- `week_patterns.htm` --> https://timetable.dur.ac.uk/week_patterns.htm, once it's been rendered
+- `home.htm` --> https://timetable.dur.ac.uk
+- `building_location_urls.json` --> what `Scraper.get_building_locations_urls` returns (its URLs are unshortened with one request per building)
+
+`record_fixtures.py` records them from the live sites. `make_fixtures.py` generates synthetic stand-ins with the same structure.
+'''
+
+import os
+import json
+from urllib.parse import urlsplit, unquote
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# The module codes in each textspreadsheet report.
+REPORTS = {
+    "small": ["COMP2221"],
+    "medium": ["COMP2181", "COMP2211", "COMP2221", "COMP2261", "COMP2271", "COMP2281"],
+    "large": [
+        "COMP2181", "COMP2211", "COMP2221", "COMP2261", "COMP2271", "COMP2281", "COMP3012", "COMP3421",
+        "COMP3467", "COMP3477", "COMP3487", "COMP3491", "COMP3507", "COMP3517", "COMP3527", "COMP3537",
+        "COMP3547", "COMP3557", "COMP3567", "COMP3577", "COMP3587", "COMP3591", "COMP3607", "COMP3617",
+        "COMP3621", "COMP3647", "COMP3657", "COMP3986", "COMP3996", "MATH2011", "MATH2031", "MATH2041",
+        "MATH2051", "MATH2071", "MATH2581", "MATH2617", "MATH2627", "MATH2637", "MATH2647", "MATH2657",
+    ],
+}
+
+# URL path --> fixture file name. Reports are handled separately in `get_fixture_name`, since they depend on the modules.
+PAGES = {
+    "/module.htm": "module.htm",
+    "/cis/local/facilities/location/": "facilities.htm",
+    "/dates/": "dates.htm",
+    "/week_patterns.htm": "week_patterns.htm",
+    "/": "home.htm",
+    "": "home.htm",
+}
+
+# ============================================================
+
+def get_report_style(url:'str') -> 'str':
+    ''' e.g. `"textspreadsheet"` from `".../reporting/textspreadsheet;module;name;COMP2221%0D%0A?days=..."` '''
+    return urlsplit(url).path.split("/reporting/")[1].split(";")[0]
+
+# ----------
+
+def get_report_module_codes(url:'str') -> 'list[str]':
+    ''' e.g. `["COMP2221", "COMP2261"]` from `".../reporting/textspreadsheet;module;name;COMP2221%0D%0ACOMP2261%0D%0A?days=..."` '''
+    objectstr = unquote(urlsplit(url).path).split(";")[-1]
+    return [code for code in objectstr.split("\r\n") if code]
+
+# ----------
+
+def get_fixture_name(url:'str') -> 'str':
+    '''
+    Returns the name of the file in `fixtures/` that stands in for `url`.
+
+    Raises `KeyError` if there isn't one (including for a report of modules that aren't one of `REPORTS`).
+    '''
+
+    path = urlsplit(url).path
+
+    if path.startswith("/reporting/"):
+        module_codes = get_report_module_codes(url)
+        for size, report_module_codes in REPORTS.items():
+            if module_codes == report_module_codes:
+                return f"{get_report_style(url)}_{size}.htm"
+        raise KeyError(f"No recorded report for {module_codes}")
+
+    return PAGES[path]
+
+# ----------
+
+def read_fixture(name:'str') -> 'str':
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+# ----------
+
+def read_building_location_urls() -> 'dict[str, str]':
+    return json.loads(read_fixture("building_location_urls.json"))
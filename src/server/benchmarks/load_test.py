@@ -0,0 +1,220 @@
+'''
+A load generator for the servers. It replays a realistic mix of student module sets against the routes, and reports the throughput
+and the p50/p99 latency of each route.
+
+Start the upstream stand-in (`stub_upstream.py`) and a server pointing at it (see the top of `stub_upstream.py`), and then e.g.
+
+```
+python load_test.py --url http://127.0.0.1:5000 --concurrency 32 --duration 60
+```
+
+The module sets come from a fixed population of `--students` students. Each student takes 4-7 modules from one department
+at one level (the popular modules in a department being more likely), and some take an elective from another department.
+Students are picked at random for each request, so - as in term time - the same module sets come up again and again.
+
+NB: the servers have no ICS route, so ICS builds are only covered by the offline benchmarks in `test_benchmarks.py`.
+'''
+
+import json
+import time
+import random
+import argparse
+import threading
+import collections
+
+import requests
+
+from make_fixtures import MODULE_PARAMETERS_PATH
+
+# route name --> the fraction of requests that go to it
+ROUTE_MIX = {
+    "timetables": 0.7,        # POST /get-module-timetables
+    "timetables-window": 0.2, # POST /get-module-timetables?from=...&to=... (a week, as the calendar does)
+    "names": 0.1,             # GET /get-module-names
+}
+
+# ============================================================
+
+def make_students(number_of_students:'int', rnd:'random.Random') -> 'list[list[str]]':
+    ''' Returns the module set of each of `number_of_students` students. See the top of this file. '''
+
+    with open(MODULE_PARAMETERS_PATH) as f:
+        module_codes = [code for _, code in json.load(f)["Select Module(s) to View:"]]
+
+    # (department, level) --> module codes. e.g. ("COMP", "2") --> ["COMP2181", "COMP2211", ...]
+    # only undergraduate levels 1-3 are included
+    groups = collections.defaultdict(list)
+    for code in module_codes:
+        if code[4:5] in ["1", "2", "3"]:
+            groups[(code[:4], code[4])].append(code)
+
+    # departments with more modules have more students
+    keys = [key for key in groups if len(groups[key]) >= 4]
+    key_weights = [len(groups[key]) for key in keys]
+
+    students = []
+    for _ in range(number_of_students):
+        department, level = rnd.choices(keys, weights=key_weights)[0]
+        group = groups[(department, level)]
+
+        # earlier modules in the group are more popular (Zipf-like), so students in a department overlap a lot
+        weights = [1 / (rank + 1) for rank in range(len(group))]
+        number_of_modules = min(len(group), rnd.randint(4, 7))
+
+        modules = set()
+        while len(modules) < number_of_modules:
+            modules.add(rnd.choices(group, weights=weights)[0])
+
+        # an elective from another department at the same level
+        if rnd.random() < 0.3:
+            other_key = rnd.choice([key for key in keys if key[1] == level])
+            modules.add(rnd.choice(groups[other_key]))
+
+        students.append(sorted(modules))
+
+    return students
+
+# ----------
+
+def percentile(sorted_values:'list[float]', fraction:'float') -> 'float':
+    ''' The nearest-rank percentile of `sorted_values`. '''
+    if len(sorted_values) == 0:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+# ============================================================
+
+class LoadTest:
+    '''
+    Sends requests to the server at `base_url` from `concurrency` threads until `duration` seconds have passed
+    (or `max_requests` requests have been sent), recording how long each one took.
+    '''
+
+    def __init__(self, base_url:'str', students:'list[list[str]]', concurrency:'int', duration:'float', max_requests:'int' = None, accept:'str' = None, seed:'int' = None) -> 'None':
+        self.base_url = base_url.rstrip("/")
+        self.students = students
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.accept = accept
+        self.seed = seed
+
+        # route name --> latencies (in seconds) of the requests that succeeded
+        self.latencies = collections.defaultdict(list)
+        # route name --> number of failed requests (a status code of 400 or above, or no response at all)
+        self.errors = collections.Counter()
+        self.lock = threading.Lock()
+
+        self.requests_sent = 0
+
+    # ----------
+
+    def send_request(self, session:'requests.Session', route:'str', rnd:'random.Random') -> 'requests.Response':
+        headers = {"Accept": self.accept} if self.accept else {}
+
+        if route == "names":
+            return session.get(self.base_url + "/get-module-names", headers=headers, timeout=120)
+
+        module_codes = rnd.choice(self.students)
+        params = dict()
+        if route == "timetables-window":
+            week = rnd.randint(12, 35)
+            params = {"from": week, "to": week}
+
+        return session.post(self.base_url + "/get-module-timetables", json=module_codes, params=params, headers=headers, timeout=120)
+
+    # ----------
+
+    def worker(self, worker_number:'int', deadline:'float') -> 'None':
+        session = requests.Session()
+        rnd = random.Random(None if (self.seed is None) else self.seed + worker_number)
+
+        routes = list(ROUTE_MIX.keys())
+        weights = list(ROUTE_MIX.values())
+
+        while time.perf_counter() < deadline:
+
+            with self.lock:
+                if (self.max_requests is not None) and (self.requests_sent >= self.max_requests):
+                    return
+                self.requests_sent += 1
+
+            route = rnd.choices(routes, weights=weights)[0]
+
+            start = time.perf_counter()
+            try:
+                response = self.send_request(session, route, rnd)
+                ok = response.ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                if ok:
+                    self.latencies[route].append(elapsed)
+                else:
+                    self.errors[route] += 1
+
+    # ----------
+
+    def run(self) -> 'float':
+        ''' Runs the load test, and returns how long it took. '''
+
+        start = time.perf_counter()
+        deadline = start + self.duration
+
+        threads = [threading.Thread(target=self.worker, args=(n, deadline)) for n in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return time.perf_counter() - start
+
+    # ----------
+
+    def report(self, elapsed:'float') -> 'str':
+        ''' A table of the number of requests, errors, throughput and latencies of each route (and all of them together). '''
+
+        lines = [f"{'route':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+
+        def line(name:'str', latencies:'list[float]', errors:'int') -> 'str':
+            latencies = sorted(latencies)
+            count = len(latencies) + errors
+            return (
+                f"{name:<20}{count:>10}{errors:>8}{count / elapsed:>10.1f}"
+                f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{(latencies[-1] if latencies else float('nan')) * 1000:>10.1f}"
+            )
+
+        for route in ROUTE_MIX:
+            lines.append(line(route, self.latencies[route], self.errors[route]))
+
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        lines.append(line("all", all_latencies, sum(self.errors.values())))
+
+        return "\n".join(lines)
+
+# ============================================================
+
+def main() -> 'None':
+    parser = argparse.ArgumentParser(description="Replays student module sets against the server and reports throughput and latency.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="the server to test")
+    parser.add_argument("--concurrency", type=int, default=16, help="the number of requests in flight at once")
+    parser.add_argument("--duration", type=float, default=30, help="how long to run for, in seconds")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests (even if --duration hasn't passed)")
+    parser.add_argument("--students", type=int, default=1000, help="the number of distinct students (module sets)")
+    parser.add_argument("--accept", default=None, help="the Accept header to send, e.g. application/vnd.timetable.columnar+json")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    students = make_students(args.students, random.Random(args.seed))
+
+    load_test = LoadTest(args.url, students, args.concurrency, args.duration, args.requests, args.accept, args.seed)
+    elapsed = load_test.run()
+
+    print(f"{load_test.requests_sent} requests in {elapsed:.1f}s from {args.concurrency} concurrent clients")
+    print(load_test.report(elapsed))
+
+if __name__ == "__main__":
+    main()
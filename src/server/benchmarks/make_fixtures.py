@@ -0,0 +1,354 @@
+'''
+Generates synthetic stand-ins for the pages in `fixtures/` (see `fixture_pages.py`), for when they can't be recorded with `record_fixtures.py`.
+
+The pages have the same structure as the real ones - as far as the parsing in `scraper.py` is concerned, they're the same - and
+the generation is seeded, so running this again gives exactly the same files.
+
+```
+python make_fixtures.py
+```
+'''
+
+import os
+import sys
+import json
+import random
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import WEEK_PATTERNS
+from fixture_pages import FIXTURES_DIR, REPORTS
+
+SEED = 2022
+
+# A copy of what `Scraper.get_module_timetable_url_parameters` returned, which module.htm is rebuilt from.
+MODULE_PARAMETERS_PATH = os.path.join(os.path.dirname(FIXTURES_DIR), "..", "json-files", "moduleTimetableURLParameters.json")
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+# The columns of the textspreadsheet report.
+ATTRIBUTES = ["Activity", "Description", "Module", "Start", "End", "Duration", "Room", "Staff", "Weeks", "Planned Size"]
+
+# The "Weeks" of activities, as they appear in the report.
+WEEKS = ["12-21", "26-35", "12-21, 26-35", "13, 15, 17, 19, 21", "12-21, 26-35, 41-42", "41-42", "12-16", "27, 29, 31, 33, 35"]
+
+# (activity type, duration in hours)
+ACTIVITY_TYPES = [("LEC", 1), ("LEC", 1), ("PRAC", 2), ("WKSH", 1), ("SEM", 1), ("TUT", 1)]
+
+ROOMS = ["D/CM101", "D/CM105", "D/CG91", "D/E005", "D/ER141", "D/MCS0001", "D/MCS2052", "D/PH8", "D/TLC042", "D/W103", "D/CLC013", "\xa0"]
+
+STAFF = ["Smith, Jane", "Jones, Kim", "Brown, Sam", "Taylor, Alex", "Wilson, Chris", "Evans, Jo", "Khan, Amir", "Lee, Robin"]
+
+BUILDING_CODES = {
+    "Biological and Biomedical Sciences": "BL",
+    "Business School": "BUSC",
+    "Chemistry (inc. Courtyard)": "CG",
+    "38-39 North Bailey (Classics)": "CL",
+    "Calman Learning Centre": "CLC",
+    "Computing and Maths": "CM",
+    "Dawson": "D",
+    "Engineering": "E",
+    "School of Education": "ED",
+    "Burdon House": "EDBU",
+    "Caedmon Building - School of Education": "EDCA",
+    "Hild Bede": "EDU",
+    "Elvet Hill House": "EH",
+    "Elvet Riverside 1": "ER1, ERA",
+    "Elvet Riverside 2": "ER2",
+    "E-Science": "ES",
+    "Dunelm House": "FONTEYN",
+    "Grey College Holgate House": "GRYHOLG",
+    "43 North Bailey (History)": "HS",
+    "Mountjoy Centre": "Hawthorn",
+    "Al-Qasimi": "IM",
+    "Psychology": "L",
+    "Maths & Computer Science": "MCS",
+    "Divinity House (Music)": "MU",
+    "Old Elvet (Sociology)": "OE",
+    "Palatine Centre": "PC",
+    "Physics": "PH",
+    "48 Old Elvet": "PO",
+    "Rowan House": "RH, Rowan",
+    "Southend House": "SE",
+    "Abbey House (Theology)": "TH",
+    "Teaching and Learning Centre": "TLC",
+    "West (Geography)": "W",
+}
+
+# The names of the Google Maps links on the facilities page (the keys of `mappings` in `Scraper.get_building_locations_urls`).
+FACILITY_LINK_NAMES = [
+    "38-39 Old Bailey (Classics)", "43 Old Bailey (History)", "48 Old Elvet", "Abbey House (Theology)", "Al-Qasimi Building",
+    "Biological Sciences", "Burdon House", "Business School", "Caedmon Building", "Calman Learning Centre", "Chemistry",
+    "Computing/Maths", "Courtyard Building", "Dawson Building", "Dunelm House (Student Union)", "E-Sciences", "Elvet Hill House",
+    "Elvet Riverside 2", "Elvet Riverside1", "Engineering", "Greys College - Holgate", "Hild Bede College", "Mountjoy Centre",
+    "Mountjoy Centre - Rowan House", "Palatine Centre", "Physics", "Psychology", "School of Education", "Southend House",
+    "Teaching and Learning Centre", "West Building (Geography)",
+]
+
+# ============================================================
+
+def make_module_htm() -> 'str':
+    ''' The form on module.htm, with the options from `json-files/moduleTimetableURLParameters.json`. '''
+
+    with open(MODULE_PARAMETERS_PATH) as f:
+        params = json.load(f)
+
+    rows = []
+    for option_type, options in params.items():
+        option_tags = "".join([f'<option value="{value}">{text}</option>' for text, value in options])
+        rows.append(f'<tr><td>{option_type}</td><td><select name="{option_type}">{option_tags}</select></td></tr>')
+
+    return "<html><body><form><table>\n" + "\n".join(rows) + "\n</table></form></body></html>\n"
+
+# ----------
+
+def make_activities(module_codes:'list[str]', module_names:'dict[str, str]', rnd:'random.Random') -> 'dict[str, dict[str, list[list[str]]]]':
+    '''
+    Makes up the activities of `module_codes`.
+
+    Returns module code --> day of the week --> activities, where each activity is the values of its row in the textspreadsheet report
+    (see `ATTRIBUTES`).
+    '''
+
+    activities = dict()
+
+    for code in module_codes:
+        name = module_names.get(code, code)
+        activities[code] = dict()
+
+        counters = dict()
+        for day in DAYS_OF_THE_WEEK:
+
+            number_of_activities = rnd.choice([0, 1, 1, 2, 2, 3])
+            if number_of_activities == 0:
+                continue
+
+            activities[code][day] = []
+
+            for _ in range(number_of_activities):
+                activity_type, duration = rnd.choice(ACTIVITY_TYPES)
+                counters[activity_type] = counters.get(activity_type, 0) + 1
+
+                start = rnd.randint(9, 17 - duration)
+                # the report's end times are 15 minutes early - see `Scraper.parse_module_timetable`
+                end = f"{start + duration - 1}:45"
+                staff = ", ".join(rnd.sample(STAFF, rnd.choice([0, 1, 1, 2]))) or "\xa0"
+
+                activities[code][day].append([
+                    f"{code}/{activity_type}/{counters[activity_type]:03d}", name, code,
+                    f"{start}:00", end, f"{duration}:00", rnd.choice(ROOMS), staff, rnd.choice(WEEKS), str(rnd.randint(10, 250)),
+                ])
+
+    return activities
+
+# ----------
+
+def module_header(code:'str', name:'str') -> 'str':
+    return f"<table class='header-border-args'><tr><td>Module: {code} - {name}\tDept: Computer Science\tWeeks: 1-52 (18 Jul 2022, 16 Jul 2023)</td></tr></table>"
+
+# ----------
+
+def render_textspreadsheet(activities:'dict[str, dict[str, list[list[str]]]]', module_names:'dict[str, str]') -> 'str':
+    ''' The "List" (textspreadsheet) report of `activities`: for each module, a header <table>, then a day <p> and activity <table> for each day with activities. '''
+
+    out = ["<html><head><title>Module Timetable</title></head><body>"]
+
+    for code, days in activities.items():
+        out.append(module_header(code, module_names.get(code, code)))
+
+        for day, rows in days.items():
+            out.append(f"<p><span class='labelone'>{day}</span></p>")
+            out.append("<table class='spreadsheet' border='1' cellspacing='0' cellpadding='3'>")
+            out.append("<tr class='columnTitles'>" + "".join([f"<td>{attribute}</td>" for attribute in ATTRIBUTES]) + "</tr>")
+
+            for values in rows:
+                out.append("<tr>" + "".join([f"<td>{value}</td>" for value in values]) + "</tr>")
+
+            out.append("</table>")
+
+    out.append("</body></html>")
+    return "\n".join(out) + "\n"
+
+# ----------
+
+def render_grid(activities:'dict[str, dict[str, list[list[str]]]]', module_names:'dict[str, str]') -> 'str':
+    '''
+    The "Grid (Individual)" report of `activities`: for each module, a header <table>, then a grid with a column per 15-minute period
+    from 08:00 to 22:00 and a row per day (or more, when a day's activities overlap). See `Scraper.parse_module_timetable_grid`.
+    '''
+
+    NUMBER_OF_PERIODS = 56
+
+    # the period (counting from 0 at 08:00) that a "9:00"-style time is in
+    to_period = lambda time: (int(time.split(":")[0]) - 8) * 4 + int(time.split(":")[1]) // 15
+
+    out = ["<html><head><title>Module Timetable</title></head><body>"]
+
+    for code, days in activities.items():
+        out.append(module_header(code, module_names.get(code, code)))
+
+        out.append("<table class='grid-border-args' border='1' cellspacing='0'>")
+        out.append("<tr><td class='col-label-one'></td>" + "".join([f"<td class='col-label-one' colspan='4'>{hour:02d}:00</td>" for hour in range(8, 22)]) + "</tr>")
+
+        for day, rows in days.items():
+
+            # each activity goes in the first row where it doesn't overlap anything
+            lanes = []
+            for values in sorted(rows, key=lambda values: to_period(values[ATTRIBUTES.index("Start")])):
+                first = to_period(values[ATTRIBUTES.index("Start")])
+                last = to_period(values[ATTRIBUTES.index("End")])
+                lane = next((lane for lane in lanes if lane[-1][1] < first), None)
+                if lane is None:
+                    lane = []
+                    lanes.append(lane)
+                lane.append((first, last, values))
+
+            for lane_number, lane in enumerate(lanes):
+                cells = []
+                if lane_number == 0:
+                    cells.append(f"<td class='row-label-one' rowspan='{len(lanes)}'>{day[:3]}</td>")
+
+                period = 0
+                for first, last, values in lane:
+                    cells += ["<td class='cell-border'></td>"] * (first - period)
+
+                    activity, description, module, _, _, _, room, staff, weeks, planned_size = values
+                    cells.append(
+                        f"<td class='object-cell-border' colspan='{last - first + 1}'>"
+                        f"<table class='object-cell-args'><tr><td>{activity}</td><td>{module}</td></tr></table>"
+                        f"<table class='object-cell-args'><tr><td>{description}</td></tr></table>"
+                        f"<table class='object-cell-args'><tr><td>{room}</td><td>{staff}</td></tr></table>"
+                        f"<table class='object-cell-args'><tr><td>{weeks}</td><td>{planned_size}</td></tr></table>"
+                        "</td>"
+                    )
+                    period = last + 1
+
+                cells += ["<td class='cell-border'></td>"] * (NUMBER_OF_PERIODS - period)
+                out.append("<tr>" + "".join(cells) + "</tr>")
+
+        out.append("</table>")
+
+    out.append("</body></html>")
+    return "\n".join(out) + "\n"
+
+# ----------
+
+def make_textspreadsheet(module_codes:'list[str]', module_names:'dict[str, str]', rnd:'random.Random') -> 'str':
+    ''' A textspreadsheet report of made-up activities of `module_codes`. '''
+    return render_textspreadsheet(make_activities(module_codes, module_names, rnd), module_names)
+
+# ----------
+
+def make_grid(module_codes:'list[str]', module_names:'dict[str, str]', rnd:'random.Random') -> 'str':
+    ''' A grid report of made-up activities of `module_codes`. Given the same `rnd`, they're the same activities as `make_textspreadsheet`'s. '''
+    return render_grid(make_activities(module_codes, module_names, rnd), module_names)
+
+# ----------
+
+def make_facilities_htm(rnd:'random.Random') -> 'tuple[str, dict[str, str]]':
+    '''
+    The facilities page (with the building codes table and the sidebar of Google Maps links), and what
+    `Scraper.get_building_locations_urls` returns for it.
+    '''
+
+    rows = "".join([f"<tr><td><strong>{codes}</strong></td><td>{name}</td></tr>" for name, codes in BUILDING_CODES.items()])
+    links = "".join([f'<li><a href="https://goo.gl/maps/{rnd.getrandbits(64):016x}">{name}</a></li>' for name in FACILITY_LINK_NAMES])
+
+    page = "\n".join([
+        "<html><body>",
+        f'<div id="content263136"><table><tr><th>Code</th><th>Building</th></tr>{rows}</table></div>',
+        f'<div id="content257296"><ul>{links}</ul></div>',
+        "</body></html>",
+    ]) + "\n"
+
+    # the unshortened urls, which have the latitude and longitude in them
+    building_location_urls = dict()
+    for name in BUILDING_CODES:
+        latitude = 54.76 + rnd.random() / 100
+        longitude = -1.58 + rnd.random() / 100
+        building_location_urls[name] = f"https://www.google.com/maps/place/{name.replace(' ', '+')}/@{latitude:.7f},{longitude:.7f},17z"
+
+    return page, building_location_urls
+
+# ----------
+
+def make_dates_htm() -> 'str':
+    ''' The university's term dates page, with a table for this academic year and the next. '''
+
+    format_date = lambda date: f"{date.day} {date.strftime('%B %Y')}"
+
+    divs = []
+    for year in [2022, 2023]:
+        terms = [
+            ("Michaelmas", datetime.date(year, 10, 3), datetime.date(year, 12, 9)),
+            ("Epiphany", datetime.date(year+1, 1, 9), datetime.date(year+1, 3, 17)),
+            ("Easter", datetime.date(year+1, 4, 24), datetime.date(year+1, 6, 16)),
+        ]
+        rows = "".join([f"<tr><td>{term}</td><td>{format_date(start)}</td><td>{format_date(end)}</td></tr>" for term, start, end in terms])
+        divs.append(f'<div id="year{year}"><h2>{year}-{str(year+1)[2:]}</h2><table><tr><th>Term</th><th>Start</th><th>End</th></tr>{rows}</table></div>')
+
+    return "<html><body>\n" + "\n".join(divs) + "\n</body></html>\n"
+
+# ----------
+
+def make_week_patterns_htm() -> 'str':
+    ''' The rendered week patterns page, from `WEEK_PATTERNS`. '''
+
+    format_date = lambda date: date.strftime("%a %d %b")
+
+    rows = []
+    for week_number, pattern in WEEK_PATTERNS.items():
+        monday, friday = pattern["Calendar Date"]
+        calendar_date = f"{format_date(monday)} - {format_date(friday)}"
+        rows.append(f"<tr><td>Week {week_number}</td><td>{calendar_date}</td><td>{pattern['Term']}</td><td>{pattern['Teaching Week']}</td></tr>")
+
+    return "\n".join([
+        "<html><body>",
+        '<div class="l2sitename">2022-23 Teaching Timetable</div>',
+        "<table>",
+        "<tr><th colspan='2'>Syllabus Weeks</th><th colspan='2'>Durham Weeks</th></tr>",
+        "<tr><th>Week Number</th><th>Calendar Date</th><th>Term</th><th>Teaching Week</th></tr>",
+        *rows,
+        "</table>",
+        "</body></html>",
+    ]) + "\n"
+
+# ----------
+
+def make_home_htm() -> 'str':
+    return '<html><body><div class="l2sitename">2022-23 Teaching Timetable</div></body></html>\n'
+
+# ============================================================
+
+def main() -> 'None':
+    rnd = random.Random(SEED)
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    def write(name:'str', contents:'str') -> 'None':
+        with open(os.path.join(FIXTURES_DIR, name), "w", encoding="utf-8") as f:
+            f.write(contents)
+
+    module_htm = make_module_htm()
+    write("module.htm", module_htm)
+
+    # e.g. "COMP2221" --> "Programming Paradigms"
+    with open(MODULE_PARAMETERS_PATH) as f:
+        module_names = {code: text.split(" - ", 1)[1] for text, code in json.load(f)["Select Module(s) to View:"]}
+
+    for size, module_codes in REPORTS.items():
+        activities = make_activities(module_codes, module_names, rnd)
+        write(f"textspreadsheet_{size}.htm", render_textspreadsheet(activities, module_names))
+        write(f"individual_{size}.htm", render_grid(activities, module_names))
+
+    facilities_htm, building_location_urls = make_facilities_htm(rnd)
+    write("facilities.htm", facilities_htm)
+    write("building_location_urls.json", json.dumps(building_location_urls, indent=4) + "\n")
+
+    write("dates.htm", make_dates_htm())
+    write("week_patterns.htm", make_week_patterns_htm())
+    write("home.htm", make_home_htm())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+'''
+Records the pages in `fixtures/` (see `fixture_pages.py`) from the live sites, replacing whatever's there.
+
+Needs valid CIS credentials in `../../.env` (as for the servers), network access, and `chromedriver` for the week patterns page.
+Run it from `src/server/`, as the paths in `scraper.py` are relative to there:
+
+```
+python benchmarks/record_fixtures.py
+```
+'''
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from env import load_environment_variables, auth
+from scraper import Scraper, REPORT_STYLE_PARSERS
+from fixture_pages import FIXTURES_DIR, REPORTS
+
+# URL --> fixture file name, for the pages which are fetched with `requests`.
+URLS = {
+    "https://timetable.dur.ac.uk/module.htm": "module.htm",
+    "https://www.dur.ac.uk/cis/local/facilities/location/?location_id=1": "facilities.htm",
+    "https://www.dur.ac.uk/dates/": "dates.htm",
+    "https://timetable.dur.ac.uk": "home.htm",
+}
+
+# ============================================================
+
+def main() -> 'None':
+    load_environment_variables()
+    scraper = Scraper(*auth())
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    def write(name:'str', contents:'str') -> 'None':
+        with open(os.path.join(FIXTURES_DIR, name), "w", encoding="utf-8") as f:
+            f.write(contents)
+        print("Recorded", name)
+
+    for url, name in URLS.items():
+        write(name, scraper.handle_request(url))
+
+    for size, module_codes in REPORTS.items():
+        for report_style in REPORT_STYLE_PARSERS:
+            write(f"{report_style}_{size}.htm", scraper.handle_request(scraper.get_module_timetable_url(module_codes, report_style=report_style)))
+
+    write("week_patterns.htm", scraper.get_week_patterns_page_source())
+
+    write("building_location_urls.json", json.dumps(scraper.get_building_locations_urls(), indent=4) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+'''
+A local stand-in for timetable.dur.ac.uk and www.dur.ac.uk, so that the servers can be load tested without hammering the real sites.
+
+It replays the pages in `fixtures/` (see `fixture_pages.py`). Reports of modules other than the ones in `fixture_pages.REPORTS` are
+generated on the fly by `make_fixtures.make_textspreadsheet` (or `make_fixtures.make_grid`), so any module set can be asked for.
+
+```
+python stub_upstream.py --port 8081 --latency-ms 300 --jitter-ms 100 --error-rate 0.01
+```
+
+and then start a server pointing at it:
+
+```
+APP_TIMETABLE_BASE_URL=http://127.0.0.1:8081 APP_UNIVERSITY_BASE_URL=http://127.0.0.1:8081 python server.py
+```
+
+(or add `APP_TIMETABLE_BASE_URL = http://127.0.0.1:8081` and `APP_UNIVERSITY_BASE_URL = http://127.0.0.1:8081` to `.env`).
+
+NB: the Google Maps links on the facilities page are rewritten to point at the stub (which answers them straight away),
+as `Scraper.get_building_locations_urls` requests every one of them.
+'''
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from fixture_pages import PAGES, REPORTS, get_report_style, get_report_module_codes, read_fixture
+from make_fixtures import MODULE_PARAMETERS_PATH, make_textspreadsheet, make_grid
+
+# ============================================================
+
+class StubUpstream:
+    '''
+    Answers requests for the upstream pages.
+
+    ---
+
+    ### Parameters:
+    - `base_url` (required) --> the URL the stub is served at, e.g. `"http://127.0.0.1:8081"`.
+    - `latency_ms` (optional) --> how long to wait before answering each request.
+    - `jitter_ms` (optional) --> a random amount of up to this much is added to (or taken from) `latency_ms`.
+    - `error_rate` (optional) --> the fraction of requests that are answered with a 503 instead.
+    - `seed` (optional) --> seeds the latency and error injection, so that a run can be repeated.
+    '''
+
+    def __init__(self, base_url:'str', latency_ms:'float' = 0, jitter_ms:'float' = 0, error_rate:'float' = 0, seed:'int' = None) -> 'None':
+        self.base_url = base_url.rstrip("/")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+        with open(MODULE_PARAMETERS_PATH) as f:
+            self.module_names = {code: text.split(" - ", 1)[1] for text, code in json.load(f)["Select Module(s) to View:"]}
+
+        # the facilities page, with its Google Maps links pointing at the stub
+        self.facilities_htm = read_fixture("facilities.htm").replace("https://goo.gl/maps/", self.base_url + "/maps/")
+
+    # ----------
+
+    def get_response(self, url:'str') -> 'tuple[int, str]':
+        ''' Returns the status code and body that `url` is answered with (after the injected latency). '''
+
+        with self.random_lock:
+            delay_ms = max(0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+            is_error = self.random.random() < self.error_rate
+
+        time.sleep(delay_ms / 1000)
+
+        if is_error:
+            return 503, "Service Unavailable"
+
+        path = urlsplit(url).path
+
+        if path.startswith("/reporting/"):
+            report_style = get_report_style(url)
+            module_codes = get_report_module_codes(url)
+            for size, report_module_codes in REPORTS.items():
+                if module_codes == report_module_codes:
+                    return 200, read_fixture(f"{report_style}_{size}.htm")
+
+            # seeded by the modules, so that the same modules always get the same timetable (whatever the style)
+            make_report = make_grid if (report_style == "individual") else make_textspreadsheet
+            return 200, make_report(module_codes, self.module_names, random.Random(",".join(module_codes)))
+
+        if path == "/cis/local/facilities/location/":
+            return 200, self.facilities_htm
+
+        if path in PAGES:
+            return 200, read_fixture(PAGES[path])
+
+        # see `Scraper.user_credentials_are_valid` and `Scraper.get_building_locations_urls`
+        if path == "/directory/password/" or path.startswith("/maps/"):
+            return 200, "OK"
+
+        return 404, "Not Found"
+
+# ============================================================
+
+def make_handler(stub:'StubUpstream') -> 'type[BaseHTTPRequestHandler]':
+
+    class Handler(BaseHTTPRequestHandler):
+
+        # keep-alive, as `requests.Session` would use
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> 'None':
+            status, body = stub.get_response(self.path)
+            self.respond(status, body.encode("utf-8"))
+
+        def do_HEAD(self) -> 'None':
+            status, body = stub.get_response(self.path)
+            self.respond(status, b"", len(body.encode("utf-8")))
+
+        def respond(self, status:'int', body:'bytes', content_length:'int' = None) -> 'None':
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body) if (content_length is None) else content_length))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format:'str', *args) -> 'None':
+            # one line per request would swamp the output of a load test
+            pass
+
+    return Handler
+
+# ----------
+
+def main() -> 'None':
+    parser = argparse.ArgumentParser(description="Serves the recorded upstream pages, with injected latency and errors.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="how long to wait before answering each request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="up to this much is randomly added to or taken from --latency-ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="the fraction of requests answered with a 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubUpstream(f"http://{args.host}:{args.port}", args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    print(f"Serving the upstream stand-in at {stub.base_url}", file=sys.stderr)
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+'''
+Tests of `batch.py`: that the modules of a batch are requested in URL-length reports, each only once - including when several
+batches want the same modules at the same time (see `batch.InFlight`) - and that an upstream error reaches everything waiting on it.
+
+The reports are made up by `make_fixtures.py`, seeded by each module, so that a module's activities are the same whichever
+report it's requested in.
+'''
+
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+
+import pytest
+
+import batch
+from cache import MemoryCache
+from scraper import Scraper, UpstreamError, MAX_URL_LENGTH
+from conftest import FixtureScraper
+from fixture_pages import get_report_module_codes
+from make_fixtures import make_activities, render_textspreadsheet
+
+# how long each made-up report takes to come back, so that concurrent batches overlap
+LATENCY_SECONDS = 0.05
+
+# ============================================================
+
+class ReportScraper(FixtureScraper):
+    '''
+    A `FixtureScraper` which makes up the report of any modules, and records the modules of every report requested.
+    The reports of `failing_modules` fail with an `UpstreamError`.
+    '''
+
+    def __init__(self, failing_modules:'list[str]' = ()) -> 'None':
+        super().__init__(MemoryCache())
+        self.failing_modules = set(failing_modules)
+        self.module_names = {code: name.split(" - ", 1)[1] for name, code in self.get_module_timetable_url_parameters()["Select Module(s) to View:"]}
+
+        self.requested = []
+        self.lock = threading.Lock()
+
+        # the number of reports being requested right now, and the most there have been at once
+        self.active = 0
+        self.max_active = 0
+
+    def handle_request(self, base_url:'str') -> 'str':
+        if "/reporting/" not in base_url:
+            return super().handle_request(base_url)
+
+        assert len(base_url) <= MAX_URL_LENGTH
+        module_codes = get_report_module_codes(base_url)
+        with self.lock:
+            self.requested.append(module_codes)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        time.sleep(LATENCY_SECONDS)
+        with self.lock:
+            self.active -= 1
+
+        if self.failing_modules & set(module_codes):
+            raise UpstreamError("Service Unavailable")
+
+        activities = dict()
+        for code in module_codes:
+            activities.update(make_activities([code], self.module_names, random.Random(code)))
+        return render_textspreadsheet(activities, self.module_names)
+
+    def get_requested_modules(self) -> 'list[str]':
+        return [code for module_codes in self.requested for code in module_codes]
+
+# ----------
+
+@pytest.fixture
+def report_scraper() -> 'ReportScraper':
+    return ReportScraper()
+
+# ----------
+
+@pytest.fixture
+def catalog_codes(report_scraper) -> 'list[str]':
+    ''' The first 300 module codes in the catalog - too many for one report. '''
+    return [code for _, code in report_scraper.get_module_timetable_url_parameters()["Select Module(s) to View:"]][:300]
+
+# ----------
+
+def get_expected_activities(module_code:'str') -> 'list[dict]':
+    ''' The activities of `module_code` when it's requested on its own. '''
+    return ReportScraper().get_module_timetable([module_code], "list")
+
+# ============================================================
+
+def test_in_flight_claim_and_finish():
+    in_flight = batch.InFlight()
+
+    claimed, waiting = in_flight.claim(["A", "B"])
+    assert (claimed, waiting) == (["A", "B"], {})
+
+    claimed, waiting = in_flight.claim(["B", "C"])
+    assert claimed == ["C"]
+    assert list(waiting) == ["B"]
+
+    in_flight.finish(["A", "B"], {"A": [1]})
+    assert waiting["B"].result(timeout=0) == []
+
+    claimed, waiting = in_flight.claim(["C"])
+    assert claimed == []
+
+    error = UpstreamError("Service Unavailable")
+    in_flight.finish(["C"], error=error)
+    assert waiting["C"].exception(timeout=0) is error
+    assert in_flight.futures == {}
+
+# ----------
+
+def test_get_module_activities_batches_by_url_length(report_scraper, catalog_codes):
+    modules = batch.get_module_activities(report_scraper, catalog_codes, batch.InFlight())
+
+    assert len(report_scraper.requested) > 1
+    assert sorted(report_scraper.get_requested_modules()) == sorted(catalog_codes)
+
+    for code in catalog_codes[:20]:
+        assert Scraper.activities_are_equivalent(modules[code], get_expected_activities(code))
+
+    # every module is cached on its own, so asking again (in any combination) requests nothing
+    requests = len(report_scraper.requested)
+    batch.get_module_activities(report_scraper, catalog_codes[100:150], batch.InFlight())
+    assert len(report_scraper.requested) == requests
+
+# ----------
+
+def test_concurrent_batches_share_requests(report_scraper, catalog_codes):
+    ''' Overlapping batches at the same time: every module is requested once, and every batch gets every one of its modules. '''
+
+    in_flight = batch.InFlight()
+    module_sets = [catalog_codes[i : i + 60] for i in range(0, 200, 20)]
+    barrier = threading.Barrier(len(module_sets))
+
+    def get_modules(module_codes:'list[str]') -> 'dict[str, list[dict]]':
+        barrier.wait()
+        return batch.get_module_activities(report_scraper, module_codes, in_flight)
+
+    with concurrent.futures.ThreadPoolExecutor(len(module_sets)) as pool:
+        results = list(pool.map(get_modules, module_sets))
+
+    requested = report_scraper.get_requested_modules()
+    assert sorted(requested) == sorted(set(requested))
+    assert set(requested) == {code for module_codes in module_sets for code in module_codes}
+
+    # batches that waited on a module got the same activities as the batch that requested it
+    activities = dict()
+    for module_codes, modules in zip(module_sets, results):
+        assert sorted(modules) == sorted(module_codes)
+        for code in module_codes:
+            assert activities.setdefault(code, modules[code]) == modules[code]
+
+    assert in_flight.futures == {}
+
+# ----------
+
+def test_upstream_error_reaches_waiting_batches(catalog_codes):
+    ''' A batch waiting on modules that another batch fails to get fails with the same error - and the modules can be asked for again. '''
+
+    report_scraper = ReportScraper(failing_modules=catalog_codes[:1])
+    in_flight = batch.InFlight()
+
+    # the "other batch" - it claims the modules before the waiting batch asks for them, and then fails to get them
+    claimed, _ = in_flight.claim(catalog_codes[:10])
+    with pytest.raises(UpstreamError) as leader_error:
+        report_scraper.get_module_timetable(claimed, "list")
+
+    outcome = dict()
+
+    def wait_for_modules() -> 'None':
+        try:
+            batch.get_module_activities(report_scraper, catalog_codes[:10], in_flight)
+        except UpstreamError as error:
+            outcome["error"] = error
+
+    waiter = threading.Thread(target=wait_for_modules)
+    waiter.start()
+    time.sleep(LATENCY_SECONDS)
+
+    in_flight.finish(claimed, error=leader_error.value)
+    waiter.join(timeout=5)
+
+    assert outcome["error"] is leader_error.value
+    assert len(report_scraper.requested) == 1
+    assert in_flight.futures == {}
+
+    # nothing is left claimed, so the modules can be asked for again
+    report_scraper.failing_modules = set()
+    modules = batch.get_module_activities(report_scraper, catalog_codes[:10], in_flight)
+    assert sorted(modules) == sorted(catalog_codes[:10])
+
+# ----------
+
+def test_concurrent_async_batches_share_requests(report_scraper, catalog_codes):
+    in_flight = batch.InFlight()
+    module_sets = [catalog_codes[i : i + 60] for i in range(0, 200, 20)]
+
+    async def get_all() -> 'list[dict[str, list[dict]]]':
+        return await asyncio.gather(*[batch.get_module_activities_async(report_scraper, module_codes, in_flight) for module_codes in module_sets])
+
+    results = asyncio.run(get_all())
+
+    requested = report_scraper.get_requested_modules()
+    assert sorted(requested) == sorted(set(requested))
+    assert all(sorted(modules) == sorted(module_codes) for module_codes, modules in zip(module_sets, results))
+    assert in_flight.futures == {}
+
+# ----------
+
+def test_async_batch_limits_concurrent_reports(report_scraper):
+    ''' A batch of many more modules than fit in `MAX_CONCURRENT_REPORTS` reports doesn't request them all at once. '''
+
+    module_codes = [code for _, code in report_scraper.get_module_timetable_url_parameters()["Select Module(s) to View:"]][:1000]
+    modules = asyncio.run(batch.get_module_activities_async(report_scraper, module_codes, batch.InFlight()))
+
+    assert sorted(modules) == sorted(module_codes)
+    assert len(report_scraper.requested) > batch.MAX_CONCURRENT_REPORTS
+    assert report_scraper.max_active == batch.MAX_CONCURRENT_REPORTS
+
+# ----------
+
+def test_async_upstream_error_reaches_waiting_batches(catalog_codes):
+    report_scraper = ReportScraper(failing_modules=catalog_codes[5:6])
+    in_flight = batch.InFlight()
+
+    async def get_both() -> 'list':
+        return await asyncio.gather(
+            batch.get_module_activities_async(report_scraper, catalog_codes[:10], in_flight),
+            batch.get_module_activities_async(report_scraper, catalog_codes[:10], in_flight),
+            return_exceptions=True,
+        )
+
+    leader, waiter = asyncio.run(get_both())
+    assert isinstance(leader, UpstreamError)
+    assert waiter is leader
+    assert report_scraper.requested == [catalog_codes[:10]]
+    assert in_flight.futures == {}
+
+# ----------
+
+def test_clash_matrix_of_many_modules(report_scraper, catalog_codes):
+    ''' A department's worth of modules is too many for one report's URL, so the clash matrix gets them in batches too. '''
+
+    import clash_matrix
+
+    matrix = clash_matrix.get_clash_matrix(report_scraper, catalog_codes, batch.InFlight())
+
+    assert len(report_scraper.requested) > 1
+    assert sorted(report_scraper.get_requested_modules()) == sorted(catalog_codes)
+    assert matrix.module_codes == catalog_codes
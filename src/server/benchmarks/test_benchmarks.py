@@ -0,0 +1,466 @@
+'''
+Benchmarks of the scraping and ICS pipeline, run against the pages in `fixtures/` (so no network access or credentials are needed).
+
+```
+cd src/server/benchmarks
+pip install -r requirements.txt
+pytest                                  # runs the benchmarks and saves the results in .benchmarks/
+pytest --benchmark-compare              # ...and compares them against the last saved run
+pytest --benchmark-compare=0001 --benchmark-compare-fail=mean:10%    # fails if anything is 10% slower than run 0001
+```
+'''
+
+import datetime
+
+import pytest
+
+from scraper import Scraper, WEEK_PATTERNS, REPORT_STYLE_PARSERS
+from module_calendar import ModuleCalendar
+from store import TimetableStore
+from snapshot import Snapshot
+from mapped_snapshot import MappedSnapshot, write_mapped
+import occupancy
+from clashes import find_clashes
+from clash_matrix import compute_clash_matrix
+from room_index import RoomIndex
+from free_time import find_common_free_time
+from staff_index import StaffIndex, get_staff_names
+from upcoming import OccurrenceIndex
+from snapshot_diff import diff_snapshots
+from export import export_snapshot
+import batch
+from store import split_rooms
+from fixture_pages import REPORTS, read_fixture
+
+# ============================================================
+# Parsing each page
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_parse_module_timetable(benchmark, size):
+    response_text = read_fixture(f"textspreadsheet_{size}.htm")
+
+    activities = benchmark(Scraper.parse_module_timetable, response_text, "list")
+
+    assert {activity["Module"] for activity in activities} <= set(REPORTS[size])
+
+# ----------
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_get_module_timetable(benchmark, scraper, size):
+    ''' The whole of `Scraper.get_module_timetable` (building the URL, "fetching" the report and parsing it), with nothing cached. '''
+
+    activities = benchmark.pedantic(
+        scraper.get_module_timetable, args=(REPORTS[size],),
+        setup=scraper.cache.clear, rounds=20, warmup_rounds=1,
+    )
+
+    assert set(activities.keys()) == {"Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"}
+
+# ----------
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_get_module_timetable_unchanged(benchmark, scraper, size):
+    ''' Refreshing a timetable whose report hasn't changed since it was last parsed (i.e. the timetable has expired from the cache, but the parsed report hasn't). '''
+
+    cache_key = Scraper.get_module_timetable_cache_key(REPORTS[size])
+    expected = scraper.get_module_timetable(REPORTS[size])
+
+    activities = benchmark.pedantic(
+        scraper.get_module_timetable, args=(REPORTS[size],),
+        setup=lambda: scraper.cache.delete(cache_key), rounds=20, warmup_rounds=1,
+    )
+
+    assert activities == expected
+
+# ============================================================
+# Report styles
+#
+# `extra_info` records the size of each report, so the saved runs (`.benchmarks/`) have both the bytes and the parse time of each style.
+
+@pytest.mark.parametrize("report_style", REPORT_STYLE_PARSERS.keys())
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_parse_report_style(benchmark, size, report_style):
+    response_text = read_fixture(f"{report_style}_{size}.htm")
+    benchmark.extra_info["bytes"] = len(response_text.encode("utf-8"))
+
+    activities = benchmark(Scraper.get_report_style_parser(report_style), response_text, "list")
+
+    reference = Scraper.parse_module_timetable(read_fixture(f"textspreadsheet_{size}.htm"), "list")
+    assert Scraper.activities_are_equivalent(activities, reference)
+
+# ----------
+
+def test_choose_report_style(scraper):
+    report_style = scraper.choose_report_style(REPORTS["medium"])
+
+    # the grid reports are around 4 times the size of the textspreadsheet ones (and slower to parse)
+    assert report_style == "textspreadsheet"
+    assert scraper.cache.get("report style") == report_style
+
+# ============================================================
+# Other pages
+
+def test_parse_module_timetable_url_parameters(benchmark):
+    params = benchmark(Scraper.parse_module_timetable_url_parameters, read_fixture("module.htm"))
+    assert "Select Module(s) to View:" in params
+
+# ----------
+
+def test_parse_building_codes(benchmark):
+    building_codes = benchmark(Scraper.parse_building_codes, read_fixture("facilities.htm"))
+    assert building_codes["ERA"] == building_codes["ER1"]
+
+# ----------
+
+def test_parse_term_dates(benchmark):
+    academic_year_span = Scraper.parse_current_academic_year(read_fixture("home.htm"))
+    term_dates = benchmark(Scraper.parse_term_dates, read_fixture("dates.htm"), academic_year_span)
+    assert list(term_dates.keys()) == ["Michaelmas", "Epiphany", "Easter"]
+
+# ----------
+
+def test_get_week_patterns(benchmark, scraper):
+    week_patterns = benchmark(scraper.get_week_patterns)
+    assert len(week_patterns) == len(WEEK_PATTERNS)
+
+# ============================================================
+# Week/date expansion
+
+@pytest.mark.parametrize("weeks_raw", ["12", "12-21", "12-21, 26-35, 41-42", "13, 15, 17, 19, 21, 27, 29, 31, 33, 35"])
+def test_get_dates_from_weeks_string(benchmark, weeks_raw):
+    dates = benchmark(Scraper.get_dates_from_weeks_string, WEEK_PATTERNS, weeks_raw, "Wednesday")
+    assert len(dates) == len(set(dates))
+
+# ============================================================
+# Building the calendar
+
+@pytest.fixture(scope="module")
+def large_activities() -> 'list[dict]':
+    return Scraper.parse_module_timetable(read_fixture("textspreadsheet_large.htm"), "list")
+
+# ----------
+
+def test_get_repeating_pattern(benchmark, large_activities):
+    ''' `ModuleCalendar.get_repeating_pattern` for every activity in the large report. '''
+
+    def get_repeating_patterns():
+        return [ModuleCalendar.get_repeating_pattern(activity["Dates"]) for activity in large_activities]
+
+    rrule_dicts = benchmark(get_repeating_patterns)
+    assert len(rrule_dicts) == len(large_activities)
+
+# ----------
+
+def test_format_description(benchmark, large_activities):
+    ''' `ModuleCalendar.format_description` for every activity in the large report. '''
+
+    def format_descriptions():
+        return [ModuleCalendar.format_description(activity) for activity in large_activities]
+
+    descriptions = benchmark(format_descriptions)
+    assert len(descriptions) == len(large_activities)
+
+# ----------
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_create_ics_file_from_module_codes(benchmark, module_calendar, size):
+    ''' A full ICS build. The building data stays cached between rounds (as it would in the server), but the timetable is parsed every time. '''
+
+    timetable_cache_key = Scraper.get_module_timetable_cache_key(REPORTS[size], "list")
+
+    benchmark.pedantic(
+        module_calendar.create_ics_file_from_module_codes, args=(REPORTS[size],),
+        setup=lambda: module_calendar.scraper.cache.delete(timetable_cache_key), rounds=10, warmup_rounds=1,
+    )
+
+# ============================================================
+# The timetable store
+
+@pytest.fixture(scope="module")
+def timetable_store(tmp_path_factory, large_activities) -> 'TimetableStore':
+    ''' A store holding the modules of the large report. '''
+
+    modules = {code: [] for code in REPORTS["large"]}
+    for activity in large_activities:
+        modules[activity["Module"]].append(activity)
+
+    store = TimetableStore(str(tmp_path_factory.mktemp("store") / "timetables.sqlite3"))
+    store.load_modules(modules, list(Scraper.parse_building_codes(read_fixture("facilities.htm")).keys()))
+    return store
+
+# ----------
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_store_get_module_timetable(benchmark, timetable_store, large_activities, size):
+    activities = benchmark(timetable_store.get_module_timetable, REPORTS[size], "list")
+    assert Scraper.activities_are_equivalent(activities, [activity for activity in large_activities if activity["Module"] in REPORTS[size]])
+
+# ----------
+
+@pytest.mark.parametrize("filters", [
+    {"start_date": datetime.date(2022, 10, 3), "end_date": datetime.date(2022, 10, 9)},
+    {"room": "D/TLC042"},
+    {"staff": "Smith, Jane"},
+    {"building": "MCS", "start_date": datetime.date(2022, 10, 3), "end_date": datetime.date(2022, 10, 3)},
+], ids=["week", "room", "staff", "building-day"])
+def test_store_query(benchmark, timetable_store, filters):
+    activities = benchmark(timetable_store.query, **filters)
+    assert len(activities) > 0
+
+# ----------
+
+def test_store_from_environment(benchmark, tmp_path, monkeypatch, large_activities):
+    ''' A server starting up with a store that already has the latest snapshot in it - which isn't decoded just to find that out. '''
+
+    modules = {code: [] for code in REPORTS["large"]}
+    for activity in large_activities:
+        modules[activity["Module"]].append(activity)
+
+    snapshot_directory = str(tmp_path / "snapshots")
+    Snapshot("20221014T153012Z", modules).write(snapshot_directory)
+
+    monkeypatch.setenv("APP_STORE_PATH", str(tmp_path / "timetables.sqlite3"))
+    monkeypatch.setenv("APP_SNAPSHOT_DIR", snapshot_directory)
+    assert TimetableStore.from_environment().version == "20221014T153012Z"
+
+    def fail_to_load(path:'str') -> 'None':
+        raise AssertionError("The snapshot was decoded, although the store already has it.")
+    monkeypatch.setattr(Snapshot, "load", staticmethod(fail_to_load))
+
+    store = benchmark(TimetableStore.from_environment)
+    assert store.has_modules(REPORTS["large"])
+
+# ============================================================
+# The memory-mapped snapshot
+
+@pytest.fixture(scope="module")
+def mapped_snapshot(tmp_path_factory, large_activities) -> 'MappedSnapshot':
+    ''' A mapped snapshot of the modules of the large report. '''
+
+    modules = {code: [] for code in REPORTS["large"]}
+    for activity in large_activities:
+        modules[activity["Module"]].append(activity)
+
+    return MappedSnapshot(write_mapped(Snapshot("20221014T153012Z", modules), str(tmp_path_factory.mktemp("snapshots"))))
+
+# ----------
+
+def test_mapped_snapshot_open(benchmark, mapped_snapshot):
+    ''' What a server pays for its snapshot at startup. '''
+    snapshot = benchmark(MappedSnapshot, mapped_snapshot.path)
+    assert snapshot.has_modules(REPORTS["large"])
+
+# ----------
+
+@pytest.mark.parametrize("size", REPORTS.keys())
+def test_mapped_snapshot_get_module_timetable(benchmark, mapped_snapshot, large_activities, size):
+    activities = benchmark(mapped_snapshot.get_module_timetable, REPORTS[size], "list")
+    assert Scraper.activities_are_equivalent(activities, [activity for activity in large_activities if activity["Module"] in REPORTS[size]])
+
+# ----------
+
+def test_write_mapped_offsets(tmp_path, large_activities):
+    '''
+    Snapshots whose contents (and so the offsets of their sections) are around 10,000 bytes long, so that some of the offsets
+    only get another digit once the contents are in front of them - they must still be read back exactly.
+    '''
+
+    modules = {code: [] for code in REPORTS["small"]}
+    for activity in large_activities:
+        if activity["Module"] in modules:
+            modules[activity["Module"]].append(activity)
+
+    for padding in range(9_800, 10_000, 3):
+        snapshot = Snapshot(f"padded{padding}", modules, metadata={"Padding": "x" * padding})
+        mapped = MappedSnapshot(write_mapped(snapshot, str(tmp_path)))
+
+        assert mapped.metadata == snapshot.metadata
+        assert mapped.get_module_timetable(REPORTS["small"], "list") == snapshot.get_module_timetable(REPORTS["small"], "list")
+
+# ----------
+
+def test_diff_mapped_snapshots(benchmark, tmp_path, mapped_snapshot, large_activities):
+    ''' Diffing the mapped snapshot of the large report against a later one in which one room has changed. '''
+
+    modules = {code: [] for code in REPORTS["large"]}
+    for activity in large_activities:
+        modules[activity["Module"]].append(dict(activity))
+
+    code = REPORTS["large"][0]
+    moved = modules[code][0]
+    old_room = moved["Room"]
+    moved["Room"] = "D/TLC042" if (old_room != "D/TLC042") else "D/CG91"
+
+    later = MappedSnapshot(write_mapped(Snapshot("later", modules), str(tmp_path)))
+
+    changes = benchmark(diff_snapshots, mapped_snapshot, later)
+    assert list(changes["Modules"]) == [code]
+    assert [(change["Before"], change["After"]) for change in changes["Modules"][code]["Changed"]] == [({"Room": old_room}, {"Room": moved["Room"]})]
+
+# ----------
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_export_snapshot(benchmark, tmp_path, mapped_snapshot, large_activities, file_format):
+    ''' Exporting the mapped snapshot of the large report, a few modules at a time. '''
+
+    pytest.importorskip("pyarrow")
+
+    counts = benchmark(export_snapshot, mapped_snapshot, str(tmp_path), file_format, 5)
+    assert counts["activities"] == len(large_activities)
+    assert counts["occurrences"] == sum(len(activity["Dates"]) * max(len(split_rooms(activity["Room"])), 1) for activity in large_activities)
+
+# ============================================================
+# Occupancy bitmaps
+
+def test_get_activity_bitmaps(benchmark, large_activities):
+    ''' Building the bitmap of every activity in the large report (without the cache, as it would be for a new snapshot). '''
+
+    def get_activity_bitmaps():
+        occupancy.get_bitmap.cache_clear()
+        return occupancy.get_activity_bitmaps(large_activities)
+
+    bitmaps = benchmark(get_activity_bitmaps)
+    assert all(occupancy.popcount(bitmap) > 0 for bitmap, activity in zip(bitmaps, large_activities) if activity["Dates"])
+
+# ----------
+
+def test_bitmap_union_and_popcount(benchmark, large_activities):
+    ''' When anyone taking the modules of the large report is busy, and for how long. '''
+
+    bitmaps = occupancy.get_activity_bitmaps(large_activities)
+
+    busy_periods = benchmark(lambda: occupancy.popcount(occupancy.union(bitmaps)))
+    assert 0 < busy_periods <= sum(occupancy.popcount(bitmap) for bitmap in bitmaps)
+
+# ============================================================
+# Clash detection
+
+def test_find_clashes(benchmark, large_activities):
+    ''' Every clash between the modules of the large report, checked against comparing the bitmaps of every pair of activities. '''
+
+    clashes = benchmark(find_clashes, large_activities)
+
+    bitmaps = occupancy.get_activity_bitmaps(large_activities)
+    expected = sum(
+        1
+        for i in range(len(large_activities)) for j in range(i + 1, len(large_activities))
+        if large_activities[i]["Module"] != large_activities[j]["Module"] and occupancy.overlap(bitmaps[i], bitmaps[j])
+    )
+    assert len(clashes) == expected
+
+# ----------
+
+def test_compute_clash_matrix(benchmark, large_activities):
+    ''' The clash matrix of every module in the large report, checked against the bitmaps of each pair of modules. '''
+
+    module_codes = sorted({activity["Module"] for activity in large_activities})
+
+    matrix = benchmark(compute_clash_matrix, module_codes, large_activities)
+
+    bitmaps = {code: occupancy.union(occupancy.get_activity_bitmaps([a for a in large_activities if a["Module"] == code])) for code in module_codes}
+    for code_a in module_codes:
+        for code_b in module_codes:
+            expected = occupancy.popcount(bitmaps[code_a] & bitmaps[code_b]) * occupancy.PERIOD_MINUTES
+            assert matrix.get_clash_minutes(code_a, code_b) == expected
+
+# ============================================================
+# Rooms
+
+@pytest.fixture(scope="module")
+def room_index(large_activities) -> 'RoomIndex':
+    return RoomIndex(large_activities, list(Scraper.parse_building_codes(read_fixture("facilities.htm")).keys()))
+
+# ----------
+
+def test_build_room_index(benchmark, large_activities):
+    building_codes = list(Scraper.parse_building_codes(read_fixture("facilities.htm")).keys())
+    index = benchmark(RoomIndex, large_activities, building_codes)
+    assert index.get_rooms() == sorted({room for activity in large_activities for room in split_rooms(activity["Room"])})
+
+# ----------
+
+def test_find_free_rooms(benchmark, room_index, large_activities):
+    ''' The free rooms of the busiest building, at the start of the first activity - checked against every activity in them. '''
+
+    building = max(room_index.buildings, key = lambda building: len(room_index.buildings[building]))
+    activity = next(activity for activity in large_activities if activity["Dates"])
+    date = datetime.date.fromisoformat(activity["Dates"][0])
+    start, end = activity["Start"][:5], activity["End"][:5]
+
+    free_rooms = benchmark(room_index.find_free_rooms, building, date, start, end)
+
+    busy_rooms = {
+        room
+        for other in large_activities if (date.isoformat() in other["Dates"]) and (other["Start"][:5] < end) and (other["End"][:5] > start)
+        for room in split_rooms(other["Room"])
+    }
+    assert free_rooms == [room for room in room_index.get_rooms(building) if room not in busy_rooms]
+
+# ============================================================
+# Staff
+
+def test_get_staff_activities(benchmark, large_activities):
+    ''' A lecturer's activities from the index, checked against scanning every activity. '''
+
+    index = StaffIndex(large_activities)
+    name = index.get_staff()[0]
+
+    activities = benchmark(index.get_activities, name.upper())
+    assert activities == sorted([activity for activity in large_activities if name in get_staff_names(activity["Staff"])], key = lambda activity: activity["Start"])
+
+# ============================================================
+# Common free time
+
+def test_find_common_free_time(benchmark, large_activities):
+    ''' The free time of a group of 30 members taking 4 modules each of the large report, over a term - checked against every activity. '''
+
+    module_codes = sorted({activity["Module"] for activity in large_activities})
+    module_sets = [[module_codes[(i + j * 7) % len(module_codes)] for j in range(4)] for i in range(30)]
+    start_date, end_date = datetime.date(2022, 10, 3), datetime.date(2022, 12, 11)
+
+    periods = benchmark(find_common_free_time, module_sets, large_activities, start_date, end_date, "09:00", "18:00", 30)
+    assert periods
+
+    taken = {code for module_set in module_sets for code in module_set}
+    for period in periods:
+        assert not any(
+            (period["Date"] in activity["Dates"]) and (activity["Start"][:5] < period["End"]) and (activity["End"][:5] > period["Start"])
+            for activity in large_activities if activity["Module"] in taken
+        )
+
+# ============================================================
+# Upcoming occurrences
+
+def test_get_next_occurrences(benchmark, large_activities):
+    ''' The next 5 occurrences in the large report after a time, checked against going through every activity's dates. '''
+
+    index = OccurrenceIndex(large_activities)
+    after = datetime.datetime(2022, 10, 25, 14, 0)
+
+    occurrences = benchmark(index.get_next, after, 5)
+
+    expected = sorted(
+        f"{date}T{activity['Start']}" for activity in large_activities for date in activity["Dates"]
+        if f"{date}T{activity['Start']}" >= after.isoformat()
+    )[:5]
+    assert [occurrence["Starts At"] for occurrence in occurrences] == expected
+
+# ============================================================
+# Batches
+
+def test_get_batch_timetables(benchmark, mapped_snapshot, large_activities):
+    ''' The timetables of 60 students taking modules of the large report, from the snapshot, checked against getting each one on its own. '''
+
+    scraper = Scraper("", "", snapshot=mapped_snapshot)
+    module_codes = REPORTS["large"]
+    module_sets = {f"Student {i}": [module_codes[(i + j * 7) % len(module_codes)] for j in range(6)] for i in range(60)}
+
+    def get_batch_timetables() -> 'dict[str, dict]':
+        modules = batch.get_module_activities(scraper, batch.get_batch_module_codes(module_sets), batch.InFlight())
+        return {name: batch.get_set_timetable(modules, codes) for name, codes in module_sets.items()}
+
+    timetables = benchmark(get_batch_timetables)
+
+    for name, codes in module_sets.items():
+        expected = mapped_snapshot.get_module_timetable(codes)
+        assert all(Scraper.activities_are_equivalent(timetables[name][day], expected[day]) for day in expected)
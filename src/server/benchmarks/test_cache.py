@@ -0,0 +1,40 @@
+'''
+Tests of the bounds of the cache backends in `cache.py`: `MemoryCache` drops its least recently used values beyond
+`max_entries`, and `SQLiteCache` sweeps out expired rows that are never read again.
+'''
+
+import time
+
+import cache
+from cache import MemoryCache, SQLiteCache, MISSING
+
+# ============================================================
+
+def test_memory_cache_drops_least_recently_used():
+    memory_cache = MemoryCache(max_entries=3)
+
+    for key in ["a", "b", "c"]:
+        memory_cache.set(key, key)
+    memory_cache.get("a")
+    memory_cache.set("d", "d")
+
+    assert memory_cache.get("b") is MISSING
+    assert [memory_cache.get(key) for key in ["a", "c", "d"]] == ["a", "c", "d"]
+    assert len(memory_cache.entries) == 3
+
+# ----------
+
+def test_sqlite_cache_sweeps_expired_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "SWEEP_EVERY", 10)
+    sqlite_cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+
+    sqlite_cache.set("forever", 1)
+    for i in range(5):
+        sqlite_cache.set(f"expired {i}", i, ttl=-1)
+
+    time.sleep(0.01)
+    for i in range(4):
+        sqlite_cache.set(f"fresh {i}", i, ttl=60)
+
+    keys = {key for key, in sqlite_cache.connection().execute("SELECT key FROM cache")}
+    assert keys == {"forever"} | {f"fresh {i}" for i in range(4)}
@@ -0,0 +1,77 @@
+'''
+Import-time budgets for the servers and the CLI entry points, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter (so nothing is already in `sys.modules`), and the cumulative time of its import -
+including everything it imports - has to be within its budget. The heavy dependencies that are only needed for some of the work
+(`selenium`, `bs4`, `requests`, `icalendar`, `numpy` and `pyarrow`) mustn't be imported at all; they're imported where they're used.
+
+```
+cd src/server/benchmarks
+pytest test_import_time.py
+```
+'''
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module --> the most its import may take, in milliseconds (the best of `RUNS` runs).
+# the servers are mostly the time it takes to import Flask/Quart themselves.
+BUDGETS_MS = {
+    "scraper": 60,
+    "module_calendar": 60,
+    "snapshot": 30,
+    "mapped_snapshot": 30,
+    "store": 60,
+    "crawl": 80,
+    "clash_matrix": 60,
+    "export": 80,
+    "server": 300,
+    "async_server": 450,
+}
+
+# the modules that none of the above should import
+HEAVY_MODULES = ["selenium", "bs4", "requests", "icalendar", "numpy", "pyarrow"]
+
+RUNS = 3
+
+# ============================================================
+
+def get_import_times(module:'str') -> 'dict[str, int]':
+    ''' Imports `module` in a fresh interpreter, and returns the cumulative import time (in microseconds) of every module that was imported. '''
+
+    # bytecode is written, so that the time measured is that of importing the modules rather than compiling them
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+    # e.g. "import time:       347 |      23062 |   certifi"
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+# ============================================================
+
+@pytest.mark.parametrize("module", BUDGETS_MS.keys())
+def test_import_time(module):
+
+    # the first run writes the bytecode (if it isn't there already)
+    runs = [get_import_times(module) for _ in range(RUNS + 1)][1:]
+
+    heavy = [name for name in HEAVY_MODULES if name in runs[0]]
+    assert heavy == [], f"importing {module} imports {heavy}"
+
+    best_ms = min(times[module] for times in runs) / 1000
+    assert best_ms <= BUDGETS_MS[module], f"importing {module} took {best_ms:.1f}ms (the budget is {BUDGETS_MS[module]}ms)"
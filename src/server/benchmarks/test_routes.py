@@ -0,0 +1,279 @@
+'''
+Tests of the routes of both servers (`server.py` and `async_server.py`), using Flask's and Quart's test clients - in particular
+that bad requests get a 400, unknown things a 404, and routes that need a snapshot a 503 when there isn't one.
+
+The servers serve from two small snapshots (of the modules of the medium report) in a temporary `APP_SNAPSHOT_DIR`, and their
+upstream is somewhere that refuses every connection - or, for the routes that have to go upstream, a `stub_upstream.StubUpstream`
+on localhost. So nothing here touches the network.
+
+```
+cd src/server/benchmarks
+pytest test_routes.py
+```
+'''
+
+import json
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+import flask
+import pytest
+
+from scraper import Scraper
+from snapshot import Snapshot
+from fixture_pages import REPORTS, read_fixture, get_report_module_codes
+from make_fixtures import MODULE_PARAMETERS_PATH
+from stub_upstream import StubUpstream, make_handler
+
+# the versions of the snapshots in `snapshot_directory` (the later one is served)
+EARLIER_VERSION = "20221014T153012Z"
+LATER_VERSION = "20221021T153012Z"
+
+# ============================================================
+
+@pytest.fixture(scope="module")
+def snapshot_directory(tmp_path_factory) -> 'str':
+    ''' A directory with two snapshots of the medium report's modules - the later one with one activity fewer. '''
+
+    modules = {code: [] for code in REPORTS["medium"]}
+    for activity in Scraper.parse_module_timetable(read_fixture("textspreadsheet_medium.htm"), "list"):
+        modules[activity["Module"]].append(activity)
+
+    directory = str(tmp_path_factory.mktemp("snapshots"))
+
+    Snapshot(EARLIER_VERSION, modules).write(directory)
+
+    code = next(code for code, activities in modules.items() if activities)
+    Snapshot(LATER_VERSION, {**modules, code: modules[code][1:]}).write(directory)
+
+    return directory
+
+# ----------
+
+@pytest.fixture(params=["flask", "quart"])
+def make_app(request, monkeypatch, tmp_path) -> 'typing.Callable[[str|None], flask.Flask|quart.Quart]':
+    '''
+    Makes the app of `server.server()` or `async_server.async_server()`, serving from the snapshots in the directory it's given
+    (or from no snapshot, if `None`).
+    '''
+
+    # `load_environment_variables` reads `../../.env`, which has nothing in it here
+    (tmp_path / ".env").write_text("")
+    working_directory = tmp_path / "src" / "server"
+    working_directory.mkdir(parents=True)
+    monkeypatch.chdir(working_directory)
+
+    for name in ["APP_CACHE_BACKEND", "APP_STORE_PATH", "APP_PROFILE_DIR", "APP_PROFILE_SAMPLE_RATE", "APP_PROFILE_ALLOW_HEADER"]:
+        monkeypatch.delenv(name, raising=False)
+
+    # (port 9 is "discard" - nothing listens on it, so every upstream request fails straight away)
+    monkeypatch.setenv("APP_TIMETABLE_BASE_URL", "http://127.0.0.1:9")
+    monkeypatch.setenv("APP_UNIVERSITY_BASE_URL", "http://127.0.0.1:9")
+    monkeypatch.setenv("APP_REPORT_STYLE", "textspreadsheet")
+    monkeypatch.setenv("APP_SCRAPER_USERNAME", "username")
+    monkeypatch.setenv("APP_SCRAPER_PASSWORD", "password")
+
+    def make(directory:'str|None') -> 'flask.Flask|quart.Quart':
+        if directory is None:
+            monkeypatch.delenv("APP_SNAPSHOT_DIR", raising=False)
+        else:
+            monkeypatch.setenv("APP_SNAPSHOT_DIR", directory)
+
+        if request.param == "flask":
+            import server
+            return server.server()
+
+        import async_server
+        return async_server.async_server()
+
+    return make
+
+# ----------
+
+@pytest.fixture
+def app(make_app, snapshot_directory) -> 'flask.Flask|quart.Quart':
+    return make_app(snapshot_directory)
+
+# ----------
+
+class RecordingUpstream(StubUpstream):
+    ''' A `StubUpstream` which records the modules of every report it's asked for. '''
+
+    def __init__(self, base_url:'str') -> 'None':
+        super().__init__(base_url)
+        self.reports = []
+
+    def get_response(self, url:'str') -> 'tuple[int, str]':
+        if urlsplit(url).path.startswith("/reporting/"):
+            with self.random_lock:
+                self.reports.append(get_report_module_codes(url))
+        return super().get_response(url)
+
+# ----------
+
+@pytest.fixture
+def upstream(monkeypatch) -> 'RecordingUpstream':
+    ''' A `RecordingUpstream` served on a free port, which the apps made after this is set up get their pages from. '''
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    stub = RecordingUpstream(f"http://127.0.0.1:{httpd.server_address[1]}")
+    httpd.RequestHandlerClass = make_handler(stub)
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setenv("APP_TIMETABLE_BASE_URL", stub.base_url)
+    monkeypatch.setenv("APP_UNIVERSITY_BASE_URL", stub.base_url)
+
+    yield stub
+
+    httpd.shutdown()
+    httpd.server_close()
+
+# ----------
+
+def get_response(app:'flask.Flask|quart.Quart', method:'str', path:'str', json:'object' = None) -> 'tuple[int, object]':
+    ''' Makes a request to `app` with its test client, and returns the response's status code and JSON body (or `None`). '''
+
+    if isinstance(app, flask.Flask):
+        response = app.test_client().open(path, method=method, json=json)
+        return response.status_code, response.get_json(silent=True)
+
+    async def get_quart_response() -> 'tuple[int, object]':
+        async with app.test_app() as test_app:
+            response = await test_app.test_client().open(path, method=method, json=json)
+            return response.status_code, await response.get_json(silent=True)
+
+    return asyncio.run(get_quart_response())
+
+# ============================================================
+# From the snapshot
+
+def test_get_module_timetables(app, snapshot_directory):
+    module_codes = REPORTS["medium"][:3]
+
+    status, timetables = get_response(app, "POST", "/get-module-timetables", module_codes)
+
+    assert status == 200
+    assert timetables == Snapshot.load_latest(snapshot_directory).get_module_timetable(module_codes)
+
+# ----------
+
+def test_batch_module_timetables(app):
+    module_sets = {"Student 1": REPORTS["medium"][:2], "Student 2": REPORTS["medium"][1:3]}
+
+    status, timetables = get_response(app, "POST", "/batch-module-timetables", module_sets)
+
+    assert status == 200
+    assert list(timetables) == list(module_sets)
+
+# ----------
+
+def test_clashes(app):
+    status, clashes = get_response(app, "POST", "/clashes", REPORTS["medium"])
+
+    assert status == 200
+    assert isinstance(clashes, list)
+
+# ----------
+
+def test_changes(app):
+    status, changes = get_response(app, "GET", f"/changes?since={EARLIER_VERSION}")
+
+    assert status == 200
+    assert changes["Version"] == LATER_VERSION
+    assert len(changes["Modules"]) == 1
+
+    # the modules asked for are picked out of the (cached) diff of every module
+    changed_code = next(iter(changes["Modules"]))
+    unchanged_code = next(code for code in REPORTS["medium"] if code != changed_code)
+
+    _, changes_of_changed = get_response(app, "GET", f"/changes?since={EARLIER_VERSION}&modules={changed_code},{unchanged_code}")
+    _, changes_of_unchanged = get_response(app, "GET", f"/changes?since={EARLIER_VERSION}&modules={unchanged_code}")
+
+    assert changes_of_changed["Modules"] == changes["Modules"]
+    assert changes_of_unchanged["Modules"] == {}
+
+# ============================================================
+# From upstream
+
+def test_free_time_of_a_big_group(make_app, upstream):
+    ''' A group with too many modules for one report's URL: they're got in batches, each module once, and then from the cache. '''
+
+    with open(MODULE_PARAMETERS_PATH) as f:
+        catalog_codes = [code for _, code in json.load(f)["Select Module(s) to View:"]][:320]
+    module_sets = [catalog_codes[i : i + 8] for i in range(0, len(catalog_codes), 8)]
+
+    app = make_app(None)
+    status, periods = get_response(app, "POST", "/free-time?from=10&to=12", module_sets)
+
+    assert status == 200
+    assert isinstance(periods, list)
+
+    assert len(upstream.reports) > 1
+    requested = [code for module_codes in upstream.reports for code in module_codes]
+    assert sorted(requested) == sorted(catalog_codes)
+
+    # a different group of the same modules comes from each module's cache entry
+    reports = len(upstream.reports)
+    status, _ = get_response(app, "POST", "/free-time?from=10&to=12", [catalog_codes[::2], catalog_codes[1::2]])
+    assert status == 200
+    assert len(upstream.reports) == reports
+
+# ============================================================
+# 400s
+
+@pytest.mark.parametrize("method, path, json", [
+    ("POST", "/validate", ["username", "password"]),
+    ("POST", "/validate", {"username": "username"}),
+    ("POST", "/batch-module-timetables", ["COMP2221"]),
+    ("POST", "/batch-module-timetables", {"Student 1": "COMP2221"}),
+    ("POST", "/clashes", None),
+    ("POST", "/clashes", {"modules": ["COMP2221"]}),
+    ("POST", "/clashes", ["COMP2221", 2261]),
+    ("POST", "/get-module-timetables?from=15&to=10", ["COMP2221"]),
+    ("POST", "/get-module-timetables?from=soon", ["COMP2221"]),
+    ("GET", "/free-rooms?week=15&day=Tuesday&start=14:00", None),
+    ("GET", "/free-rooms?building=TLC&week=15&day=Tuesday", None),
+    ("GET", "/free-rooms?building=TLC&start=14:00", None),
+    ("GET", "/free-rooms?building=TLC&week=15&day=Tuesday&start=24:30", None),
+    ("GET", "/free-rooms?building=TLC&week=15&day=Tuesday&start=14:00&end=14:99", None),
+    ("POST", "/free-time", {"COMP2221": "MATH2011"}),
+    ("POST", "/free-time?earliest=9", [["COMP2221"], ["MATH2011"]]),
+    ("POST", "/free-time?latest=99:99", [["COMP2221"], ["MATH2011"]]),
+    ("POST", "/free-time?limit=many", [["COMP2221"], ["MATH2011"]]),
+    ("GET", "/upcoming?modules=COMP2221&after=tomorrow", None),
+    ("GET", "/upcoming?modules=COMP2221&count=x", None),
+])
+def test_bad_request(app, method, path, json):
+    status, _ = get_response(app, method, path, json)
+    assert status == 400
+
+# ============================================================
+# 404s
+
+@pytest.mark.parametrize("path", [
+    "/changes",
+    "/changes?since=20000101T000000Z",
+    "/changes?since=../snapshots",
+    "/no-such-route",
+])
+def test_not_found(app, path):
+    status, _ = get_response(app, "GET", path)
+    assert status == 404
+
+# ============================================================
+# 503s
+
+@pytest.mark.parametrize("path", [
+    "/rooms",
+    "/rooms/D/TLC042",
+    "/free-rooms?building=TLC&week=15&day=Tuesday&start=14:00",
+    "/staff",
+    f"/changes?since={EARLIER_VERSION}",
+])
+def test_no_snapshot(make_app, path):
+    status, _ = get_response(make_app(None), "GET", path)
+    assert status == 503
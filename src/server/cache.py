@@ -0,0 +1,264 @@
+'''
+Cache backends used by `Scraper` (and hence the servers) to avoid re-scraping the same data.
+
+- `MemoryCache` --> a `dict` in the current process. Each server worker process gets its own copy. It holds at most
+  `max_entries` values, dropping the least recently used ones beyond that.
+- `SQLiteCache` --> an SQLite database file in WAL mode. Every worker process on the host that points at the same
+  file shares the same cached timetables, module catalog and building data, so each piece of data is only scraped once.
+  Expired rows are swept out every `SWEEP_EVERY` writes.
+
+Some keys are chosen by clients (e.g. the digest of the modules of a `/clash-matrix` request), so anything cached under
+one of those has to be given a finite `ttl` too - a `SQLiteCache` only ever drops rows that have expired.
+
+`cache_from_environment` picks between them using the `APP_CACHE_BACKEND`, `APP_CACHE_PATH` and `APP_CACHE_MAX_ENTRIES` environment variables.
+'''
+
+import os
+import abc
+import time
+import hashlib
+import pickle
+import sqlite3
+import threading
+import collections
+
+import metrics
+
+# Returned by `CacheBackend.get` when there's nothing (valid) stored under a key.
+# This is used rather than `None` so that `None` itself can be cached.
+MISSING = object()
+
+# The most values a `MemoryCache` holds by default - enough for every module's timetable (see `batch.py`) with plenty to spare.
+DEFAULT_MAX_ENTRIES = 20_000
+
+# How many writes a `SQLiteCache` makes between sweeps of its expired rows.
+SWEEP_EVERY = 1000
+
+# ============================================================
+
+def record_lookup(key:'str', hit:'bool') -> 'None':
+    ''' Counts a cache hit or miss in `metrics.CACHE_LOOKUPS`. Keys are labelled by the kind of data, i.e. the part before the first `:` (e.g. `"timetable"`). '''
+    metrics.CACHE_LOOKUPS.inc(kind=key.split(":")[0], result="hit" if hit else "miss")
+
+# ----------
+
+def get_module_codes_digest(module_codes:'list[str]') -> 'str':
+    ''' A short hash of a set of module codes, for cache keys - the same whatever order (or however many times) each code is in `module_codes`. '''
+    return hashlib.sha256("\n".join(sorted(set(module_codes))).encode("utf-8")).hexdigest()[:16]
+
+# ============================================================
+
+class CacheBackend(abc.ABC):
+    '''
+    The interface that every cache backend implements. A backend that's missing any of the abstract methods can't be created.
+
+    Values can be anything that can be pickled. `ttl` is the number of seconds a value stays valid for; `None` means forever.
+    '''
+
+    @abc.abstractmethod
+    def get(self, key:'str', default:'object' = MISSING) -> 'object':
+        ''' Returns the value stored under `key`, or `default` if there isn't one (or it's expired). '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set(self, key:'str', value:'object', ttl:'float|None' = None) -> 'None':
+        ''' Stores `value` under `key`, replacing whatever was there before. '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, key:'str') -> 'None':
+        ''' Removes `key` from the cache (if it's there). '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self) -> 'None':
+        ''' Removes everything from the cache. '''
+        raise NotImplementedError
+
+    # ----------
+
+    def get_or_set(self, key:'str', func:'callable', ttl:'float|None' = None) -> 'object':
+        '''
+        Returns the value stored under `key`.
+        If there isn't one, `func()` is called and its return value is stored under `key` (and returned).
+        '''
+        value = self.get(key)
+
+        if value is MISSING:
+            value = func()
+            self.set(key, value, ttl)
+
+        return value
+
+# ============================================================
+
+class MemoryCache(CacheBackend):
+    '''
+    Stores values in a `dict` in the current process - at most `max_entries` of them, the least recently used being dropped
+    to make room for new ones.
+
+    NB: the values themselves are stored (not copies), so don't mutate anything returned by `get`.
+    '''
+
+    def __init__(self, max_entries:'int' = DEFAULT_MAX_ENTRIES) -> 'None':
+        self.max_entries = max_entries
+
+        # key --> [expiry timestamp or None, value], least recently used first
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def get(self, key:'str', default:'object' = MISSING) -> 'object':
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                record_lookup(key, False)
+                return default
+
+            expires_at, value = entry
+            if (expires_at is not None) and (expires_at < time.time()):
+                del self.entries[key]
+                record_lookup(key, False)
+                return default
+
+            self.entries.move_to_end(key)
+            record_lookup(key, True)
+            return value
+
+    def set(self, key:'str', value:'object', ttl:'float|None' = None) -> 'None':
+        expires_at = None if (ttl is None) else time.time() + ttl
+        with self.lock:
+            self.entries[key] = [expires_at, value]
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key:'str') -> 'None':
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> 'None':
+        with self.lock:
+            self.entries.clear()
+
+# ============================================================
+
+class SQLiteCache(CacheBackend):
+    '''
+    Stores pickled values in an SQLite database at `path`.
+
+    The database is put into WAL mode, which lets any number of processes read from it while one of them is writing.
+    So several server workers can point at the same file and share what's been scraped.
+
+    Rows are only checked for expiry when they're read, so every `SWEEP_EVERY` writes (by this process) the expired ones are
+    deleted - otherwise rows under keys that are never asked for again would stay in the file for ever.
+
+    ---
+
+    ### Parameters:
+    - `path` (required) --> the path of the database file. It's created if it doesn't exist.
+    '''
+
+    def __init__(self, path:'str') -> 'None':
+        self.path = path
+
+        # the number of writes since the last sweep of expired rows (see `self.set`)
+        self.writes = 0
+        self.writes_lock = threading.Lock()
+
+        # SQLite connections can't be shared between threads (or processes), so each thread gets its own.
+        self.local = threading.local()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key        TEXT PRIMARY KEY,
+                value      BLOB NOT NULL,
+                expires_at REAL
+            )
+        """)
+
+    # ----------
+
+    def connection(self) -> 'sqlite3.Connection':
+        ''' Returns the connection belonging to the current thread (and process), opening one if needed. '''
+
+        # the pid is checked so that a connection opened before the server forks its workers isn't reused in them
+        pid, connection = getattr(self.local, "connection", (None, None))
+
+        if pid != os.getpid():
+            # `isolation_level=None` --> each statement is committed straight away
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = (os.getpid(), connection)
+
+        return connection
+
+    # ----------
+
+    def get(self, key:'str', default:'object' = MISSING) -> 'object':
+        row = self.connection().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            record_lookup(key, False)
+            return default
+
+        value, expires_at = row
+        if (expires_at is not None) and (expires_at < time.time()):
+            self.delete(key)
+            record_lookup(key, False)
+            return default
+
+        record_lookup(key, True)
+        return pickle.loads(value)
+
+    def set(self, key:'str', value:'object', ttl:'float|None' = None) -> 'None':
+        expires_at = None if (ttl is None) else time.time() + ttl
+        self.connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at),
+        )
+
+        with self.writes_lock:
+            self.writes += 1
+            sweep = self.writes >= SWEEP_EVERY
+            if sweep:
+                self.writes = 0
+
+        if sweep:
+            self.sweep()
+
+    def sweep(self) -> 'None':
+        ''' Deletes every expired row. '''
+        self.connection().execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key:'str') -> 'None':
+        self.connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> 'None':
+        self.connection().execute("DELETE FROM cache")
+
+# ============================================================
+
+def cache_from_environment() -> 'CacheBackend':
+    '''
+    Returns the cache backend chosen by the environment variables:
+    - `APP_CACHE_BACKEND` --> either `"memory"` (the default) or `"sqlite"`.
+    - `APP_CACHE_PATH` --> the database file used by `"sqlite"`. Defaults to `"scraper_cache.sqlite3"`.
+    - `APP_CACHE_MAX_ENTRIES` --> the most values `"memory"` holds. Defaults to `DEFAULT_MAX_ENTRIES`.
+    '''
+
+    backend = os.environ.get("APP_CACHE_BACKEND", "memory")
+
+    if backend == "memory":
+        return MemoryCache(int(os.environ.get("APP_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)))
+
+    elif backend == "sqlite":
+        return SQLiteCache(os.environ.get("APP_CACHE_PATH", "scraper_cache.sqlite3"))
+
+    else:
+        raise ValueError(f"Unknown APP_CACHE_BACKEND: {backend!r}")
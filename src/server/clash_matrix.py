@@ -0,0 +1,186 @@
+'''
+Which pairs of a set of modules (e.g. a department's optional modules) can be taken together, computed for all of them at once.
+
+Each module's occupancy bitmap (see `occupancy.py`) is built once, from its timetable - got with `batch.get_module_activities`,
+so that a department's hundreds of modules are requested in as few reports as fit in a URL, and each module is cached on its own -
+and then every pair of bitmaps is AND-ed and counted. With `numpy` installed, the bitmaps are unpacked into a 0/1 matrix
+`B` (one row per module, one column per slot in which any of them is on) and every pair is counted at once, as `B @ B.T`.
+Otherwise each pair's `int`s are AND-ed in Python, which is slower but still only takes a few seconds for hundreds of modules.
+
+```python
+matrix = get_clash_matrix(scraper, get_department_module_codes(scraper.get_module_timetable_url_parameters(), "COMP"))
+matrix.get_clash_minutes("COMP2221", "COMP2261")    # 0 --> they can be taken together
+matrix.to_csv()
+```
+
+Matrices are cached (in `scraper.cache`) per set of modules and per snapshot version, so each one is only computed once per snapshot
+(at least, once a day - `CACHE_TTLS["derived"]` - as the sets are chosen by clients, and there's no end to them).
+'''
+
+import io
+import csv
+
+import occupancy
+import batch
+from cache import MISSING, get_module_codes_digest
+from scraper import CACHE_TTLS
+
+# ============================================================
+
+class ClashMatrix:
+    '''
+    How long each pair of `module_codes` clash for over the year.
+
+    ---
+
+    ### Parameters:
+    - `module_codes` (required) --> the modules (sorted), in the order of the rows (and columns) of `minutes`.
+    - `minutes` (required) --> `minutes[i][j]` is the number of minutes in which both `module_codes[i]` and `module_codes[j]` have
+    something on (so 0 if they can be taken together). `minutes[i][i]` is the number of minutes `module_codes[i]` has something on.
+    - `version` (optional) --> the version of the snapshot the timetables came from, or `None` if they were scraped.
+    '''
+
+    def __init__(self, module_codes:'list[str]', minutes:'list[list[int]]', version:'str' = None) -> 'None':
+        self.module_codes = module_codes
+        self.minutes = minutes
+        self.version = version
+
+        self.indexes = {code: i for i, code in enumerate(module_codes)}
+
+    # ----------
+
+    def get_clash_minutes(self, module_code_a:'str', module_code_b:'str') -> 'int':
+        return self.minutes[self.indexes[module_code_a]][self.indexes[module_code_b]]
+
+    # ----------
+
+    def get_clashing_pairs(self) -> 'list[tuple[str, str, int]]':
+        ''' Every pair of (different) modules that clash, and for how many minutes - e.g. `[("COMP2221", "COMP2261", 600), ...]`. '''
+        return [
+            (self.module_codes[i], self.module_codes[j], self.minutes[i][j])
+            for i in range(len(self.module_codes)) for j in range(i + 1, len(self.module_codes))
+            if self.minutes[i][j] > 0
+        ]
+
+    # ----------
+
+    def to_dict(self) -> 'dict':
+        return {"Version": self.version, "Modules": self.module_codes, "Clash Minutes": self.minutes}
+
+    # ----------
+
+    def to_csv(self) -> 'str':
+        ''' The matrix as CSV, with a header row and a header column of module codes. '''
+
+        f = io.StringIO()
+        writer = csv.writer(f)
+        writer.writerow(["Module"] + self.module_codes)
+        for code, row in zip(self.module_codes, self.minutes):
+            writer.writerow([code] + row)
+
+        return f.getvalue()
+
+# ============================================================
+
+def get_module_bitmaps(module_codes:'list[str]', activities:'list[dict]') -> 'list[int]':
+    ''' The occupancy bitmap of each of `module_codes` (the union of those of its activities), in the same order. '''
+
+    bitmaps = {code: 0 for code in module_codes}
+    for activity in activities:
+        if activity["Module"] in bitmaps:
+            bitmaps[activity["Module"]] |= occupancy.get_activity_bitmap(activity)
+
+    return list(bitmaps.values())
+
+# ----------
+
+def count_overlaps(bitmaps:'list[int]') -> 'list[list[int]]':
+    ''' `counts[i][j]` is the number of slots set in both `bitmaps[i]` and `bitmaps[j]`. Uses `numpy` if it's installed. '''
+
+    # (imported here rather than at the top, as it takes longer to import than the servers do - see `benchmarks/test_import_time.py`)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if (numpy is None) or (len(bitmaps) == 0):
+        counts = [[0] * len(bitmaps) for _ in bitmaps]
+        for i, bitmap_a in enumerate(bitmaps):
+            for j in range(i, len(bitmaps)):
+                counts[i][j] = counts[j][i] = occupancy.popcount(bitmap_a & bitmaps[j])
+        return counts
+
+    data = numpy.frombuffer(b"".join(occupancy.to_bytes(bitmap) for bitmap in bitmaps), dtype=numpy.uint8).reshape(len(bitmaps), occupancy.BYTES)
+
+    # most of the year (nights, weekends, holidays) is empty for every module, so those bytes are dropped before unpacking
+    data = data[:, data.any(axis=0)]
+    bits = numpy.unpackbits(data, axis=1).astype(numpy.float32)
+
+    # (exact, as the counts are at most `occupancy.BITS`, well within the integers a float32 can hold)
+    return (bits @ bits.T).round().astype(numpy.int64).tolist()
+
+# ----------
+
+def compute_clash_matrix(module_codes:'list[str]', activities:'list[dict]', version:'str' = None) -> 'ClashMatrix':
+    ''' The `ClashMatrix` of `module_codes`, from `activities` (as returned by `Scraper.get_module_timetable(module_codes, "list")`). '''
+
+    # (sorted, so that the same modules always give the same matrix, whatever order they're asked for in)
+    module_codes = sorted(set(module_codes))
+    counts = count_overlaps(get_module_bitmaps(module_codes, activities))
+
+    minutes = [[count * occupancy.PERIOD_MINUTES for count in row] for row in counts]
+    return ClashMatrix(module_codes, minutes, version)
+
+# ============================================================
+
+def get_clash_matrix_cache_key(module_codes:'list[str]', version:'str|None') -> 'str':
+    digest = get_module_codes_digest(module_codes)
+    return f"clash matrix:{version or 'live'}:{digest}"
+
+# ----------
+
+def get_clash_matrix(scraper:'Scraper', module_codes:'list[str]', in_flight:'batch.InFlight' = None) -> 'ClashMatrix':
+    '''
+    Returns the `ClashMatrix` of `module_codes`, from `scraper.cache` if it's already been computed.
+
+    A matrix computed from a snapshot is cached for a day (the snapshot never changes, but there's no end to the sets of modules
+    clients can ask for), and one computed from scraped timetables for as long as the timetables are.
+
+    `in_flight` is the server's `batch.InFlight`, so that the modules' timetables are shared with anything else getting them at the same time.
+    '''
+
+    version = scraper.get_snapshot_version(module_codes)
+    cache_key = get_clash_matrix_cache_key(module_codes, version)
+
+    matrix = scraper.cache.get(cache_key)
+    if matrix is MISSING:
+        modules = batch.get_module_activities(scraper, sorted(set(module_codes)), in_flight or batch.InFlight())
+        matrix = compute_clash_matrix(module_codes, [activity for activities in modules.values() for activity in activities], version)
+        scraper.cache.set(cache_key, matrix, CACHE_TTLS["derived"] if (version is not None) else CACHE_TTLS["timetable"])
+
+    return matrix
+
+# ----------
+
+async def get_clash_matrix_async(scraper:'Scraper', module_codes:'list[str]', in_flight:'batch.InFlight' = None, executor:'concurrent.futures.Executor' = None) -> 'ClashMatrix':
+    ''' The same as `get_clash_matrix`, but the timetables are got with `batch.get_module_activities_async`, and the matrix is computed in `executor`. '''
+
+    import asyncio
+
+    version = scraper.get_snapshot_version(module_codes)
+    cache_key = get_clash_matrix_cache_key(module_codes, version)
+
+    matrix = scraper.cache.get(cache_key)
+    if matrix is MISSING:
+        modules = await batch.get_module_activities_async(scraper, sorted(set(module_codes)), in_flight or batch.InFlight(), executor)
+        activities = [activity for activities in modules.values() for activity in activities]
+        matrix = await asyncio.get_running_loop().run_in_executor(executor, compute_clash_matrix, module_codes, activities, version)
+        scraper.cache.set(cache_key, matrix, CACHE_TTLS["derived"] if (version is not None) else CACHE_TTLS["timetable"])
+
+    return matrix
+
+# ----------
+
+def get_department_module_codes(params:'dict', department:'str') -> 'list[str]':
+    ''' Every module code in the catalog (`params`, from `Scraper.get_module_timetable_url_parameters`) that starts with `department` (e.g. `"COMP"`). '''
+    return [code for _, code in params["Select Module(s) to View:"] if code.startswith(department.upper())]
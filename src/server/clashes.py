@@ -0,0 +1,89 @@
+'''
+Clash detection: which of a student's activities take place at the same time, and on which dates.
+
+Every occurrence of every activity (i.e. each of its "Dates", from its "Start" until its "End") is sorted by date and start time,
+and then swept once. The occurrences that are still going on at the start of each one are kept in a heap ordered by when they end,
+so the ones that have finished are dropped as the sweep passes them. Whatever is left in the heap overlaps the new occurrence.
+That's O(n log n) in the number of occurrences (plus the number of clashes found), rather than comparing every pair of them.
+
+```python
+find_clashes(scraper.get_module_timetable(["COMP2221", "COMP2261"], "list"))
+```
+'''
+
+import heapq
+import collections
+
+# ============================================================
+
+def find_clashes(activities:'list[dict]', include_same_module:'bool' = False) -> 'list[dict]':
+    '''
+    Returns every pair of `activities` that overlap, with the dates they overlap on:
+
+    ```python
+    [
+        {
+            "Activities": [{...}, {...}],   # the two activities, without their "Dates"
+            "Dates": ["2022-10-04", ...],   # the dates on which they overlap
+            "Start": "10:00:00",            # when the overlap starts...
+            "End": "11:00:00",              # ...and ends
+        },
+        ...
+    ]
+    ```
+
+    Sorted by the first date of each clash.
+
+    ---
+
+    ### Parameters:
+    - `activities` (required) --> as returned by `Scraper.get_module_timetable(..., "list")`.
+    - `include_same_module` (optional) --> if `True`, activities of the same module that overlap are included too. They're left out by
+    default, as they're usually alternatives (e.g. two workshop groups) of which a student only goes to one.
+    '''
+
+    # (date, start, end, index of the activity) for every occurrence of every activity
+    occurrences = sorted(
+        (date, activity["Start"], activity["End"], index)
+        for index, activity in enumerate(activities)
+        for date in activity["Dates"]
+    )
+
+    # (index of the activity, index of the other activity) --> the dates they overlap on
+    clash_dates = collections.defaultdict(list)
+
+    current_date = None
+    ongoing = []    # heap of (end, index) of the occurrences on `current_date` that have started
+
+    for date, start, end, index in occurrences:
+        if date != current_date:
+            current_date = date
+            ongoing = []
+
+        # the times are all "HH:MM:SS", so they can be compared as strings
+        while ongoing and ongoing[0][0] <= start:
+            heapq.heappop(ongoing)
+
+        for _, other_index in ongoing:
+            if include_same_module or (activities[other_index]["Module"] != activities[index]["Module"]):
+                clash_dates[(other_index, index)].append(date)
+
+        heapq.heappush(ongoing, (end, index))
+
+    clashes = []
+    for (index_a, index_b), dates in clash_dates.items():
+        activity_a, activity_b = activities[index_a], activities[index_b]
+        clashes.append({
+            "Activities": [without_dates(activity_a), without_dates(activity_b)],
+            "Dates": dates,
+            "Start": max(activity_a["Start"], activity_b["Start"]),
+            "End": min(activity_a["End"], activity_b["End"]),
+        })
+
+    clashes.sort(key = lambda clash: (clash["Dates"][0], clash["Start"]))
+    return clashes
+
+# ----------
+
+def without_dates(activity:'dict') -> 'dict':
+    return {key: value for key, value in activity.items() if key != "Dates"}
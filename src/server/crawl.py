@@ -0,0 +1,221 @@
+'''
+Crawls the timetable of every module into a snapshot (see `snapshot.py`), so that the servers can serve timetables without scraping them on demand.
+
+```
+python crawl.py --snapshot-dir snapshots --workers 4 --rate 2
+APP_SNAPSHOT_DIR=snapshots python server.py
+```
+
+The snapshot is written both as JSON and in the binary format the servers memory-map (see `mapped_snapshot.py`).
+
+- The module codes come from `Scraper.get_module_timetable_url_parameters`.
+- The codes are batched into combined `objectstr` queries (one report for many modules), each batch being as big as it can be
+without its URL going over `--max-url-length`.
+- The batches are requested by `--workers` threads, sharing a token bucket that lets through at most `--rate` requests per second.
+A batch that fails (see `UpstreamError`) is retried a few times before the crawl gives up.
+- Each finished batch is written to `--checkpoint-dir` straight away. If the crawl is interrupted, running it again skips the
+batches already in there. Once every module has been crawled the snapshot is written and the checkpoints are deleted.
+'''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import concurrent.futures
+
+from scraper import Scraper, UpstreamError, WEEK_PATTERNS, REPORT_STYLE_PARSERS, MAX_URL_LENGTH
+from snapshot import Snapshot, new_version
+from mapped_snapshot import write_mapped
+from credential_validator import TokenBucket
+from env import load_environment_variables, auth
+
+# how many times a failed batch is retried, and how long to wait before the first retry (doubled each time)
+RETRIES = 4
+RETRY_BACKOFF_SECONDS = 2
+
+# ============================================================
+
+class Crawl:
+    '''
+    Crawls the timetables of `module_codes` with `scraper`.
+
+    ---
+
+    ### Parameters:
+    - `scraper` (required) --> the `Scraper` used to request and parse the reports.
+    - `module_codes` (required) --> every module code to crawl.
+    - `checkpoint_dir` (required) --> where finished batches are written, so that an interrupted crawl can be resumed.
+    - `workers` (optional) --> the number of batches requested at once.
+    - `rate` (optional) --> the most requests per second to make of the upstream server.
+    - `max_url_length` (optional) --> the longest a batch's URL is allowed to be.
+    - `max_batch_size` (optional) --> the most modules in a batch, whatever the length of its URL.
+    '''
+
+    def __init__(self, scraper:'Scraper', module_codes:'list[str]', checkpoint_dir:'str', workers:'int' = 4, rate:'float' = 2, max_url_length:'int' = MAX_URL_LENGTH, max_batch_size:'int' = None) -> 'None':
+        self.scraper = scraper
+        self.module_codes = list(dict.fromkeys(module_codes))
+        self.checkpoint_dir = checkpoint_dir
+        self.workers = workers
+        self.max_url_length = max_url_length
+        self.max_batch_size = max_batch_size
+
+        self.bucket = TokenBucket(max(1, rate), rate)
+
+        # module code --> activities, for every module crawled so far (including those loaded from checkpoints)
+        self.modules = dict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def get_checkpoint_path(self, batch:'list[str]') -> 'str':
+        digest = hashlib.sha256("\n".join(batch).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.checkpoint_dir, digest + ".json")
+
+    # ----------
+
+    def load_checkpoints(self) -> 'None':
+        ''' Adds the modules of every batch finished by an earlier (interrupted) crawl to `self.modules`. '''
+
+        if not os.path.isdir(self.checkpoint_dir):
+            return
+
+        for name in os.listdir(self.checkpoint_dir):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.checkpoint_dir, name), "r", encoding="utf-8") as f:
+                self.modules.update(json.load(f))
+
+    # ----------
+
+    def write_checkpoint(self, batch:'list[str]', modules:'dict[str, list[dict]]') -> 'None':
+        path = self.get_checkpoint_path(batch)
+
+        # written to a temporary file first, so that a crawl killed part way through writing doesn't leave half a checkpoint behind
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(modules, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    # ----------
+
+    def wait_for_token(self) -> 'None':
+        while (wait := self.bucket.take()) > 0:
+            time.sleep(wait)
+
+    # ----------
+
+    def crawl_batch(self, batch:'list[str]') -> 'dict[str, list[dict]]':
+        ''' Requests and parses the report of `batch`, and returns each module's activities (an empty `list` if it has none). '''
+
+        url = self.scraper.get_module_timetable_url(batch)
+
+        # (each retry waits for a token too)
+        def request() -> 'str':
+            self.wait_for_token()
+            return self.scraper.handle_request(url)
+
+        response_text = with_retries(request)
+
+        activities = Scraper.get_report_style_parser(self.scraper.report_style)(response_text, "list")
+
+        modules = {code: [] for code in batch}
+        for activity in activities:
+            modules.setdefault(activity["Module"], []).append(activity)
+
+        self.write_checkpoint(batch, modules)
+
+        return modules
+
+    # ----------
+
+    def run(self) -> 'dict[str, list[dict]]':
+        ''' Crawls every module that isn't already in a checkpoint, and returns the activities of every module. '''
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.load_checkpoints()
+
+        remaining = [code for code in self.module_codes if code not in self.modules]
+        batches = self.scraper.get_module_batches(remaining, self.max_url_length, self.max_batch_size)
+
+        print(f"{len(self.modules)} modules already crawled, {len(remaining)} to go in {len(batches)} batches")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+            futures = [executor.submit(self.crawl_batch, batch) for batch in batches]
+
+            for number, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                modules = future.result()
+                with self.lock:
+                    self.modules.update(modules)
+                print(f"batch {number}/{len(batches)} done ({len(self.modules)}/{len(self.module_codes)} modules)")
+
+        return self.modules
+
+# ============================================================
+
+def with_retries(func:'callable', *args) -> 'object':
+    ''' Returns `func(*args)`, retrying (after a backoff) up to `RETRIES` times if it raises an `UpstreamError`. '''
+
+    for attempt in range(RETRIES + 1):
+        try:
+            return func(*args)
+        except UpstreamError:
+            if attempt == RETRIES:
+                raise
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+# ----------
+
+def main() -> 'None':
+    parser = argparse.ArgumentParser(description="Crawls the timetable of every module into a snapshot.")
+    parser.add_argument("--snapshot-dir", default="snapshots", help="where to write the snapshot (see snapshot.py)")
+    parser.add_argument("--checkpoint-dir", default=None, help="where to keep the progress of the crawl (defaults to <snapshot-dir>/checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="the number of reports requested at once")
+    parser.add_argument("--rate", type=float, default=2, help="the most requests per second to make of the upstream server")
+    parser.add_argument("--max-url-length", type=int, default=MAX_URL_LENGTH, help="the longest a report's URL is allowed to be")
+    parser.add_argument("--max-batch-size", type=int, default=None, help="the most modules in one report")
+    parser.add_argument("--report-style", choices=["auto", *REPORT_STYLE_PARSERS], default="auto", help="the style of report to request (auto picks the cheapest)")
+    args = parser.parse_args()
+
+    load_environment_variables()
+    scraper = Scraper(*auth())
+
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.snapshot_dir, "checkpoint")
+
+    start = time.perf_counter()
+
+    params = with_retries(scraper.get_module_timetable_url_parameters)
+    module_codes = [code for _, code in params["Select Module(s) to View:"]]
+
+    scraper.configure_report_style(args.report_style)
+
+    crawl = Crawl(scraper, module_codes, checkpoint_dir, args.workers, args.rate, args.max_url_length, args.max_batch_size)
+    modules = crawl.run()
+
+    # everything else the servers (and `store.TimetableStore`) need, so that they don't have to scrape anything - see `snapshot.PAGE_KEYS`
+    pages = {
+        "catalog": params,
+        "building codes": with_retries(scraper.get_building_codes),
+        "building location urls": with_retries(scraper.get_building_locations_urls),
+        "week patterns": WEEK_PATTERNS,
+    }
+
+    metadata = {
+        "Report Style": scraper.report_style,
+        "Modules": len(modules),
+        "Activities": sum(len(activities) for activities in modules.values()),
+        "Crawl Seconds": round(time.perf_counter() - start, 1),
+    }
+
+    snapshot = Snapshot(new_version(), modules, metadata, pages)
+    write_mapped(snapshot, args.snapshot_dir)
+    # (written last, as it makes the snapshot the latest one)
+    path = snapshot.write(args.snapshot_dir)
+
+    shutil.rmtree(checkpoint_dir)
+
+    print(f"Wrote {path}: {metadata}")
+
+if __name__ == "__main__":
+    main()
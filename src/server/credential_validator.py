@@ -0,0 +1,185 @@
+'''
+Sits in front of `Scraper.user_credentials_are_valid` so that bursts of logins don't turn into bursts of requests to
+https://www.dur.ac.uk/directory/password/.
+
+- Successful validations are cached for a short time. The cache key is a salted hash of the username and password,
+  so the plaintext password is never stored (not even in a shared `cache.SQLiteCache`).
+- Upstream checks are rate limited, both per username and overall. Once a limit is hit, `CredentialValidator.validate`
+  raises `RateLimited` rather than making the request.
+'''
+
+import os
+import time
+import hmac
+import hashlib
+import threading
+
+from cache import MISSING
+
+# How long (in seconds) a successful validation is remembered for.
+VALIDATION_TTL = 5 * 60
+
+# ============================================================
+
+class RateLimited(Exception):
+    ''' Raised by `CredentialValidator.validate` when a rate limit has been hit. `retry_after` is the number of seconds until a request would be allowed. '''
+
+    def __init__(self, retry_after:'float') -> 'None':
+        super().__init__(f"Too many login attempts. Try again in {retry_after:.0f} seconds.")
+        self.retry_after = retry_after
+
+# ============================================================
+
+class TokenBucket:
+    '''
+    A token bucket rate limiter: holds up to `capacity` tokens, and gains `rate` tokens per second.
+    Each request takes a token; if there isn't one, the request isn't allowed.
+    '''
+
+    def __init__(self, capacity:'float', rate:'float') -> 'None':
+        self.capacity = capacity
+        self.rate = rate
+
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def take(self) -> 'float':
+        '''
+        Takes a token if there is one and returns `0`.
+        Otherwise returns the number of seconds until there will be one.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    # ----------
+
+    def give_back(self) -> 'None':
+        ''' Returns a token taken by `self.take` - e.g. when the request it was taken for wasn't allowed after all. '''
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+# ============================================================
+
+class CredentialValidator:
+    '''
+    Validates CIS credentials using `scraper`, with caching and rate limiting (see the top of this file).
+
+    ---
+
+    ### Parameters:
+    - `scraper` (required) --> the `Scraper` whose `user_credentials_are_valid` method does the actual check.
+    - `cache` (optional) --> the `cache.CacheBackend` that successful validations are stored in. Defaults to `scraper.cache`.
+    - `salt` (optional) --> the salt for the credential hashes. Defaults to the `APP_VALIDATION_SALT` environment variable.
+        - Server worker processes sharing a cache need to share the salt too. If neither is set, a random salt is used,
+        which means cached validations only work within the current process.
+    - `per_user_limit` (optional) --> the number of upstream checks allowed per username per minute.
+    - `global_limit` (optional) --> the number of upstream checks allowed overall per minute.
+    '''
+
+    def __init__(self, scraper:'Scraper', cache:'CacheBackend' = None, salt:'str' = None, per_user_limit:'int' = 5, global_limit:'int' = 60) -> 'None':
+        self.scraper = scraper
+        self.cache = cache if (cache is not None) else scraper.cache
+
+        salt = salt or os.environ.get("APP_VALIDATION_SALT")
+        self.salt = salt.encode("utf-8") if salt else os.urandom(16)
+
+        self.per_user_limit = per_user_limit
+        self.global_bucket = TokenBucket(global_limit, global_limit / 60)
+
+        # username --> `TokenBucket`. Kept in memory rather than in `self.cache` because it's updated on every attempt.
+        self.user_buckets = dict()
+        self.user_buckets_lock = threading.Lock()
+
+    # ----------
+
+    def get_cache_key(self, username:'str', password:'str') -> 'str':
+        ''' Returns the key under which a successful validation of `username` and `password` is cached - an HMAC of them, so neither can be read back out of the cache. '''
+        digest = hmac.new(self.salt, (username + "\0" + password).encode("utf-8"), hashlib.sha256).hexdigest()
+        return "validation:" + digest
+
+    # ----------
+
+    def get_user_bucket(self, username:'str') -> 'TokenBucket':
+        with self.user_buckets_lock:
+
+            # a bucket that hasn't been touched for a minute has refilled completely, so it's no different to a new one.
+            # these are thrown away every so often so that `self.user_buckets` doesn't grow forever.
+            if len(self.user_buckets) > 10_000:
+                now = time.monotonic()
+                self.user_buckets = {name: b for name, b in self.user_buckets.items() if now - b.last_refill < 60}
+
+            bucket = self.user_buckets.get(username)
+            if bucket is None:
+                bucket = TokenBucket(self.per_user_limit, self.per_user_limit / 60)
+                self.user_buckets[username] = bucket
+            return bucket
+
+    # ----------
+
+    def check_rate_limits(self, username:'str') -> 'None':
+        ''' Raises `RateLimited` if either the per-user or global limit has been hit. '''
+
+        user_bucket = self.get_user_bucket(username)
+
+        retry_after = user_bucket.take()
+        if retry_after:
+            raise RateLimited(retry_after)
+
+        # (a request turned away by the global limit doesn't count against the user's own limit)
+        retry_after = self.global_bucket.take()
+        if retry_after:
+            user_bucket.give_back()
+            raise RateLimited(retry_after)
+
+    # ----------
+
+    def validate(self, username:'str', password:'str') -> 'bool':
+        '''
+        Returns `True` if `username` and `password` are valid CIS credentials.
+
+        Raises `RateLimited` if the credentials haven't been validated recently and the upstream check is rate limited.
+        '''
+
+        cache_key = self.get_cache_key(username, password)
+        if self.cache.get(cache_key) is not MISSING:
+            return True
+
+        self.check_rate_limits(username)
+
+        is_valid = self.scraper.user_credentials_are_valid(username, password)
+
+        # only successes are cached - otherwise someone could be locked out for `VALIDATION_TTL` by a typo
+        if is_valid:
+            self.cache.set(cache_key, True, VALIDATION_TTL)
+
+        return is_valid
+
+    # ----------
+
+    async def validate_async(self, username:'str', password:'str') -> 'bool':
+        ''' Awaitable version of `self.validate`. '''
+
+        cache_key = self.get_cache_key(username, password)
+        if self.cache.get(cache_key) is not MISSING:
+            return True
+
+        self.check_rate_limits(username)
+
+        is_valid = await self.scraper.user_credentials_are_valid_async(username, password)
+
+        if is_valid:
+            self.cache.set(cache_key, True, VALIDATION_TTL)
+
+        return is_valid
@@ -0,0 +1,276 @@
+'''
+Exports every activity in a snapshot (see `snapshot.py`), and every occurrence of each, as columnar Parquet or Arrow files - e.g. for
+analysing room utilisation across the whole university in pandas, Polars or DuckDB.
+
+```
+python export.py --snapshot-dir snapshots --output-dir exports --format parquet
+```
+
+Three tables are written to `<output-dir>/<snapshot version>/`, laid out like the tables of `store.py`:
+
+- `activities` --> one row per activity: `activity_id`, `module`, `activity`, `description`, `day_of_week`, `start`, `end` (`time32`),
+`duration_minutes`, `room` (as in the timetables, e.g. `"D/CG91, D/CG93"`), `staff` and `planned_size`.
+- `occurrences` --> one row per occurrence of an activity *in each of its rooms*: `activity_id`, `module`, `date` (`date32`), `start`,
+`end` (`timestamp[s]`, in UK time - Parquet has no seconds, so they're read back as `timestamp[ms]`), `room` and `building`. So the rows of a room are every time it's in use.
+- `activity_staff` --> one row per member of staff of each activity: `activity_id` and `staff` (normalised - see `staff_index.py`).
+
+The strings that repeat (module, room, building, staff...) are dictionary-encoded. Modules are read from the (memory-mapped) snapshot
+and written `--batch-size` at a time, so only one batch is ever in memory, however big the snapshot is. Needs `pyarrow`.
+'''
+
+import os
+import argparse
+import datetime
+
+from scraper import Scraper
+from cache import MISSING
+from mapped_snapshot import MappedSnapshot
+from store import split_rooms
+from staff_index import get_staff_names
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+EPOCH = datetime.date(1970, 1, 1)
+
+# ============================================================
+
+class DictionaryColumn:
+    '''
+    The values of a dictionary-encoded column, across every batch written.
+
+    The dictionary only ever grows, so each batch's dictionary starts with the last one's - which lets the Arrow writer write just
+    the new values (a "dictionary delta") with each batch, rather than the whole dictionary again.
+    '''
+
+    def __init__(self) -> 'None':
+        self.values = []
+        self.indexes = dict()
+
+    # ----------
+
+    def encode(self, value:'str|None') -> 'int|None':
+        if value is None:
+            return None
+        index = self.indexes.get(value)
+        if index is None:
+            index = self.indexes[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    # ----------
+
+    def to_array(self, indexes:'list[int|None]') -> 'pyarrow.DictionaryArray':
+        import pyarrow
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(indexes, pyarrow.int32()), pyarrow.array(self.values, pyarrow.string()))
+
+# ============================================================
+
+class Exporter:
+    '''
+    Writes the three tables (see the top of this file) to `directory`, a batch of modules at a time (see `self.write_modules`).
+
+    ---
+
+    ### Parameters:
+    - `directory` (required) --> where to write the tables.
+    - `file_format` (optional) --> one of the keys of `FORMATS`.
+    - `building_codes` (optional) --> the building codes (the keys of `Scraper.get_building_codes`), so that the building of each
+    room can be worked out. If `None`, the `building` column is empty.
+    '''
+
+    def __init__(self, directory:'str', file_format:'str' = "parquet", building_codes:'list[str]' = None) -> 'None':
+        import pyarrow
+
+        self.file_format = file_format
+        self.building_codes = building_codes
+
+        # room --> its building code (working it out isn't cheap, and the same rooms come up again and again)
+        self.buildings = dict()
+        # "YYYY-MM-DD" --> days since 1970-01-01
+        self.days = dict()
+
+        self.next_activity_id = 0
+        self.counts = {"activities": 0, "occurrences": 0, "activity_staff": 0}
+
+        self.columns = {name: DictionaryColumn() for name in ["module", "description", "day_of_week", "room", "building", "staff"]}
+
+        dictionary = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        self.schemas = {
+            "activities": pyarrow.schema([
+                ("activity_id", pyarrow.int32()),
+                ("module", dictionary),
+                ("activity", pyarrow.string()),
+                ("description", dictionary),
+                ("day_of_week", dictionary),
+                ("start", pyarrow.time32("s")),
+                ("end", pyarrow.time32("s")),
+                ("duration_minutes", pyarrow.int16()),
+                ("room", dictionary),
+                ("staff", dictionary),
+                ("planned_size", pyarrow.int32()),
+            ]),
+            "occurrences": pyarrow.schema([
+                ("activity_id", pyarrow.int32()),
+                ("module", dictionary),
+                ("date", pyarrow.date32()),
+                ("start", pyarrow.timestamp("s")),
+                ("end", pyarrow.timestamp("s")),
+                ("room", dictionary),
+                ("building", dictionary),
+            ]),
+            "activity_staff": pyarrow.schema([
+                ("activity_id", pyarrow.int32()),
+                ("staff", dictionary),
+            ]),
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self.writers = {
+            name: self.open_writer(os.path.join(directory, name + FORMATS[file_format]), schema)
+            for name, schema in self.schemas.items()
+        }
+
+    # ----------
+
+    def open_writer(self, path:'str', schema:'pyarrow.Schema') -> 'object':
+        if self.file_format == "parquet":
+            import pyarrow.parquet
+            return pyarrow.parquet.ParquetWriter(path, schema, compression="zstd")
+
+        import pyarrow.ipc
+        return pyarrow.ipc.new_file(path, schema, options=pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    # ----------
+
+    def get_building(self, room:'str') -> 'str|None':
+        if self.building_codes is None:
+            return None
+        if room not in self.buildings:
+            self.buildings[room] = Scraper.get_building_code_from_room_string(self.building_codes, room)
+        return self.buildings[room]
+
+    # ----------
+
+    def get_days(self, date:'str') -> 'int':
+        if date not in self.days:
+            self.days[date] = (datetime.date.fromisoformat(date) - EPOCH).days
+        return self.days[date]
+
+    # ----------
+
+    def write_modules(self, activities:'list[dict]') -> 'None':
+        ''' Writes `activities` (e.g. those of a batch of modules) to each table, as one batch (a row group, in Parquet). '''
+
+        import pyarrow
+
+        encode = {name: column.encode for name, column in self.columns.items()}
+
+        # table --> column --> values
+        rows = {name: {field.name: [] for field in schema} for name, schema in self.schemas.items()}
+        activity_rows, occurrence_rows, staff_rows = rows["activities"], rows["occurrences"], rows["activity_staff"]
+
+        for activity in activities:
+            activity_id = self.next_activity_id
+            self.next_activity_id += 1
+
+            module = encode["module"](activity["Module"])
+            start = get_seconds(activity["Start"])
+            end = get_seconds(activity["End"])
+            staff_names = get_staff_names(activity["Staff"])
+
+            activity_rows["activity_id"].append(activity_id)
+            activity_rows["module"].append(module)
+            activity_rows["activity"].append(activity["Activity"])
+            activity_rows["description"].append(encode["description"](activity["Description"] or None))
+            activity_rows["day_of_week"].append(encode["day_of_week"](activity["Day Of The Week"]))
+            activity_rows["start"].append(start)
+            activity_rows["end"].append(end)
+            activity_rows["duration_minutes"].append((end - start) // 60)
+            activity_rows["room"].append(encode["room"](activity["Room"].strip() or None))
+            activity_rows["staff"].append(encode["staff"](", ".join(staff_names) or None))
+            activity_rows["planned_size"].append(int(activity["Planned Size"]) if activity["Planned Size"].strip().isdigit() else None)
+
+            # (an activity with no room still takes place, so it gets one row with no room)
+            rooms = [(encode["room"](room), encode["building"](self.get_building(room))) for room in split_rooms(activity["Room"])] or [(None, None)]
+
+            for date in activity["Dates"]:
+                midnight = self.get_days(date) * 86400
+                for room, building in rooms:
+                    occurrence_rows["activity_id"].append(activity_id)
+                    occurrence_rows["module"].append(module)
+                    occurrence_rows["date"].append(self.get_days(date))
+                    occurrence_rows["start"].append(midnight + start)
+                    occurrence_rows["end"].append(midnight + end)
+                    occurrence_rows["room"].append(room)
+                    occurrence_rows["building"].append(building)
+
+            for name in staff_names:
+                staff_rows["activity_id"].append(activity_id)
+                staff_rows["staff"].append(encode["staff"](name))
+
+        for name, schema in self.schemas.items():
+            arrays = [
+                self.columns[field.name].to_array(rows[name][field.name]) if pyarrow.types.is_dictionary(field.type)
+                else pyarrow.array(rows[name][field.name], field.type)
+                for field in schema
+            ]
+            self.writers[name].write_batch(pyarrow.record_batch(arrays, schema=schema))
+            self.counts[name] += len(rows[name]["activity_id"])
+
+    # ----------
+
+    def close(self) -> 'None':
+        for writer in self.writers.values():
+            writer.close()
+
+# ============================================================
+
+def get_seconds(time_string:'str') -> 'int':
+    ''' e.g. `32400` from `"09:00:00"` (or `"09:00"`) - the number of seconds since midnight. '''
+    parts = [int(part) for part in time_string.split(":")]
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+# ----------
+
+def export_snapshot(snapshot:'Snapshot|MappedSnapshot|TimetableStore', directory:'str', file_format:'str' = "parquet", batch_size:'int' = 200) -> 'dict[str, int]':
+    ''' Writes the tables of every module in `snapshot` to `directory` (see the top of this file), and returns the number of rows in each. '''
+
+    building_codes = snapshot.get_page("building codes")
+    building_codes = None if (building_codes is MISSING) else list(building_codes.keys())
+
+    exporter = Exporter(directory, file_format, building_codes)
+    try:
+        module_codes = snapshot.get_module_codes()
+        for i in range(0, len(module_codes), batch_size):
+            exporter.write_modules(snapshot.get_module_timetable(module_codes[i : i + batch_size], "list"))
+    finally:
+        exporter.close()
+
+    return exporter.counts
+
+# ----------
+
+def main() -> 'None':
+    parser = argparse.ArgumentParser(description="Exports the activities of the latest snapshot as Parquet or Arrow files.")
+    parser.add_argument("--snapshot-dir", default=os.environ.get("APP_SNAPSHOT_DIR", "snapshots"), help="where the snapshots are (see snapshot.py)")
+    parser.add_argument("--output-dir", default="exports", help="where to write the files (to a directory named after the snapshot's version)")
+    parser.add_argument("--format", choices=FORMATS.keys(), default="parquet", help="the format of the files")
+    parser.add_argument("--batch-size", type=int, default=200, help="the number of modules written at a time")
+    args = parser.parse_args()
+
+    try:
+        import pyarrow
+    except ImportError:
+        parser.error("writing Parquet or Arrow files needs pyarrow (pip install pyarrow)")
+
+    snapshot = MappedSnapshot.load_latest(args.snapshot_dir)
+    if snapshot is None:
+        parser.error(f"there aren't any snapshots in {args.snapshot_dir} (see crawl.py)")
+
+    directory = os.path.join(args.output_dir, snapshot.version)
+    counts = export_snapshot(snapshot, directory, args.format, args.batch_size)
+
+    print(f"Wrote {directory}: {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+'''
+When every member of a group (e.g. a study group or a society) is free, given the modules each of them takes.
+
+Each member is busy whenever any of their modules has something on, so the group is free whenever none of their modules do - i.e.
+in the complement of the union of every module's occupancy bitmap (see `occupancy.py`). The timetables of every module are got with
+`batch.get_module_activities` (so from the snapshot or each module's own cache entry if they're there, and otherwise in as few
+upstream reports as fit in a URL), and the rest is a handful of `int` operations however many members there are, followed by one
+pass over the free slots to rank them.
+
+```python
+find_common_free_time(
+    [["COMP2221", "COMP2261"], ["MATH2011", "COMP2261"]], activities,
+    datetime.date(2022, 10, 3), datetime.date(2022, 10, 9), earliest="09:00", latest="18:00",
+)
+```
+'''
+
+import occupancy
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# every slot on a Monday-Friday
+WEEKDAY_MASK = int.from_bytes(((b"\xff" * 7 * 5) + (b"\x00" * 7 * 2)) * occupancy.WEEKS, "little")
+
+# ============================================================
+
+def get_module_codes(module_sets:'list[list[str]]') -> 'list[str]':
+    ''' Every module code in any of `module_sets`, once each. '''
+    return list(dict.fromkeys(code for module_set in module_sets for code in module_set))
+
+# ----------
+
+def find_common_free_time(module_sets:'list[list[str]]', activities:'list[dict]', start_date:'datetime.date', end_date:'datetime.date', earliest:'str' = None, latest:'str' = None, min_minutes:'int' = 60, include_weekends:'bool' = False, limit:'int' = None) -> 'list[dict]':
+    '''
+    Returns the periods in which none of `module_sets` have anything on, longest first (and then earliest first):
+
+    ```python
+    [
+        {"Date": "2022-10-05", "Day Of The Week": "Wednesday", "Start": "12:00", "End": "18:00", "Minutes": 360},
+        ...
+    ]
+    ```
+
+    ---
+
+    ### Parameters:
+    - `module_sets` (required) --> the module codes of each member of the group.
+    - `activities` (required) --> the activities of every module in `module_sets` (e.g. from `batch.get_module_activities(scraper, get_module_codes(module_sets), in_flight)`).
+    - `start_date` / `end_date` (required) --> only periods between these dates (inclusive).
+    - `earliest` / `latest` (optional) --> only periods between these times of day (e.g. `"09:00"` and `"18:00"`).
+    The timetables only cover 08:00 - 22:00, so periods are never outside of those.
+    - `min_minutes` (optional) --> only periods at least this long.
+    - `include_weekends` (optional) --> if `False`, only Monday - Friday.
+    - `limit` (optional) --> at most this many periods (the best ones). `None` --> all of them.
+    '''
+
+    module_codes = set(get_module_codes(module_sets))
+
+    busy = occupancy.union(
+        occupancy.get_activity_bitmap(activity) for activity in activities if activity["Module"] in module_codes
+    )
+
+    free = occupancy.complement(busy) & occupancy.get_window_mask(start_date, end_date, earliest, latest)
+    if not include_weekends:
+        free &= WEEKDAY_MASK
+
+    periods = []
+    for date, start, end in occupancy.get_slots(free):
+        minutes = (occupancy.get_period(end) - occupancy.get_period(start)) * occupancy.PERIOD_MINUTES
+        if minutes < min_minutes:
+            continue
+
+        periods.append({
+            "Date": date.isoformat(),
+            "Day Of The Week": DAYS_OF_THE_WEEK[date.weekday()],
+            "Start": start,
+            "End": end,
+            "Minutes": minutes,
+        })
+
+    periods.sort(key = lambda period: (-period["Minutes"], period["Date"], period["Start"]))
+
+    return periods if (limit is None) else periods[:limit]
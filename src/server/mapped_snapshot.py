@@ -0,0 +1,298 @@
+'''
+A binary version of each snapshot (see `snapshot.py`) that the servers memory-map at startup, rather than loading it.
+
+Loading a `snapshot.Snapshot` means decompressing and decoding every module's timetable, in every worker process. A `MappedSnapshot`
+is ready as soon as the file is mapped: only the activities of the modules that are actually asked for are decoded, and since the
+file is mapped read-only, every worker process on the host shares the same pages of it (through the OS's page cache).
+
+Each one is written next to the JSON snapshot it's made from, e.g. `snapshots/20221014T153012Z.tsnap`. The layout is:
+
+```
+MAGIC                      8 bytes
+contents length            uint32 (little-endian)
+contents                   JSON --> {"Version": ..., "Metadata": ..., "Key Length": ..., "Sections": {name: [offset, length], ...}}
+sections:
+    "page:<key>"           the JSON of each page in `snapshot.PAGE_KEYS` (e.g. "page:catalog")
+    "index"                one index record (see `get_index_record`) per module, sorted by module code --> where its activities are
+    "activities"           the JSON `list` of each module's activities, one after another
+```
+
+The index is binary searched in place, so it's never decoded as a whole either.
+'''
+
+import os
+import mmap
+import json
+import struct
+import tempfile
+
+from cache import MISSING
+from snapshot import Snapshot, get_latest_version, get_path, encode_pages, decode_page
+
+MAGIC = b"TSNAP\x00\x01\x00"
+HEADER = struct.Struct("<8sI")
+
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ============================================================
+
+class MappedSnapshot:
+    '''
+    A snapshot written by `write_mapped`, memory-mapped from `path`.
+
+    It has the same `has_modules`/`get_module_timetable`/`get_module_timetable_window`/`get_page` methods as `snapshot.Snapshot`,
+    so it can be passed to `Scraper` as its `snapshot`.
+
+    ---
+
+    ### Parameters:
+    - `path` (required) --> the `.tsnap` file.
+    '''
+
+    def __init__(self, path:'str') -> 'None':
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, contents_length = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} isn't a mapped snapshot")
+
+        contents = json.loads(self.map[HEADER.size : HEADER.size + contents_length])
+
+        self.version = contents["Version"]
+        self.metadata = contents["Metadata"]
+        self.sections = contents["Sections"]
+
+        self.key_length = contents["Key Length"]
+        self.index_record = get_index_record(self.key_length)
+
+        index_offset, index_length = self.sections["index"]
+        self.index_offset = index_offset
+        self.index_size = index_length // self.index_record.size
+
+        # the decoded pages, so that each one is only decoded once
+        self.pages = dict()
+
+    # ----------
+
+    @staticmethod
+    def load_latest(directory:'str') -> 'MappedSnapshot|None':
+        '''
+        Maps the newest snapshot in `directory`, or returns `None` if there aren't any.
+
+        If it doesn't have a `.tsnap` version yet (e.g. it was written before they existed), it's written first.
+        '''
+
+        version = get_latest_version(directory)
+        return None if (version is None) else MappedSnapshot.load_version(directory, version)
+
+    # ----------
+
+    @staticmethod
+    def load_version(directory:'str', version:'str') -> 'MappedSnapshot':
+        '''
+        Maps the snapshot `version` in `directory` (e.g. an older one, to compare with - see `snapshot_diff.py`), writing its `.tsnap`
+        version first if it doesn't have one. Raises a `FileNotFoundError` if there's no such snapshot.
+        '''
+
+        path = get_mapped_path(directory, version)
+        if not os.path.exists(path):
+            write_mapped(Snapshot.load(get_path(directory, version)), directory)
+
+        return MappedSnapshot(path)
+
+    # ----------
+
+    @staticmethod
+    def from_environment() -> 'MappedSnapshot|None':
+        ''' Maps the newest snapshot in the `APP_SNAPSHOT_DIR` directory, or returns `None` if it isn't set (or there aren't any snapshots in it). '''
+        directory = os.environ.get("APP_SNAPSHOT_DIR")
+        return None if (directory is None) else MappedSnapshot.load_latest(directory)
+
+    # ----------
+
+    def read_section(self, name:'str') -> 'bytes':
+        offset, length = self.sections[name]
+        return self.map[offset : offset + length]
+
+    # ----------
+
+    def find_module(self, module_code:'str') -> 'tuple[int, int]|None':
+        ''' Binary searches the index for `module_code`, and returns the offset and length of its activities (or `None` if it isn't in the snapshot). '''
+
+        key = module_code.encode("utf-8")
+        if len(key) > self.key_length:
+            return None
+        key = key.ljust(self.key_length, b"\x00")
+
+        low, high = 0, self.index_size
+        while low < high:
+            middle = (low + high) // 2
+            code, offset, length = self.index_record.unpack_from(self.map, self.index_offset + middle * self.index_record.size)
+            if code < key:
+                low = middle + 1
+            elif code > key:
+                high = middle
+            else:
+                return offset, length
+
+        return None
+
+    # ----------
+
+    def get_module_codes(self) -> 'list[str]':
+        ''' Every module code in the snapshot, in order. '''
+        return [
+            self.index_record.unpack_from(self.map, self.index_offset + i * self.index_record.size)[0].rstrip(b"\x00").decode("utf-8")
+            for i in range(self.index_size)
+        ]
+
+    # ----------
+
+    def get_module_data(self, module_code:'str') -> 'bytes|None':
+        ''' The JSON of `module_code`'s activities, as it's stored (or `None` if it isn't in the snapshot). '''
+        location = self.find_module(module_code)
+        if location is None:
+            return None
+        offset, length = location
+        return self.map[offset : offset + length]
+
+    # ----------
+
+    def get_module_activities(self, module_code:'str') -> 'list[dict]':
+        return json.loads(self.get_module_data(module_code))
+
+    # ----------
+
+    def has_modules(self, module_codes:'list[str]') -> 'bool':
+        return all(self.find_module(code) is not None for code in module_codes)
+
+    # ----------
+
+    def get_page(self, key:'str') -> 'object':
+        ''' Returns the page stored under `key` (one of `snapshot.PAGE_KEYS`), or `cache.MISSING` if the snapshot doesn't have it. '''
+
+        if key not in self.pages:
+            if ("page:" + key) not in self.sections:
+                return MISSING
+            self.pages[key] = decode_page(key, json.loads(self.read_section("page:" + key)))
+
+        return self.pages[key]
+
+    # ----------
+
+    def get_module_timetable(self, module_codes:'list[str]', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable(module_codes, list_or_dict)`, from the snapshot. Every module must be in it (see `self.has_modules`). '''
+
+        activities = [activity for code in dict.fromkeys(module_codes) for activity in self.get_module_activities(code)]
+        activities.sort(key = lambda x: x["Start"])
+
+        if list_or_dict == "list":
+            return activities
+
+        activities_dict = {day:[] for day in DAYS_OF_THE_WEEK}
+        for activity in activities:
+            activities_dict[activity["Day Of The Week"]].append(activity)
+
+        return activities_dict
+
+    # ----------
+
+    def get_module_timetable_window(self, module_codes:'list[str]', start_date:'datetime.date', end_date:'datetime.date', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable_window`, from the snapshot. Every module must be in it (see `self.has_modules`). '''
+        from scraper import Scraper
+        return Scraper.slice_module_timetable(self.get_module_timetable(module_codes, list_or_dict), start_date, end_date)
+
+# ============================================================
+
+def get_mapped_path(directory:'str', version:'str') -> 'str':
+    return os.path.join(directory, version + ".tsnap")
+
+# ----------
+
+def get_index_record(key_length:'int') -> 'struct.Struct':
+    ''' An index record: a module code (padded with NULs to `key_length` bytes - the length of the longest one), and the offset and length of its activities. '''
+    return struct.Struct(f"<{key_length}sQI")
+
+# ----------
+
+def write_mapped(snapshot:'Snapshot', directory:'str') -> 'str':
+    ''' Writes the `.tsnap` version of `snapshot` to `directory` (see the top of this file), and returns its path. '''
+
+    sections = []   # (name, bytes)
+
+    for key, value in encode_pages(snapshot.pages).items():
+        sections.append(("page:" + key, json.dumps(value, separators=(",", ":")).encode("utf-8")))
+
+    key_length = max([len(code.encode("utf-8")) for code in snapshot.modules], default=1)
+    index_record = get_index_record(key_length)
+
+    index = bytearray()
+    activities = bytearray()
+    for code in sorted(snapshot.modules, key=lambda code: code.encode("utf-8")):
+        data = json.dumps(snapshot.modules[code], separators=(",", ":")).encode("utf-8")
+        # (the offset is filled in below, once it's known where the "activities" section starts)
+        index += index_record.pack(code.encode("utf-8"), len(activities), len(data))
+        activities += data
+
+    sections.append(("index", bytes(index)))
+    sections.append(("activities", bytes(activities)))
+
+    # the contents say where each section is, but their own length depends on that - so the offsets are worked out
+    # relative to the end of the contents, and the contents are padded to a fixed length
+    relative = dict()
+    position = 0
+    for name, data in sections:
+        relative[name] = position
+        position += len(data)
+
+    def make_contents(start:'int') -> 'bytes':
+        return json.dumps({
+            "Version": snapshot.version,
+            "Metadata": snapshot.metadata,
+            "Key Length": key_length,
+            "Sections": {name: [start + relative[name], len(data)] for name, data in sections},
+        }, separators=(",", ":")).encode("utf-8")
+
+    # the length is grown until the contents fit in it (moving the sections along can only make the offsets longer), and then
+    # the contents are padded out to it. anything longer would shift every section, so it's checked
+    contents_length = len(make_contents(HEADER.size))
+    while len(make_contents(HEADER.size + contents_length)) > contents_length:
+        contents_length = len(make_contents(HEADER.size + contents_length))
+
+    start = HEADER.size + contents_length
+    contents = make_contents(start).ljust(contents_length, b" ")
+    if len(contents) != contents_length:
+        raise RuntimeError(f"The contents of snapshot {snapshot.version} don't fit in the {contents_length} bytes left for them.")
+
+    # the offsets in the index are relative to the start of the "activities" section
+    activities_offset = start + relative["activities"]
+    for i in range(0, len(index), index_record.size):
+        code, offset, length = index_record.unpack_from(index, i)
+        index_record.pack_into(index, i, code, activities_offset + offset, length)
+    sections[-2] = ("index", bytes(index))
+
+    os.makedirs(directory, exist_ok=True)
+    path = get_mapped_path(directory, snapshot.version)
+
+    # written to a temporary file first, so that a server mapping the snapshot never sees half of it
+    # (under a unique name, as several server workers - or several threads of one - may be writing it at once, in
+    # `MappedSnapshot.load_latest` or `MappedSnapshot.load_version`)
+    file_descriptor, temporary_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with open(file_descriptor, "wb") as f:
+            # (`mkstemp` makes it readable only by its owner, unlike the snapshot it's made from)
+            os.chmod(temporary_path, 0o644)
+            f.write(HEADER.pack(MAGIC, contents_length))
+            f.write(contents)
+            for _, data in sections:
+                f.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    return path
@@ -0,0 +1,165 @@
+'''
+Counters, latency histograms and timing spans, exposed in the Prometheus text format on the `/metrics` route of the servers.
+
+```python
+with metrics.span("parse"):
+    ...
+```
+
+records how long the block took in the `stage_seconds` histogram, under the label `stage="parse"`.
+
+NB: each process has its own metrics. When running several server workers (see `async_server.py`), each worker reports
+its own numbers, and work done in the parsing pool's processes isn't recorded at the per-stage level inside the parser.
+'''
+
+import time
+import bisect
+import threading
+import contextlib
+
+# The default histogram buckets (in seconds) - from 1ms up to 1 minute, which covers everything from a cache hit to a full-year scrape.
+DEFAULT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# ============================================================
+
+def format_labels(labels:'tuple[tuple[str, str]]') -> 'str':
+    ''' e.g. `(("stage", "parse"), ("le", "0.1"))` becomes `'{stage="parse",le="0.1"}'`. '''
+
+    if len(labels) == 0:
+        return ""
+
+    escape = lambda value: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join([f'{name}="{escape(value)}"' for name, value in labels]) + "}"
+
+# ============================================================
+
+class Counter:
+    ''' A value that only goes up, e.g. the number of cache hits. Each distinct combination of labels is counted separately. '''
+
+    def __init__(self, name:'str', documentation:'str') -> 'None':
+        self.name = name
+        self.documentation = documentation
+
+        # tuple of (label name, label value) pairs --> count
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def inc(self, amount:'float' = 1, **labels) -> 'None':
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    # ----------
+
+    def render(self) -> 'list[str]':
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+# ============================================================
+
+class Histogram:
+    ''' Counts observations (e.g. latencies) into cumulative buckets, as well as their total and sum. '''
+
+    def __init__(self, name:'str', documentation:'str', buckets:'list[float]' = DEFAULT_BUCKETS) -> 'None':
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+
+        # tuple of (label name, label value) pairs --> [count per bucket (the last is +Inf), sum]
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def observe(self, value:'float', **labels) -> 'None':
+        key = tuple(sorted(labels.items()))
+
+        # the index of the smallest bucket that `value` fits in
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    # ----------
+
+    def render(self) -> 'list[str]':
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+        with self.lock:
+            for labels, (counts, total) in self.values.items():
+
+                # the buckets are cumulative - each one includes every observation in the buckets below it
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+
+        return lines
+
+# ============================================================
+
+class Registry:
+    ''' Holds every metric, so that they can all be rendered by `/metrics`. '''
+
+    def __init__(self) -> 'None':
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    # ----------
+
+    def counter(self, name:'str', documentation:'str') -> 'Counter':
+        ''' Returns the `Counter` called `name`, creating it if it doesn't exist yet. '''
+        with self.lock:
+            return self.metrics.setdefault(name, Counter(name, documentation))
+
+    def histogram(self, name:'str', documentation:'str', buckets:'list[float]' = DEFAULT_BUCKETS) -> 'Histogram':
+        ''' Returns the `Histogram` called `name`, creating it if it doesn't exist yet. '''
+        with self.lock:
+            return self.metrics.setdefault(name, Histogram(name, documentation, buckets))
+
+    # ----------
+
+    def render(self) -> 'str':
+        ''' Returns every metric in the Prometheus text exposition format. '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+
+        return "\n".join(lines) + "\n"
+
+# ============================================================
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Time spent in each stage of scraping and building timetables.")
+UPSTREAM_REQUESTS = REGISTRY.counter("upstream_requests_total", "Requests made to the Durham University servers.")
+UPSTREAM_BYTES = REGISTRY.counter("upstream_bytes_total", "Bytes received from the Durham University servers.")
+CACHE_LOOKUPS = REGISTRY.counter("cache_lookups_total", "Cache lookups, by the kind of data and whether they were a hit or a miss.")
+REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "Time taken to respond to each route.")
+
+# The content type of the `/metrics` response.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ----------
+
+@contextlib.contextmanager
+def span(stage:'str') -> 'None':
+    ''' Records how long the `with` block takes in `STAGE_SECONDS`, under `stage`. '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
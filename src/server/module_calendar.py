@@ -3,13 +3,15 @@ import json
 import re
 import datetime
 import copy
+import time
 from pprint import PrettyPrinter
 
-import icalendar
+# `icalendar` is imported in the methods that build calendars, so that importing this module doesn't pay for it - see `benchmarks/test_import_time.py`
 # from yaml import DocumentStartEvent # 4.0.9
 
 from env import load_environment_variables, auth
 from scraper import Scraper
+import metrics
 
 pp = PrettyPrinter(indent=4)
 
@@ -23,11 +25,12 @@ class ModuleCalendar:
     - https://www.kanzaki.com/docs/ical/
     '''
 
-    def __init__(self, username:'str', password:'str') -> 'None':
+    def __init__(self, username:'str', password:'str', cache:'CacheBackend' = None, snapshot:'Snapshot|TimetableStore' = None) -> 'None':
         self.username = username
         self.password = password
 
-        self.scraper = Scraper(self.username, self.password)
+        # `cache` and `snapshot` are passed through to the `Scraper` - see `cache.py`, and `snapshot.py`/`store.py`
+        self.scraper = Scraper(self.username, self.password, cache, snapshot=snapshot)
     
     # ----------
 
@@ -309,18 +312,25 @@ class ModuleCalendar:
         # used to get the google maps url for each activity.
         # i've defined these at the top of the function so that they don't have to be repeatedly called.
         # saves having to request multiple times from the internet.
-        building_codes_and_names = self.scraper.get_building_codes()
-        building_location_urls = self.scraper.get_building_locations_urls()
+        with metrics.span("ics_buildings"):
+            building_codes_and_names = self.scraper.get_building_codes()
+            building_location_urls = self.scraper.get_building_locations_urls()
 
         if len(module_codes) == 0:
             return ""
         
         # List containing all the activities to be added to the calendar.
-        schedule_info = self.scraper.get_module_timetable(module_codes,"list")
+        with metrics.span("ics_timetable"):
+            schedule_info = self.scraper.get_module_timetable(module_codes,"list")
+
+        import icalendar
 
         # The overall VCALENDAR component.
         cal = icalendar.Calendar()
 
+        # Used to record how long it takes to turn the activities into VEVENTs.
+        events_start = time.perf_counter()
+
         for activity in schedule_info:
 
             summary = activity["Activity"]
@@ -374,8 +384,11 @@ class ModuleCalendar:
 
             # print()
 
-        ModuleCalendar.display_ical(cal,_print=True)
-        ModuleCalendar.write_cal_to_file(cal)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - events_start, stage="ics_events")
+
+        with metrics.span("ics_serialize"):
+            ModuleCalendar.display_ical(cal,_print=True)
+            ModuleCalendar.write_cal_to_file(cal)
 
     # def create_ics_file_from_module_codes2(self, module_codes:'list[str]' = []) -> 'str':
     """
@@ -408,6 +421,7 @@ class ModuleCalendar:
         # `list` containing all the activities to be added to the calendar
         schedule_info = self.scraper.get_module_timetable(module_codes,"list")
 
+        import icalendar
         cal = icalendar.Calendar()
 
         for activity in schedule_info:
@@ -517,6 +531,7 @@ class ModuleCalendar:
 
         term_dates = self.scraper.get_term_dates()
 
+        import icalendar
         cal = icalendar.Calendar()
 
         for term, dates in term_dates.items():
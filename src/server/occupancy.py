@@ -0,0 +1,254 @@
+'''
+Occupancy bitmaps: when an activity (or a set of them) takes place, as a single `int` with one bit per slot of the upstream time grid.
+
+The grid is the one the `/reporting/` URLs already use (see `Scraper.get_module_timetable_url`) - 52 weeks x 7 days x 56 quarter-hour
+periods (08:00 - 22:00), i.e. 20,384 bits (2,548 bytes). Slot `((week - 1) * 7 + day) * 56 + period` is set if the activity is on then,
+where `day` is 0 for Monday and `period` is 0 for 08:00-08:15.
+
+Every scheduling question then becomes set algebra on `int`s, which Python does a machine word at a time:
+
+```python
+bitmaps = get_activity_bitmaps(scraper.get_module_timetable(["COMP2221", "COMP2261"], "list"))
+
+overlap(bitmaps[0], bitmaps[1])          # do the two activities clash?
+busy = union(bitmaps)                     # when is the student busy?
+popcount(busy) * PERIOD_MINUTES / 60      # how many hours of teaching is that?
+get_slots(busy & get_window_mask(...))    # when, as (date, start, end) - e.g. in a given week
+```
+
+Each day is exactly 56 bits, i.e. 7 bytes, so `to_bytes`/`from_bytes` give a compact fixed-length form for storing bitmaps.
+'''
+
+import datetime
+import functools
+
+from scraper import Scraper, WEEK_PATTERNS
+
+WEEKS = 52
+DAYS = 7
+PERIODS = 56
+PERIOD_MINUTES = 15
+
+DAY_BITS = PERIODS
+WEEK_BITS = DAYS * DAY_BITS
+BITS = WEEKS * WEEK_BITS
+BYTES = BITS // 8
+
+# every period of one day, e.g. to be shifted to the day of interest
+DAY_MASK = (1 << DAY_BITS) - 1
+# every slot of the year
+FULL_MASK = (1 << BITS) - 1
+
+# the start of period 0, and the Monday of week 1
+FIRST_PERIOD = datetime.time(8, 0)
+WEEK_1_MONDAY = WEEK_PATTERNS["1"]["Calendar Date"][0]
+
+# ============================================================
+# Converting to and from the grid
+
+def get_period(time_string:'str') -> 'int':
+    ''' e.g. `4` from `"09:00:00"` (or `"09:00"`) - the number of periods between 08:00 and `time_string`. Not limited to 0-56. '''
+    hours, minutes = time_string.split(":")[:2]
+    return ((int(hours) - FIRST_PERIOD.hour) * 60 + int(minutes) - FIRST_PERIOD.minute) // PERIOD_MINUTES
+
+# ----------
+
+def get_time_string(period:'int') -> 'str':
+    ''' The inverse of `get_period` - e.g. `"09:00"` from `4`. '''
+    minutes = FIRST_PERIOD.hour * 60 + FIRST_PERIOD.minute + period * PERIOD_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# ----------
+
+def get_day_index(date:'datetime.date') -> 'int':
+    ''' The number of days between the Monday of week 1 and `date`, i.e. `(week - 1) * 7 + day`. Dates outside the grid give numbers outside 0-364. '''
+    return (date - WEEK_1_MONDAY).days
+
+# ----------
+
+def get_date(day_index:'int') -> 'datetime.date':
+    ''' The inverse of `get_day_index`. '''
+    return WEEK_1_MONDAY + datetime.timedelta(days = day_index)
+
+# ----------
+
+def get_window_mask(start_date:'datetime.date', end_date:'datetime.date', start_time:'str' = None, end_time:'str' = None) -> 'int':
+    '''
+    A bitmap of every slot between `start_date` and `end_date` (inclusive) - e.g. `busy & get_window_mask(monday, sunday)` is
+    when `busy` is busy in that week.
+
+    If `start_time`/`end_time` are given (e.g. `"09:00"` and `"17:00"`), only the slots between them on each day are included.
+    '''
+
+    first_period = 0 if (start_time is None) else max(0, get_period(start_time))
+    last_period = PERIODS if (end_time is None) else min(PERIODS, get_period(end_time))
+    if first_period >= last_period:
+        return 0
+
+    day = ((1 << (last_period - first_period)) - 1) << first_period
+
+    first_day = max(0, get_day_index(start_date))
+    last_day = min(WEEKS * DAYS - 1, get_day_index(end_date))
+    if first_day > last_day:
+        return 0
+
+    # the same day repeated for every day in the window (see `get_bitmap`)
+    data = bytearray(BYTES)
+    data[first_day * 7 : (last_day + 1) * 7] = day.to_bytes(DAY_BITS // 8, "little") * (last_day + 1 - first_day)
+
+    return int.from_bytes(data, "little")
+
+# ============================================================
+# Building bitmaps
+
+@functools.lru_cache(maxsize = 65536)
+def get_bitmap(dates:'tuple[str]', start:'str', end:'str') -> 'int':
+    ''' The bitmap of something on each of `dates` (YYYY-MM-DD strings) from `start` until `end` (e.g. `"09:00:00"` and `"10:00:00"`). '''
+
+    first_period = max(0, get_period(start))
+    last_period = min(PERIODS, get_period(end))
+    if first_period >= last_period:
+        return 0
+
+    day = ((1 << (last_period - first_period)) - 1) << first_period
+
+    # built from the bytes of each day, rather than by OR-ing together big `int`s
+    day_bytes = day.to_bytes(DAY_BITS // 8, "little")
+    data = bytearray(BYTES)
+
+    for date in dates:
+        day_index = get_day_index(datetime.date.fromisoformat(date))
+        if 0 <= day_index < WEEKS * DAYS:
+            data[day_index * 7 : day_index * 7 + 7] = day_bytes
+
+    return int.from_bytes(data, "little")
+
+# ----------
+
+def get_activity_bitmap(activity:'dict') -> 'int':
+    ''' The bitmap of `activity` (as returned by `Scraper.get_module_timetable`). Activities with the same dates and times share one (cached) bitmap. '''
+    return get_bitmap(tuple(activity["Dates"]), activity["Start"], activity["End"])
+
+# ----------
+
+def get_activity_bitmaps(activities:'list[dict]') -> 'list[int]':
+    ''' The bitmap of each of `activities`, in the same order. '''
+    return [get_activity_bitmap(activity) for activity in activities]
+
+# ============================================================
+# Set operations
+
+def union(bitmaps:'list[int]') -> 'int':
+    ''' The slots in which any of `bitmaps` is set. '''
+    result = 0
+    for bitmap in bitmaps:
+        result |= bitmap
+    return result
+
+# ----------
+
+def intersection(bitmaps:'list[int]') -> 'int':
+    ''' The slots in which all of `bitmaps` are set (every slot, if there aren't any). '''
+    result = FULL_MASK
+    for bitmap in bitmaps:
+        result &= bitmap
+    return result
+
+# ----------
+
+def complement(bitmap:'int') -> 'int':
+    ''' The slots in which `bitmap` isn't set, e.g. when a room is free. '''
+    return FULL_MASK & ~bitmap
+
+# ----------
+
+def overlap(bitmap_a:'int', bitmap_b:'int') -> 'bool':
+    ''' `True` if there's any slot in which both are set (e.g. two activities clash). '''
+    return (bitmap_a & bitmap_b) != 0
+
+# ----------
+
+def popcount(bitmap:'int') -> 'int':
+    ''' The number of slots that are set. Multiply by `PERIOD_MINUTES` for the number of minutes. '''
+    # `int.bit_count` is only in python 3.10+
+    return bitmap.bit_count() if hasattr(bitmap, "bit_count") else bin(bitmap).count("1")
+
+# ============================================================
+# Decoding and storing bitmaps
+
+def get_slots(bitmap:'int') -> 'list[tuple[datetime.date, str, str]]':
+    '''
+    The runs of consecutive set slots in `bitmap`, as `(date, start, end)` - e.g. `(datetime.date(2022, 10, 4), "09:00", "11:00")`.
+    Runs don't carry on from one day to the next.
+    '''
+
+    data = to_bytes(bitmap)
+    slots = []
+
+    for day_index in range(WEEKS * DAYS):
+        day = int.from_bytes(data[day_index * 7 : day_index * 7 + 7], "little")
+        if day == 0:
+            continue
+
+        date = get_date(day_index)
+        period = 0
+        while day:
+            # skip to the next set slot, and then to the end of the run
+            gap = (day & -day).bit_length() - 1
+            day >>= gap
+            period += gap
+            length = (~day & (day + 1)).bit_length() - 1
+            slots.append((date, get_time_string(period), get_time_string(period + length)))
+            day >>= length
+            period += length
+
+    return slots
+
+# ----------
+
+def get_busy_periods(bitmap:'int', activities:'list[dict]', start_date:'datetime.date', end_date:'datetime.date') -> 'list[dict]':
+    '''
+    The runs of `bitmap` (see `get_slots`) between `start_date` and `end_date` (inclusive), each with the `activities` that are on during it:
+
+    ```python
+    [{"Date": "2022-10-25", "Start": "14:00", "End": "16:00", "Activities": [{...}, ...]}, ...]
+    ```
+
+    `bitmap` is usually the union of the bitmaps of `activities` (e.g. when a room or a member of staff is busy).
+    '''
+
+    slots = get_slots(bitmap & get_window_mask(start_date, end_date))
+    if not slots:
+        return []
+
+    activities = Scraper.slice_module_timetable(activities, start_date, end_date)
+
+    # date --> [(start, end, activity), ...] of the activities on that date
+    by_date = dict()
+    for activity in activities:
+        for date in activity["Dates"]:
+            by_date.setdefault(date, []).append((activity["Start"][:5], activity["End"][:5], activity))
+
+    busy = []
+    for date, start, end in slots:
+        date = date.isoformat()
+        busy.append({
+            "Date": date,
+            "Start": start,
+            "End": end,
+            "Activities": [activity for a_start, a_end, activity in by_date.get(date, []) if (a_start < end) and (a_end > start)],
+        })
+
+    return busy
+
+# ----------
+
+def to_bytes(bitmap:'int') -> 'bytes':
+    ''' `bitmap` as `BYTES` bytes - 7 bytes per day, Monday of week 1 first. '''
+    return bitmap.to_bytes(BYTES, "little")
+
+# ----------
+
+def from_bytes(data:'bytes') -> 'int':
+    ''' The inverse of `to_bytes`. '''
+    return int.from_bytes(data, "little")
@@ -0,0 +1,230 @@
+'''
+Opt-in per-request profiling, for finding out where the time goes when a particular set of modules is slow.
+
+Profiling is switched on with environment variables:
+- `APP_PROFILE_DIR` --> the directory profiles are written to. Profiling is off unless this is set.
+- `APP_PROFILE_SAMPLE_RATE` --> the fraction of requests to profile, e.g. `0.01` for 1 in 100. Defaults to `0`.
+- `APP_PROFILE_THRESHOLD_MS` --> if set, every request is profiled, but the profile is only kept if the request took at least this long.
+- `APP_PROFILE_ALLOW_HEADER` --> if `1`, a request with an `X-Profile: 1` header is always profiled.
+- `APP_PROFILE_FORMAT` --> either:
+    - `"cprofile"` (the default in `server.py`) --> a `.prof` file from `cProfile`. View it with e.g. `snakeviz` or `python -m pstats`.
+    - `"collapsed"` (the default in, and the only format allowed by, `async_server.py`) --> a `.collapsed` file of sampled stacks
+    (one `frame;frame;frame count` line per stack), which can be turned into a flamegraph by e.g. `flamegraph.pl` or speedscope.
+
+The file names are tagged with the time, the route, the module codes and how long the request took, e.g.
+`20221014-153012-get-module-timetables-COMP2221,COMP2261-2350ms.prof`.
+
+`profile_call` does the same for a single function call, e.g. `ModuleCalendar.create_ics_file_from_module_codes` from a script.
+
+NB: profiles only cover the thread handling the request. In `async_server.py`, that thread is the event loop, so other
+requests being served at the same time show up too, and the parsing done in the worker processes doesn't. `cProfile` can't be
+used there at all: a thread only has one profiler at a time (before Python 3.12), so a profile started for one request would
+silently replace that of any request already being profiled on the loop.
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import cProfile
+import threading
+import contextlib
+import collections
+
+# The number of seconds between each stack sample in `"collapsed"` mode.
+SAMPLE_INTERVAL = 0.005
+
+# ============================================================
+
+class CProfileProfile:
+    ''' A deterministic profile of the current thread, using `cProfile`. '''
+
+    extension = ".prof"
+
+    def __init__(self) -> 'None':
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self) -> 'None':
+        self.profile.disable()
+
+    def write(self, path:'str') -> 'None':
+        self.profile.dump_stats(path)
+
+# ----------
+
+class SampledProfile:
+    ''' Samples the stack of the current thread every `SAMPLE_INTERVAL` seconds from a background thread, and counts how often each stack is seen. '''
+
+    extension = ".collapsed"
+
+    def __init__(self) -> 'None':
+        self.thread_id = threading.get_ident()
+
+        # "outermost;...;innermost" --> number of samples
+        self.stacks = collections.Counter()
+
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def sample(self) -> 'None':
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+
+            frame = sys._current_frames().get(self.thread_id)
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> 'None':
+        self.stopped.set()
+        self.sampler.join()
+
+    def write(self, path:'str') -> 'None':
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+# ============================================================
+
+class Profiler:
+    '''
+    Decides which requests to profile, and writes their profiles to `directory`.
+
+    The servers call `self.start` at the beginning of each request, and pass whatever it returns to `self.finish` at the end.
+    Use `Profiler.from_environment` to configure it from the environment variables at the top of this file.
+    '''
+
+    def __init__(self, directory:'str|None', sample_rate:'float' = 0, threshold_ms:'float|None' = None, allow_header:'bool' = False, output_format:'str' = "cprofile", event_loop:'bool' = False) -> 'None':
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.allow_header = allow_header
+
+        if output_format not in ["cprofile", "collapsed"]:
+            raise ValueError(f"Unknown profile format: {output_format!r}")
+        # (see the NB at the top of this file)
+        if event_loop and (output_format == "cprofile"):
+            raise ValueError("The \"cprofile\" format can't be used when requests share an event loop - use \"collapsed\".")
+        self.profile_class = CProfileProfile if (output_format == "cprofile") else SampledProfile
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # ----------
+
+    @staticmethod
+    def from_environment(event_loop:'bool' = False) -> 'Profiler':
+        ''' `event_loop` is `True` if the requests are served on one event loop (i.e. in `async_server.py`), where the format defaults to `"collapsed"`. '''
+
+        threshold_ms = os.environ.get("APP_PROFILE_THRESHOLD_MS")
+
+        return Profiler(
+            directory = os.environ.get("APP_PROFILE_DIR"),
+            sample_rate = float(os.environ.get("APP_PROFILE_SAMPLE_RATE", 0)),
+            threshold_ms = None if (threshold_ms is None) else float(threshold_ms),
+            allow_header = os.environ.get("APP_PROFILE_ALLOW_HEADER") == "1",
+            output_format = os.environ.get("APP_PROFILE_FORMAT", "collapsed" if event_loop else "cprofile"),
+            event_loop = event_loop,
+        )
+
+    # ----------
+
+    def start(self, profile_header:'str|None' = None) -> 'tuple[CProfileProfile|SampledProfile, bool]|None':
+        '''
+        Starts profiling the current request if it should be profiled, and returns what `self.finish` needs.
+        Returns `None` if it shouldn't be.
+
+        ---
+
+        ### Parameters:
+        - `profile_header` (optional) --> the value of the request's `X-Profile` header.
+        '''
+
+        if self.directory is None:
+            return None
+
+        # requests that are asked for (or sampled) are always kept. others are only kept if they turn out to be slow.
+        forced = (self.allow_header and profile_header == "1") or (random.random() < self.sample_rate)
+
+        if not forced and (self.threshold_ms is None):
+            return None
+
+        try:
+            return self.profile_class(), forced
+        except ValueError:
+            # from python 3.12, only one `cProfile` can be active at a time, so if another request is being profiled, this one isn't
+            return None
+
+    # ----------
+
+    def finish(self, started:'tuple|None', elapsed_seconds:'float', route:'str', module_codes:'list[str]' = None) -> 'str|None':
+        '''
+        Stops the profile returned by `self.start`, and writes it to `self.directory` if it should be kept.
+        Returns the path of the file written (or `None` if it wasn't).
+        '''
+
+        if started is None:
+            return None
+
+        profile, forced = started
+        profile.stop()
+
+        elapsed_ms = elapsed_seconds * 1000
+
+        if not forced and (elapsed_ms < self.threshold_ms):
+            return None
+
+        path = os.path.join(self.directory, Profiler.get_file_name(route, module_codes, elapsed_ms) + profile.extension)
+        profile.write(path)
+
+        return path
+
+    # ----------
+
+    @staticmethod
+    def get_file_name(route:'str', module_codes:'list[str]|None', elapsed_ms:'float') -> 'str':
+        ''' e.g. `"20221014-153012-get-module-timetables-COMP2221,COMP2261-2350ms"` '''
+
+        # anything that isn't safe in a file name is replaced with "-"
+        slugify = lambda s: re.sub(r"[^A-Za-z0-9,._]+", "-", s).strip("-")
+
+        parts = [time.strftime("%Y%m%d-%H%M%S"), slugify(route) or "index"]
+
+        if module_codes:
+            # only the first few codes, so the name doesn't get too long
+            codes = ",".join(module_codes[:10]) + (f",+{len(module_codes)-10}" if len(module_codes) > 10 else "")
+            parts.append(slugify(codes))
+
+        parts.append(f"{elapsed_ms:.0f}ms")
+
+        return "-".join(parts)
+
+# ============================================================
+
+@contextlib.contextmanager
+def profile_call(directory:'str', name:'str', module_codes:'list[str]' = None, output_format:'str' = "cprofile") -> 'None':
+    '''
+    Profiles the `with` block and writes the profile to `directory`, e.g.
+
+    ```python
+    with profiling.profile_call("profiles", "ics", module_codes):
+        module_calendar.create_ics_file_from_module_codes(module_codes)
+    ```
+    '''
+
+    profiler = Profiler(directory, sample_rate=1, output_format=output_format)
+
+    start = time.perf_counter()
+    started = profiler.start()
+    try:
+        yield
+    finally:
+        profiler.finish(started, time.perf_counter() - start, name, module_codes)
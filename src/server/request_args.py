@@ -0,0 +1,190 @@
+'''
+Reading the query parameters and bodies that several routes share (e.g. the `from`/`to` window), for both `server.py` and `async_server.py`,
+and the dates and times they default to (e.g. `get_coming_week`).
+
+Each reader raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if what it's reading is invalid.
+'''
+
+import re
+import datetime
+import zoneinfo
+
+from werkzeug.exceptions import BadRequest
+
+from scraper import Scraper, WEEK_PATTERNS
+
+# the timezone of the timetables' dates and times (which are naive)
+TIMEZONE = zoneinfo.ZoneInfo("Europe/London")
+
+# ============================================================
+
+def get_local_now() -> 'datetime.datetime':
+    ''' The current date and time in Durham, naive - so that it can be compared with the timetables' dates and times. '''
+    return datetime.datetime.now(TIMEZONE).replace(tzinfo=None)
+
+# ----------
+
+def get_coming_week() -> 'tuple[datetime.date, datetime.date]':
+    ''' The window of today (in Durham) and the 6 days after it. '''
+    today = get_local_now().date()
+    return today, today + datetime.timedelta(days=6)
+
+# ============================================================
+
+def get_local_datetime(args:'werkzeug.datastructures.MultiDict', name:'str') -> 'datetime.datetime|None':
+    '''
+    Reads a datetime query parameter (e.g. `after=2022-10-25T14:00` of `/upcoming`) and returns it, or `None` if it's not given.
+
+    One with a UTC offset (e.g. `2022-10-25T13:00+00:00`) is converted to the time in Durham, and returned naive like the rest.
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if it's not an ISO 8601 datetime.
+    '''
+
+    if name not in args:
+        return None
+
+    try:
+        value = datetime.datetime.fromisoformat(args[name])
+    except ValueError:
+        raise BadRequest(f"`{name}` must be a YYYY-MM-DDTHH:MM datetime.")
+
+    if value.tzinfo is not None:
+        value = value.astimezone(TIMEZONE).replace(tzinfo=None)
+
+    return value
+
+# ----------
+
+def get_window(args:'werkzeug.datastructures.MultiDict', default_whole_year:'bool' = False) -> 'tuple[datetime.date, datetime.date]|None':
+    '''
+    Reads the `from` and `to` query parameters of `/get-module-timetables` (see `Scraper.get_date_from_window_bound`),
+    and returns the window of dates they describe. If neither is given (i.e. the whole year), returns `None` - or, if
+    `default_whole_year`, the dates of the whole year (for routes that need an actual window).
+
+    If only one of them is given, the window is open-ended in the other direction (up to the start/end of the academic year).
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if either of them is invalid.
+    '''
+
+    if ("from" not in args) and ("to" not in args):
+        if default_whole_year:
+            return Scraper.get_date_from_window_bound("1"), Scraper.get_date_from_window_bound("52", is_end=True)
+        return None
+
+    try:
+        start_date = Scraper.get_date_from_window_bound(args.get("from", "1"))
+        end_date = Scraper.get_date_from_window_bound(args.get("to", "52"), is_end=True)
+    except ValueError:
+        raise BadRequest("`from` and `to` must be YYYY-MM-DD dates or week numbers.")
+
+    if start_date > end_date:
+        raise BadRequest("`from` must not be after `to`.")
+
+    return start_date, end_date
+
+# ----------
+
+def get_flag(args:'werkzeug.datastructures.MultiDict', name:'str') -> 'bool':
+    ''' Reads an on/off query parameter (e.g. `weekends`): on if it's `1`, `true` or `yes` (in any case), and off otherwise (including if it's not given). '''
+    return args.get(name, "false").lower() in ["1", "true", "yes"]
+
+# ----------
+
+def is_time_of_day(value:'str') -> 'bool':
+    ''' If `value` is a real time of day as HH:MM - e.g. `"09:00"`, but not `"9:00"`, `"24:30"` or `"99:99"`. '''
+
+    if re.fullmatch(r"\d{2}:\d{2}", value) is None:
+        return False
+
+    try:
+        datetime.time.fromisoformat(value)
+    except ValueError:
+        return False
+
+    return True
+
+# ----------
+
+def get_time_of_day(args:'werkzeug.datastructures.MultiDict', name:'str') -> 'str|None':
+    '''
+    Reads a time of day query parameter (e.g. `earliest=09:00` of `/free-time`) and returns it, or `None` if it's not given.
+
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if it's not HH:MM (between 00:00 and 23:59).
+    '''
+
+    time_of_day = args.get(name)
+    if (time_of_day is not None) and (not is_time_of_day(time_of_day)):
+        raise BadRequest(f"`{name}` must be given as HH:MM.")
+
+    return time_of_day
+
+# ----------
+
+def get_slot(args:'werkzeug.datastructures.MultiDict') -> 'tuple[datetime.date, str, str]':
+    '''
+    Reads the query parameters describing a slot (e.g. of `/free-rooms`), and returns its date, start time and end time:
+    - either `date` (YYYY-MM-DD), or `week` and `day` (e.g. `15` and `Tuesday`).
+    - `start` and `end` (HH:MM). `end` defaults to an hour after `start` (or 23:59, if that's sooner).
+
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if any of them are missing or invalid.
+    '''
+
+    try:
+        if "date" in args:
+            date = datetime.date.fromisoformat(args["date"])
+        else:
+            date = Scraper.get_datetime_date_from_week_number_and_dotw(WEEK_PATTERNS, args["week"], args["day"].capitalize())
+    except (KeyError, ValueError):
+        raise BadRequest("Either `date` (YYYY-MM-DD) or `week` (1-52) and `day` (e.g. Tuesday) must be given.")
+
+    start = args.get("start", "")
+    if not is_time_of_day(start):
+        raise BadRequest("`start` must be given as HH:MM.")
+
+    # (HH:MM strings compare in time order)
+    end = args.get("end", min(f"{int(start[:2]) + 1:02d}:{start[3:]}", "23:59"))
+    if (not is_time_of_day(end)) or (end <= start):
+        raise BadRequest("`end` must be given as HH:MM, and be after `start`.")
+
+    return date, start, end
+
+# ----------
+
+def get_module_codes(body_data:'object') -> 'list[str]':
+    '''
+    Checks a body that's a JSON list of module codes (e.g. of `/clashes`) and returns it.
+
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if it's anything else.
+    '''
+
+    if not (isinstance(body_data, list) and all(isinstance(code, str) for code in body_data)):
+        raise BadRequest("The body must be a JSON list of module codes.")
+
+    return body_data
+
+# ----------
+
+def get_module_sets(body_data:'object') -> 'dict[str, list[str]]':
+    '''
+    Checks the body of `/batch-module-timetables` - a JSON object of set name --> list of module codes - and returns it.
+
+    Raises a `werkzeug.exceptions.BadRequest` (i.e. a 400 response) if it's anything else.
+    '''
+
+    is_valid = isinstance(body_data, dict) and all(
+        isinstance(module_codes, list) and all(isinstance(code, str) for code in module_codes)
+        for module_codes in body_data.values()
+    )
+    if not is_valid:
+        raise BadRequest("The body must be a JSON object of names to lists of module codes.")
+
+    return body_data
+
+# ----------
+
+def get_credentials(body_data:'object') -> 'tuple[str, str]':
+    ''' Reads the body of `/validate` - a JSON object with a `username` and `password` - and returns them. '''
+
+    is_valid = isinstance(body_data, dict) and all(isinstance(body_data.get(field), str) for field in ["username", "password"])
+    if not is_valid:
+        raise BadRequest("The body must be a JSON object with a `username` and `password`.")
+
+    return body_data["username"], body_data["password"]
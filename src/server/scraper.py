@@ -1,13 +1,16 @@
 # standard library modules
-import datetime, sys, re, os, json, copy
+import datetime, re, os, json, copy, bisect, time, hashlib, threading
+from urllib.parse import urlsplit, quote
 from pprint import PrettyPrinter
 
 # external libraries
-import requests, selenium
-from bs4 import BeautifulSoup, Comment
+# `requests`, `bs4` and `selenium` (and `asyncio`, which only the async methods need) are imported in the methods that use them rather than here,
+# so that importing this module (e.g. to start a server, or in a CLI that only needs one function) doesn't pay for all of them - see `benchmarks/test_import_time.py`
 
 # imported functions from custom python file
 from env import load_environment_variables, auth
+from cache import MemoryCache, MISSING
+import metrics
 
 pp = PrettyPrinter(indent=4)
 
@@ -16,6 +19,23 @@ ENV_PATH = "../../.env"
 
 _DEBUG = False
 
+# The sites that are scraped. These can be pointed somewhere else - e.g. at the stand-in server in `benchmarks/stub_upstream.py` - with the
+# `APP_TIMETABLE_BASE_URL` and `APP_UNIVERSITY_BASE_URL` environment variables (or the parameters of the same names of `Scraper`).
+# The environment variables are read when each `Scraper` is made, so they can also be set in `.env` (see `env.load_environment_variables`).
+DEFAULT_TIMETABLE_BASE_URL = "https://timetable.dur.ac.uk"
+DEFAULT_UNIVERSITY_BASE_URL = "https://www.dur.ac.uk"
+
+# How long (in seconds) each kind of scraped data is cached for.
+CACHE_TTLS = {
+    "timetable":  60 * 60,           # 1 hour - rooms and times change during term
+    "catalog":    60 * 60 * 24,      # 1 day
+    "buildings":  60 * 60 * 24 * 7,  # 1 week
+    "term dates": 60 * 60 * 24 * 7,  # 1 week
+    "parsed":     60 * 60 * 24 * 7,  # 1 week - keyed by the report's contents, so never out of date
+    "derived":    60 * 60 * 24,      # 1 day - built from a snapshot for a set of modules chosen by a client (e.g. `upcoming.OccurrenceIndex`),
+                                     # so never out of date, but there's no end to the sets they can ask for
+}
+
 WEEK_PATTERNS = {   '1': {   'Calendar Date': [   datetime.date(2022, 7, 18),
                                   datetime.date(2022, 7, 22)],
              'Teaching Week': '',
@@ -225,10 +245,33 @@ WEEK_PATTERNS = {   '1': {   'Calendar Date': [   datetime.date(2022, 7, 18),
              'Teaching Week': '',
              'Term': ''}}
 
+# The report styles that `Scraper.get_module_timetable` can request (the values under "Select Report Style:" in
+# `moduleTimetableURLParameters.json`), and the name of the static method of `Scraper` which parses each of them.
+# `Scraper.choose_report_style` picks the cheapest of them to fetch and parse.
+REPORT_STYLE_PARSERS = {
+    "textspreadsheet": "parse_module_timetable",      # "List"
+    "individual":      "parse_module_timetable_grid", # "Grid (Individual)"
+}
+
+# How fast (in bytes per second) reports are assumed to come down from the upstream server, when comparing report styles.
+UPSTREAM_BYTES_PER_SECOND = 1_000_000
+
+# How many modules of the catalog `Scraper.configure_report_style` uses as the sample when comparing report styles.
+REPORT_STYLE_SAMPLE_SIZE = 5
+
+# The limit most servers (and proxies) put on the length of a URL. See `Scraper.get_module_batches`.
+MAX_URL_LENGTH = 2000
+
+class UpstreamError(Exception):
+    ''' Raised by `Scraper.handle_request` when the upstream server can't be reached, or responds with an error. '''
+
+# Changes whenever `WEEK_PATTERNS` does. Part of the key under which parsed reports are cached, as the "Dates" of the activities depend on it.
+WEEK_PATTERNS_VERSION = hashlib.sha256(repr(sorted(WEEK_PATTERNS.items())).encode("utf-8")).hexdigest()[:16]
+
 class Scraper:
     ''' Implements methods that allow for the web-scraping of data from various Durham University webpages. '''
 
-    def __init__(self, username:str, password:str) -> None:
+    def __init__(self, username:str, password:str, cache:'CacheBackend' = None, timetable_base_url:'str' = None, university_base_url:'str' = None, snapshot:'Snapshot|MappedSnapshot|TimetableStore' = None) -> None:
         '''
         `username` and `password` are needed to authorize the requests to the various pages.
         
@@ -237,16 +280,32 @@ class Scraper:
         ### Parameters:
         - `username` (required) --> a valid CIS username.
         - `password` (required) --> the password corresponding to `username`.
+        - `cache` (optional) --> the `cache.CacheBackend` in which scraped data is stored. Defaults to a `cache.MemoryCache`.
+            - To share the cache between several processes, pass a `cache.SQLiteCache` pointing at the same file.
+        - `timetable_base_url` (optional) --> where https://timetable.dur.ac.uk is. Defaults to `APP_TIMETABLE_BASE_URL`, if it's set.
+        - `university_base_url` (optional) --> where https://www.dur.ac.uk is. Defaults to `APP_UNIVERSITY_BASE_URL`, if it's set.
+        - `snapshot` (optional) --> a `snapshot.Snapshot` (written by `crawl.py`), its `mapped_snapshot.MappedSnapshot`, or a `store.TimetableStore`
+        it's been loaded into. Timetables of the modules in it (and the catalog and building data, if it has them) are served from it rather than scraped.
         '''
 
+        self.timetable_base_url = (timetable_base_url or os.environ.get("APP_TIMETABLE_BASE_URL", DEFAULT_TIMETABLE_BASE_URL)).rstrip("/")
+        self.university_base_url = (university_base_url or os.environ.get("APP_UNIVERSITY_BASE_URL", DEFAULT_UNIVERSITY_BASE_URL)).rstrip("/")
+
         self.BASE_URLS = [    
-            "https://timetable.dur.ac.uk",                   # TEACHING_TIMETABLE_BASE_URL
-            "https://timetable.dur.ac.uk/week_patterns.htm", # WEEK_PATTERNS_URL
-            "https://timetable.dur.ac.uk/module.htm"         # MODULE_TIMETABLES_URL
+            self.timetable_base_url,                         # TEACHING_TIMETABLE_BASE_URL
+            self.timetable_base_url + "/week_patterns.htm",  # WEEK_PATTERNS_URL
+            self.timetable_base_url + "/module.htm"          # MODULE_TIMETABLES_URL
         ]
 
         self.username = username
         self.password = password
+
+        self.cache = cache if (cache is not None) else MemoryCache()
+
+        # the style of report that timetables are requested in - see `REPORT_STYLE_PARSERS` and `self.choose_report_style`
+        self.report_style = "textspreadsheet"
+
+        self.snapshot = snapshot
     
     # ----------
 
@@ -276,13 +335,15 @@ class Scraper:
         saying something like "This site wants you to log in" and you are prompted to enter a username
         and password.
         - To get round this you can add the username and password to the url
-        - You add a string like so: `'{username}:{password}@'` between the `https://` and the rest of the url.
+        - You add a string like so: `'{username}:{password}@'` between the `https://` (or `http://`) and the rest of the url.
         '''
-        return base_url[:8] + username + ":" + password + "@" + base_url[8:]
+        scheme, rest = base_url.split("://", 1)
+        return scheme + "://" + username + ":" + password + "@" + rest
 
     # ----------
 
-    def get_datetime_date_from_week_number_and_dotw(self, week_patterns:dict, week_number:str, day_of_the_week:str) -> 'datetime.date':
+    @staticmethod
+    def get_datetime_date_from_week_number_and_dotw(week_patterns:dict, week_number:str, day_of_the_week:str) -> 'datetime.date':
         '''
         Given a `week_number` and `day_of_the_week`, returns a `datetime.date` object.
 
@@ -314,9 +375,53 @@ class Scraper:
 
     # ----------
 
+    @staticmethod
+    def get_week_number_from_date(date:'datetime.date') -> 'int':
+        '''
+        The inverse of `Scraper.get_datetime_date_from_week_number_and_dotw` - returns the week number (1-52) that `date` falls in.
+
+        The weeks in `WEEK_PATTERNS` are consecutive, so this is just the number of whole weeks since the Monday of week 1.
+        NB: dates outside the academic year give numbers outside of 1-52.
+        '''
+        week_1_monday = WEEK_PATTERNS["1"]["Calendar Date"][0]
+        return (date - week_1_monday).days // 7 + 1
+
+    # ----------
+
+    @staticmethod
+    def get_date_from_window_bound(bound:'str', is_end:'bool' = False) -> 'datetime.date':
+        '''
+        Converts one end of a date window (the `from`/`to` parameters of `/get-module-timetables`) to a `datetime.date`.
+
+        ---
+
+        ### Parameters:
+        - `bound` (required) --> either a YYYY-MM-DD date or a week number (e.g. `"15"`).
+        - `is_end` (optional) --> `True` if `bound` is the end of the window, in which case a week number is converted
+        to the Sunday of that week rather than the Monday.
+
+        Raises a `ValueError` if `bound` is neither.
+        '''
+
+        if bound.isdigit():
+            week_monday_date = WEEK_PATTERNS["1"]["Calendar Date"][0] + datetime.timedelta(weeks = int(bound)-1)
+            return week_monday_date + datetime.timedelta(days = 6) if is_end else week_monday_date
+
+        return datetime.date.fromisoformat(bound)
+
+    # ----------
+
     def scrape_raw_week_pattern_data(self) -> list[list[str]]:
         '''
         Helper function for `self.get_week_patterns`. Returns a 2D list.
+        '''
+        return Scraper.parse_raw_week_pattern_data(self.get_week_patterns_page_source())
+
+    # ----------
+
+    def get_week_patterns_page_source(self) -> 'str':
+        '''
+        Returns the HTML of https://timetable.dur.ac.uk/week_patterns.htm, once it's been rendered.
 
         ---
 
@@ -336,13 +441,12 @@ class Scraper:
         - Helpful StackOverflow answer on how to open the browser window "silently" - https://stackoverflow.com/a/48775203
         '''
 
-        # a class containing class variable constants used in the `find_element` method
-        from selenium.webdriver.common.by import By
-
         if _DEBUG: print("Scraping week pattern data from https://timetable.dur.ac.uk/week_patterns.htm")
 
         # ----------
 
+        import selenium.webdriver
+
         # not really sure what this Service thingy does, but apparently it's necessary.
         # `selenium.webdriver.Chrome()`` allows you to pass the path to the `chromedriver` file, but this is deprecated.
         # using this `service` thing circumvents this.
@@ -356,14 +460,33 @@ class Scraper:
         # this is like the equivalent of the BeautifulSoup class (as far as I have understood)
         driver = selenium.webdriver.Chrome(service=service, options=options)
 
-        url = Scraper.add_auth_to_url("https://timetable.dur.ac.uk/week_patterns.htm", self.username, self.password)
+        url = Scraper.add_auth_to_url(self.BASE_URLS[1], self.username, self.password)
         driver.get(url)
 
         # if _DEBUG: print("Fetched 'https://timetable.dur.ac.uk/week_patterns.htm'")
 
-        table = driver.find_element(by=By.TAG_NAME,value="table")
+        # the rows of the table are generated by a <script> once the page has loaded, so the page source is only taken now
+        page_source = driver.page_source
 
-        trs = table.find_elements(by=By.TAG_NAME, value="tr")
+        driver.quit()
+
+        return page_source
+
+    # ----------
+
+    @staticmethod
+    def parse_raw_week_pattern_data(response_text:'str') -> 'list[list[str]]':
+        '''
+        Extracts the rows of the week patterns table from the HTML of https://timetable.dur.ac.uk/week_patterns.htm, once it's been rendered
+        (i.e. from `self.get_week_patterns_page_source`, not from `requests`).
+        '''
+
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response_text, "html.parser")
+
+        table = soup.find("table")
+
+        trs = table.find_all("tr")
 
         # the first two <tr>'s are the headers of the table.
         # they look like this:
@@ -377,11 +500,7 @@ class Scraper:
 
         for tr in trs[2:]: # skipping the two rows in the mini-diagram above
 
-            # the <td> elements in the current <tr>
-            # each element in the list is of type `<selenium.webdriver.remote.webelement.WebElement`
-            tds = tr.find_elements(by=By.TAG_NAME, value="td")
-
-            row = [web_element.text.strip() for web_element in tds]
+            row = [td.get_text().strip() for td in tr.find_all("td")]
             
             data.append(row)
         
@@ -393,17 +512,13 @@ class Scraper:
 
         # the textContent of the element that contains the academic year.
         # the raw value will be something like "2022-23 Teaching Timetable"
-        academic_year_raw = driver.find_element(by=By.CLASS_NAME, value="l2sitename").text.strip()
+        academic_year_raw = soup.find(class_="l2sitename").get_text().strip()
         
         academic_year_lower = academic_year_raw.split()[0].split("-")[0]
         academic_year_upper = academic_year_lower[:2] + academic_year_raw.split()[0].split("-")[1]
 
         data.append([academic_year_lower, academic_year_upper])
 
-        # -----
-
-        driver.quit()
-
         return data
 
     # ----------
@@ -513,6 +628,8 @@ class Scraper:
 
         ### Parameters:
         - `base_url` (required) --> the `str` url from which to request data.
+
+        Raises `UpstreamError` if the request fails.
         '''
 
         # adding the username and password into base_url.
@@ -520,20 +637,39 @@ class Scraper:
         # e.g. "https:// + abdc12 + : + 1Abcd* + @ + timetable.dur.ac.uk" 
         url_with_auth = Scraper.add_auth_to_url(base_url, self.username, self.password)
 
+        host = urlsplit(base_url).hostname
+
+        import requests
         try:
-            response = requests.get(url_with_auth)
+            with metrics.span("fetch"):
+                response = requests.get(url_with_auth)
+        except requests.RequestException as error:
+            print("Error in connecting to server:", error)
+            raise UpstreamError(f"Couldn't connect to {host}") from error
+
+        metrics.UPSTREAM_REQUESTS.inc(host=host, status=response.status_code)
+        metrics.UPSTREAM_BYTES.inc(len(response.content), host=host)
+
+        # if the response status code is 400 or above
+        if not response.ok:
+            print("Error in connecting to server.")
+            print("Response status code:", response.status_code)
+            print("Reason:", response.reason)
+            raise UpstreamError(f"{host} responded with {response.status_code} {response.reason}")
+        else:
+            return response.text
 
-            # if the response status code is 400 or above
-            if not response.ok:
-                print("Error in connecting to server.")
-                print("Response status code:", response.status_code)
-                print("Reason:", response.reason)
-                sys.exit(1)
-            else:
-                return response.text
+    # ----------
 
-        except:
-            sys.exit(1)
+    async def handle_request_async(self, base_url:str) -> 'str':
+        '''
+        Awaitable version of `self.handle_request`.
+
+        `requests` has no async API, so the request is run in the event loop's default thread pool.
+        This means the event loop (see `async_server.py`) is free to serve other requests while waiting on the upstream server.
+        '''
+        import asyncio
+        return await asyncio.to_thread(self.handle_request, base_url)
 
     # ----------
 
@@ -545,11 +681,15 @@ class Scraper:
         If the request is successful, the person is a valid user, so returns `True`. Else, returns `False`.
         '''
 
-        BASE_URL = "https://www.dur.ac.uk/directory/password/"
+        BASE_URL = self.university_base_url + "/directory/password/"
 
         url_with_auth = Scraper.add_auth_to_url(BASE_URL, cis_username, password)
 
-        response = requests.get(url_with_auth)
+        import requests
+        with metrics.span("validate_credentials"):
+            response = requests.get(url_with_auth)
+
+        metrics.UPSTREAM_REQUESTS.inc(host=urlsplit(BASE_URL).hostname, status=response.status_code)
 
         print("response.reason", response.reason, response.status_code)
 
@@ -568,6 +708,13 @@ class Scraper:
             return False
 
     # ----------
+
+    async def user_credentials_are_valid_async(self, cis_username:str, password:str) -> 'bool':
+        ''' Awaitable version of `self.user_credentials_are_valid`. '''
+        import asyncio
+        return await asyncio.to_thread(self.user_credentials_are_valid, cis_username, password)
+
+    # ----------
     
     def get_module_timetable_url_parameters(self) -> 'dict':
         '''
@@ -580,7 +727,33 @@ class Scraper:
         - So I must extract the data from the `<option>` tags
         '''
 
+        params = self.get_snapshot_page("catalog")
+        if params is not MISSING:
+            return params
+
+        params = self.cache.get("catalog")
+        if params is not MISSING:
+            return params
+
         response_text = self.handle_request(base_url = self.BASE_URLS[2])
+
+        with metrics.span("parse_catalog"):
+            params = Scraper.parse_module_timetable_url_parameters(response_text)
+
+        self.cache.set("catalog", params, CACHE_TTLS["catalog"])
+        return params
+
+    # ----------
+
+    @staticmethod
+    def parse_module_timetable_url_parameters(response_text:'str') -> 'dict':
+        '''
+        Parses the HTML of `https://timetable.dur.ac.uk/module.htm` into the `dict` returned by `self.get_module_timetable_url_parameters`.
+
+        Like `Scraper.parse_module_timetable`, this doesn't need a `Scraper` instance so that it can be run in a worker process.
+        '''
+
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(response_text, "html.parser")
 
         # stores the overall data from the table
@@ -593,7 +766,8 @@ class Scraper:
             tds = tr.find_all("td")
 
             # e.g. "Select Start and End Time:"
-            option_type = tds[0].contents[0]
+            # (converted from a `bs4.NavigableString`, which drags the whole parse tree around with it when pickled)
+            option_type = str(tds[0].contents[0])
 
             # stores the values for all the individual options in this row's <select>
             # there are multiple <option>s
@@ -602,7 +776,7 @@ class Scraper:
             select = tds[1]
             for option in select.find_all("option"):
                 
-                option_text_content = option.contents[0]
+                option_text_content = str(option.contents[0])
 
                 # idk what this is, but there's a random <option> tag with no value and this as the text content...
                 if option_text_content == "...........................................":
@@ -616,9 +790,43 @@ class Scraper:
 
     # ----------
 
-    def get_module_timetable(self, module_codes:'list[str]', list_or_dict:'str' = "dict", print_activities:'bool' = False) -> 'dict[list[dict]]|list[dict]':
+    async def get_module_timetable_url_parameters_async(self, executor:'concurrent.futures.Executor' = None) -> 'dict':
+        '''
+        Awaitable version of `self.get_module_timetable_url_parameters`.
+
+        ---
+
+        ### Parameters:
+        - `executor` (optional) --> the pool in which to parse the HTML. If `None`, the event loop's default thread pool is used.
+        '''
+        params = self.get_snapshot_page("catalog")
+        if params is not MISSING:
+            return params
+
+        params = self.cache.get("catalog")
+        if params is not MISSING:
+            return params
+
+        response_text = await self.handle_request_async(self.BASE_URLS[2])
+
+        import asyncio
+
+        # (the time spent parsing in `executor`, including any time spent queueing for it)
+        with metrics.span("parse_catalog_in_pool"):
+            loop = asyncio.get_running_loop()
+            params = await loop.run_in_executor(executor, Scraper.parse_module_timetable_url_parameters, response_text)
+
+        self.cache.set("catalog", params, CACHE_TTLS["catalog"])
+        return params
+
+    # ----------
+
+    def get_module_timetable(self, module_codes:'list[str]', list_or_dict:'str' = "dict", print_activities:'bool' = False, weeks:'list[int]' = None, days:'str' = None) -> 'dict[list[dict]]|list[dict]':
         '''
         Given a `list` of module codes, scrapes the module's timetable across the whole year.
+
+        To scrape part of the year instead, pass `weeks` (a `list` of week numbers) and/or `days` (e.g. `"2-4"` for Tuesday to Thursday).
+        `self.get_module_timetable_window` does this for you given a range of dates.
         
         ---
 
@@ -665,39 +873,505 @@ class Scraper:
         example url = https://timetable.dur.ac.uk/reporting/Master;module;name;COMP2261%0D%0ACOMP2271%0D%0ACOMP2281%0D%0ACOMP3012%0D%0A?days=1-5&weeks=12-21&periods=5-41&template=module+Master&height=100&week=100
         '''
 
-        # week_patterns = self.get_week_patterns()
-        week_patterns = copy.deepcopy(WEEK_PATTERNS)
-
         if _DEBUG: print("Called Scraper.get_module_timetable")
 
-        DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        if (weeks is None) and (days is None) and self.snapshot_has_modules(module_codes):
+            return self.snapshot.get_module_timetable(module_codes, list_or_dict)
+
+        cache_key = Scraper.get_module_timetable_cache_key(module_codes, list_or_dict, weeks, days)
+        activities = self.cache.get(cache_key)
+        if activities is not MISSING:
+            return activities
+
+        report_style = self.report_style
+
+        url = self.get_module_timetable_url(module_codes, weeks, days, report_style)
+        activities = self.get_report_activities(url, report_style, list_or_dict, print_activities)
+
+        self.cache.set(cache_key, activities, CACHE_TTLS["timetable"])
+        return activities
+
+    # ----------
+
+    def get_report_activities(self, url:'str', report_style:'str', list_or_dict:'str' = "dict", print_activities:'bool' = False) -> 'dict[list[dict]]|list[dict]':
+        ''' Requests the `/reporting/` `url` (in `report_style`), and returns its activities, parsed as in `self.get_module_timetable`. '''
+
+        response_text = self.handle_request(url)
+
+        # if the report hasn't changed since it was last parsed, the activities from then are reused
+        parsed_cache_key = Scraper.get_parsed_module_timetable_cache_key(response_text, list_or_dict)
+        activities = self.cache.get(parsed_cache_key)
+
+        if activities is MISSING:
+            with metrics.span("parse"):
+                activities = Scraper.get_report_style_parser(report_style)(response_text, list_or_dict, print_activities)
+            self.cache.set(parsed_cache_key, activities, CACHE_TTLS["parsed"])
+
+        return activities
+
+    # ----------
+
+    def snapshot_has_modules(self, module_codes:'list[str]') -> 'bool':
+        ''' Returns `True` if the timetables of all of `module_codes` can be served from `self.snapshot`. '''
+        return (self.snapshot is not None) and self.snapshot.has_modules(module_codes)
+
+    # ----------
+
+    def get_snapshot_version(self, module_codes:'list[str]') -> 'str|None':
+        ''' The version of `self.snapshot`, if the timetables of all of `module_codes` will come from it (see `self.snapshot_has_modules`). Otherwise `None`. '''
+        return self.snapshot.version if self.snapshot_has_modules(module_codes) else None
+
+    # ----------
+
+    def get_snapshot_page(self, key:'str') -> 'object':
+        ''' Returns the page stored under `key` (see `snapshot.PAGE_KEYS`) in `self.snapshot`, or `MISSING` if there isn't one. '''
+        return MISSING if (self.snapshot is None) else self.snapshot.get_page(key)
+
+    # ----------
+
+    @staticmethod
+    def get_module_timetable_cache_key(module_codes:'list[str]', list_or_dict:'str' = "dict", weeks:'list[int]' = None, days:'str' = None) -> 'str':
+        '''
+        Returns the key under which the result of `self.get_module_timetable(module_codes, list_or_dict, weeks=weeks, days=days)` is cached.
+
+        The order of `module_codes` doesn't affect the result, so they're sorted.
+
+        e.g. `"timetable:dict:COMP2221,COMP2261"` for the whole year, or `"timetable:dict:COMP2221,COMP2261:weeks=15:days=2-2"` for part of it.
+        '''
+        key = "timetable:" + list_or_dict + ":" + ",".join(sorted(module_codes))
+
+        if weeks is not None:
+            key += ":weeks=" + ";".join([str(week) for week in weeks])
+        if days is not None:
+            key += ":days=" + days
+
+        return key
+
+    # ----------
+
+    @staticmethod
+    def get_parsed_module_timetable_cache_key(response_text:'str', list_or_dict:'str' = "dict") -> 'str':
+        '''
+        Returns the key under which the result of `Scraper.parse_module_timetable(response_text, list_or_dict)` is cached.
+
+        It's a digest of the report itself (and of `WEEK_PATTERNS`), so when a timetable is fetched again and the report hasn't changed,
+        the activities parsed last time are used rather than parsing it all over again.
+        '''
+        digest = hashlib.sha256(response_text.encode("utf-8")).hexdigest()
+        return f"parsed:{list_or_dict}:{WEEK_PATTERNS_VERSION}:{digest}"
+
+    # ----------
+
+    async def get_module_timetable_async(self, module_codes:'list[str]', list_or_dict:'str' = "dict", executor:'concurrent.futures.Executor' = None, weeks:'list[int]' = None, days:'str' = None) -> 'dict[list[dict]]|list[dict]':
+        '''
+        Awaitable version of `self.get_module_timetable`.
+
+        ---
+
+        ### Parameters:
+        - `module_codes` (required) --> as in `self.get_module_timetable`.
+        - `list_or_dict` (optional) --> as in `self.get_module_timetable`.
+        - `executor` (optional) --> the pool in which to parse the HTML. If `None`, the event loop's default thread pool is used.
+        - `weeks` and `days` (optional) --> as in `self.get_module_timetable`.
+        '''
+
+        if (weeks is None) and (days is None) and self.snapshot_has_modules(module_codes):
+            return self.snapshot.get_module_timetable(module_codes, list_or_dict)
+
+        cache_key = Scraper.get_module_timetable_cache_key(module_codes, list_or_dict, weeks, days)
+        activities = self.cache.get(cache_key)
+        if activities is not MISSING:
+            return activities
+
+        report_style = self.report_style
+
+        url = self.get_module_timetable_url(module_codes, weeks, days, report_style)
+        activities = await self.get_report_activities_async(url, report_style, list_or_dict, executor)
+
+        self.cache.set(cache_key, activities, CACHE_TTLS["timetable"])
+        return activities
+
+    # ----------
+
+    async def get_report_activities_async(self, url:'str', report_style:'str', list_or_dict:'str' = "dict", executor:'concurrent.futures.Executor' = None) -> 'dict[list[dict]]|list[dict]':
+        ''' Awaitable version of `self.get_report_activities`, which parses the report in `executor` (see `self.get_module_timetable_async`). '''
+
+        response_text = await self.handle_request_async(url)
+
+        parsed_cache_key = Scraper.get_parsed_module_timetable_cache_key(response_text, list_or_dict)
+        activities = self.cache.get(parsed_cache_key)
+
+        if activities is MISSING:
+            import asyncio
+
+            # (the time spent parsing in `executor`, including any time spent queueing for it)
+            with metrics.span("parse_in_pool"):
+                loop = asyncio.get_running_loop()
+                activities = await loop.run_in_executor(executor, Scraper.get_report_style_parser(report_style), response_text, list_or_dict)
+            self.cache.set(parsed_cache_key, activities, CACHE_TTLS["parsed"])
+
+        return activities
+
+    # ----------
+
+    def get_module_timetable_window(self, module_codes:'list[str]', start_date:'datetime.date', end_date:'datetime.date', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        '''
+        Returns the same as `self.get_module_timetable`, but only for the activities (and their "Dates") between `start_date` and `end_date` (inclusive).
+
+        - If the whole year's timetable for `module_codes` is in `self.snapshot` or already cached, it's sliced - no request is made.
+        - Otherwise only the weeks (and, for windows within a single week, the days) covering the window are requested from upstream.
+        This is a much smaller report than the whole year.
+        '''
+
+        if self.snapshot_has_modules(module_codes):
+            return self.snapshot.get_module_timetable_window(module_codes, start_date, end_date, list_or_dict)
+
+        full_year = self.cache.get(Scraper.get_module_timetable_cache_key(module_codes, list_or_dict))
+        if full_year is not MISSING:
+            return Scraper.slice_module_timetable(full_year, start_date, end_date)
+
+        weeks, days = Scraper.get_weeks_and_days_of_window(start_date, end_date)
+
+        # the window is entirely outside the academic year
+        if len(weeks) == 0:
+            return Scraper.slice_module_timetable(Scraper.parse_module_timetable("", list_or_dict), start_date, end_date)
+
+        activities = self.get_module_timetable(module_codes, list_or_dict, weeks=weeks, days=days)
+        return Scraper.slice_module_timetable(activities, start_date, end_date)
+
+    # ----------
+
+    async def get_module_timetable_window_async(self, module_codes:'list[str]', start_date:'datetime.date', end_date:'datetime.date', list_or_dict:'str' = "dict", executor:'concurrent.futures.Executor' = None) -> 'dict[list[dict]]|list[dict]':
+        ''' Awaitable version of `self.get_module_timetable_window`. `executor` is as in `self.get_module_timetable_async`. '''
+
+        if self.snapshot_has_modules(module_codes):
+            return self.snapshot.get_module_timetable_window(module_codes, start_date, end_date, list_or_dict)
+
+        full_year = self.cache.get(Scraper.get_module_timetable_cache_key(module_codes, list_or_dict))
+        if full_year is not MISSING:
+            return Scraper.slice_module_timetable(full_year, start_date, end_date)
+
+        weeks, days = Scraper.get_weeks_and_days_of_window(start_date, end_date)
+
+        if len(weeks) == 0:
+            return Scraper.slice_module_timetable(Scraper.parse_module_timetable("", list_or_dict), start_date, end_date)
+
+        activities = await self.get_module_timetable_async(module_codes, list_or_dict, executor, weeks=weeks, days=days)
+        return Scraper.slice_module_timetable(activities, start_date, end_date)
+
+    # ----------
+
+    def get_staff_timetable(self, staff_names:'list[str]', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        '''
+        Scrapes the timetable of every activity taught by `staff_names` (e.g. `["Smith, Jane"]`) across the whole year, from the `object=staff`
+        report (see the notes in `self.get_module_timetable`). Returns the same as `self.get_module_timetable`.
+
+        NB: a snapshot only has module timetables, so this always goes upstream (or to the cache) - `staff_index.StaffIndex` answers
+        the same question from a snapshot.
+        '''
+
+        cache_key = Scraper.get_staff_timetable_cache_key(staff_names, list_or_dict)
+        activities = self.cache.get(cache_key)
+        if activities is not MISSING:
+            return activities
+
+        report_style = self.report_style
+        activities = self.get_report_activities(self.get_staff_timetable_url(staff_names, report_style), report_style, list_or_dict)
+
+        self.cache.set(cache_key, activities, CACHE_TTLS["timetable"])
+        return activities
+
+    # ----------
+
+    async def get_staff_timetable_async(self, staff_names:'list[str]', list_or_dict:'str' = "dict", executor:'concurrent.futures.Executor' = None) -> 'dict[list[dict]]|list[dict]':
+        ''' Awaitable version of `self.get_staff_timetable`, which parses the report in `executor` (see `self.get_module_timetable_async`). '''
+
+        cache_key = Scraper.get_staff_timetable_cache_key(staff_names, list_or_dict)
+        activities = self.cache.get(cache_key)
+        if activities is not MISSING:
+            return activities
+
+        report_style = self.report_style
+        activities = await self.get_report_activities_async(self.get_staff_timetable_url(staff_names, report_style), report_style, list_or_dict, executor)
+
+        self.cache.set(cache_key, activities, CACHE_TTLS["timetable"])
+        return activities
+
+    # ----------
+
+    @staticmethod
+    def get_staff_timetable_cache_key(staff_names:'list[str]', list_or_dict:'str' = "dict") -> 'str':
+        ''' e.g. `"staff timetable:dict:Jones, Kim;Smith, Jane"` (the names contain commas, so they're joined with semicolons). '''
+        return "staff timetable:" + list_or_dict + ":" + ";".join(sorted(staff_names))
+
+    # ----------
+
+    @staticmethod
+    def get_weeks_and_days_of_window(start_date:'datetime.date', end_date:'datetime.date') -> 'tuple[list[int], str|None]':
+        '''
+        Returns the `weeks` and `days` arguments to pass to `self.get_module_timetable` in order to request the smallest report covering `start_date` to `end_date`.
+
+        `days` is only narrowed down (e.g. `"2-4"`) if the window is within a single week; otherwise it's `None` (i.e. every day).
+        '''
+
+        start_week = Scraper.get_week_number_from_date(start_date)
+        end_week = Scraper.get_week_number_from_date(end_date)
+
+        weeks = list(range(max(start_week, 1), min(end_week, 52)+1))
+
+        # (the weeks before they're clamped to 1-52, so that a window running into week 1 from before it isn't taken to be within week 1)
+        days = None
+        if start_week == end_week:
+            days = f"{start_date.isoweekday()}-{end_date.isoweekday()}"
+
+        return weeks, days
+
+    # ----------
+
+    @staticmethod
+    def slice_module_timetable(activities:'dict[list[dict]]|list[dict]', start_date:'datetime.date', end_date:'datetime.date') -> 'dict[list[dict]]|list[dict]':
+        '''
+        Given the return value of `self.get_module_timetable`, returns a copy only containing the dates between `start_date` and `end_date` (inclusive).
+        Activities which don't take place at all between them are left out.
+
+        Each activity's "Dates" are sorted YYYY-MM-DD strings, so the window is found with a binary search rather than by comparing every date.
+        '''
+
+        start_str = start_date.isoformat()
+        end_str = end_date.isoformat()
+
+        def slice_activities(activity_list:'list[dict]') -> 'list[dict]':
+            sliced = []
+            for activity in activity_list:
+                dates = activity["Dates"]
+                lower = bisect.bisect_left(dates, start_str)
+                upper = bisect.bisect_right(dates, end_str)
+                if lower < upper:
+                    sliced.append({**activity, "Dates": dates[lower:upper]})
+            return sliced
+
+        if isinstance(activities, dict):
+            return {dotw: slice_activities(activity_list) for dotw, activity_list in activities.items()}
+        else:
+            return slice_activities(activities)
+
+    # ----------
+
+    @staticmethod
+    def get_report_style_parser(report_style:'str') -> 'callable':
+        ''' Returns the static method which parses reports in `report_style` (see `REPORT_STYLE_PARSERS`), e.g. `Scraper.parse_module_timetable` for `"textspreadsheet"`. '''
+        return getattr(Scraper, REPORT_STYLE_PARSERS[report_style])
+
+    # ----------
+
+    @staticmethod
+    def activities_are_equivalent(activities_a:'list[dict]', activities_b:'list[dict]') -> 'bool':
+        ''' Returns `True` if the two `list`s of activities (as returned by `Scraper.get_module_timetable(..., "list")`) are the same, regardless of their order. '''
+        sort_key = lambda activity: (activity["Day Of The Week"], activity["Start"], activity["Activity"], activity["Room"])
+        return sorted(activities_a, key=sort_key) == sorted(activities_b, key=sort_key)
+
+    # ----------
+
+    def measure_report_style(self, module_codes:'list[str]', report_style:'str') -> 'dict':
+        '''
+        Fetches and parses the timetable of `module_codes` in `report_style`, and returns how costly that was:
+
+        ```python
+        {
+            "Bytes": int,           # the size of the report
+            "Parse Seconds": float, # how long it took to parse
+            "Activities": list,     # the parsed activities (as a `list`)
+        }
+        ```
+        '''
+
+        response_text = self.handle_request(self.get_module_timetable_url(module_codes, report_style=report_style))
+
+        start = time.perf_counter()
+        activities = Scraper.get_report_style_parser(report_style)(response_text, "list")
+        parse_seconds = time.perf_counter() - start
+
+        return {
+            "Bytes": len(response_text.encode("utf-8")),
+            "Parse Seconds": parse_seconds,
+            "Activities": activities,
+        }
+
+    # ----------
+
+    def choose_report_style(self, module_codes:'list[str]', report_styles:'list[str]' = None) -> 'str':
+        '''
+        Works out which report style is cheapest to fetch and parse, using the timetable of `module_codes` as a sample, and sets
+        `self.report_style` to it (and returns it).
+
+        Only styles which give exactly the same activities as `"textspreadsheet"` are considered (so a style whose parser gets a real
+        report wrong, or fails on it, is never picked). The cost of a style is the time it takes to parse plus the time it'd take to
+        download at `UPSTREAM_BYTES_PER_SECOND`.
+
+        The choice is cached for as long as the module catalog is, so that every process sharing the cache uses the same style.
+
+        ---
+
+        ### Parameters:
+        - `module_codes` (required) --> the modules to use as a sample. A handful of modules with a typical number of activities is best.
+        - `report_styles` (optional) --> the styles to choose from. Defaults to all of `REPORT_STYLE_PARSERS`.
+        '''
+
+        report_style = self.cache.get("report style")
+
+        if report_style is MISSING:
+            reference = self.measure_report_style(module_codes, "textspreadsheet")
+
+            costs = dict()
+            for style in (report_styles or REPORT_STYLE_PARSERS.keys()):
+                try:
+                    measurement = reference if (style == "textspreadsheet") else self.measure_report_style(module_codes, style)
+                except Exception as error:
+                    if _DEBUG: print(style, "failed:", repr(error))
+                    continue
+
+                if Scraper.activities_are_equivalent(measurement["Activities"], reference["Activities"]):
+                    costs[style] = measurement["Parse Seconds"] + measurement["Bytes"] / UPSTREAM_BYTES_PER_SECOND
+
+                if _DEBUG: print(style, measurement["Bytes"], "bytes", f"{measurement['Parse Seconds']:.3f}s", "(equivalent)" if style in costs else "(not equivalent)")
+
+            report_style = min(costs, key=costs.get) if costs else "textspreadsheet"
+            self.cache.set("report style", report_style, CACHE_TTLS["catalog"])
+
+        self.report_style = report_style
+        return report_style
+
+    # ----------
+
+    def configure_report_style(self, setting:'str' = "auto", background:'bool' = False) -> 'None':
+        '''
+        Sets `self.report_style` from `setting` (e.g. the `APP_REPORT_STYLE` environment variable, in the servers): either one of the
+        keys of `REPORT_STYLE_PARSERS`, or `"auto"` to pick the cheapest with `self.choose_report_style`, using the first
+        `REPORT_STYLE_SAMPLE_SIZE` modules of the catalog as the sample.
+
+        Picking one makes a few requests upstream, so pass `background=True` to do it in a background thread (e.g. at server startup).
+        If it can't be done (e.g. the upstream server can't be reached), `self.report_style` is left as it is.
+
+        Raises a `ValueError` if `setting` is neither.
+        '''
+
+        if setting != "auto":
+            if setting not in REPORT_STYLE_PARSERS:
+                raise ValueError(f"Unknown report style: {setting!r} (expected \"auto\" or one of {list(REPORT_STYLE_PARSERS)})")
+            self.report_style = setting
+            return
+
+        if background:
+            threading.Thread(target=self.configure_report_style, args=("auto",), daemon=True).start()
+            return
+
+        try:
+            params = self.get_module_timetable_url_parameters()
+            self.choose_report_style([code for _, code in params["Select Module(s) to View:"]][:REPORT_STYLE_SAMPLE_SIZE])
+        except UpstreamError as error:
+            if _DEBUG: print("Couldn't choose a report style:", error)
+
+    # ----------
+
+    def get_module_batches(self, module_codes:'list[str]', max_url_length:'int' = MAX_URL_LENGTH, max_batch_size:'int' = None) -> 'list[list[str]]':
+        '''
+        Splits `module_codes` into batches that can each be requested as one report (see `self.get_module_timetable_url`) - i.e. whose
+        URLs are no longer than `max_url_length`, and which have no more than `max_batch_size` modules (if it's given).
+        '''
+
+        batches = []
+        batch = []
+
+        for code in module_codes:
+            too_many = (max_batch_size is not None) and (len(batch) >= max_batch_size)
+            too_long = len(self.get_module_timetable_url(batch + [code])) > max_url_length
+
+            if batch and (too_many or too_long):
+                batches.append(batch)
+                batch = []
+
+            batch.append(code)
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    # ----------
+
+    def get_module_timetable_url(self, module_codes:'list[str]', weeks:'list[int]' = None, days:'str' = None, report_style:'str' = None) -> 'str':
+        '''
+        Builds the `/reporting/` URL from which `self.get_module_timetable` requests the timetable of `module_codes`.
+
+        See the notes in `self.get_module_timetable` for what each of the query parameters means.
+        `weeks` and `days` narrow down the report, as in `self.get_module_timetable`.
+        `report_style` is one of the keys of `REPORT_STYLE_PARSERS`, and defaults to `self.report_style`.
+        '''
+        return self.get_report_url("module", module_codes, weeks, days, report_style)
+
+    # ----------
+
+    def get_staff_timetable_url(self, staff_names:'list[str]', report_style:'str' = None) -> 'str':
+        ''' Builds the `/reporting/` URL from which `self.get_staff_timetable` requests the timetable of `staff_names` (e.g. `["Smith, Jane"]`). '''
+        # (unlike module codes, the names have spaces and commas in them)
+        return self.get_report_url("staff", [quote(name) for name in staff_names], report_style=report_style)
+
+    # ----------
+
+    def get_report_url(self, _object:'str', names:'list[str]', weeks:'list[int]' = None, days:'str' = None, report_style:'str' = None) -> 'str':
+        ''' Builds a `/reporting/` URL for the timetable of `names`, which are of the kind `_object` (e.g. `"module"` or `"staff"`). '''
 
         # -------------------------------------
         # Establishing the URL query parameters
 
-        host = "timetable.dur.ac.uk"
-        printstyle = "textspreadsheet"                        # "List"
-        _object = "module"
-        objectstr = "%0D%0A".join(module_codes) + "%0D%0A"
-        days = "1-7"                                          # "All Week"
-        weekstr = ";".join([str(num) for num in range(1,53)]) # weeks 1 through 52 i.e. every week of the whole year
+        printstyle = report_style or self.report_style        # e.g. "textspreadsheet" ("List")
+        objectstr = "%0D%0A".join(names) + "%0D%0A"
+        days = days or "1-7"                                  # "All Week"
+        weekstr = ";".join([str(num) for num in (weeks or range(1,53))]) # weeks 1 through 52 i.e. every week of the whole year
         periods = "1-56"                                      # "08:00 - 22:00 (All Day)"
         template = _object + "+" + printstyle                 # "module+Master" 
 
-        # -------------------------------------------
-        # retrieving the HTML from the Durham website
-
         # url = "https://" + host + "/reporting/" + printstyle + ";" + _object + ";name;" + objectstr + "?days=" + days + "&weeks=" + weekstr + "&periods=" + periods + "&template=" + template + "&height=100&week=100"
         url = "".join([
-            "https://",host,"/reporting/",printstyle,";",_object,";name;",objectstr,
+            self.timetable_base_url,"/reporting/",printstyle,";",_object,";name;",objectstr,
             "?days=",days,
             "&weeks=",weekstr,
             "&periods=",periods,
             "&template=",template,
             "&height=100&week=100",
         ])
-        response_text = self.handle_request(url)
-        soup = BeautifulSoup(response_text, "html.parser")
+
+        return url
+
+    # ----------
+
+    @staticmethod
+    def parse_module_timetable(response_text:'str', list_or_dict:'str' = "dict", print_activities:'bool' = False) -> 'dict[list[dict]]|list[dict]':
+        '''
+        Parses the HTML returned by the `/reporting/` URL into the activities returned by `self.get_module_timetable`.
+
+        This is kept separate from the request itself (and doesn't need a `Scraper` instance) so that the
+        CPU-bound BeautifulSoup work can be handed off to a worker process - see `async_server.py`.
+
+        ---
+
+        ### Parameters:
+        - `response_text` (required) --> the HTML of the textspreadsheet report.
+        - `list_or_dict` (optional) --> either `'dict'` or `'list'`, as in `self.get_module_timetable`.
+        - `print_activities` (optional) --> `True` if you want the activities to be printed.
+        '''
+
+        # week_patterns = self.get_week_patterns()
+        week_patterns = copy.deepcopy(WEEK_PATTERNS)
+
+        DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+        from bs4 import BeautifulSoup
+        with metrics.span("parse_html"):
+            soup = BeautifulSoup(response_text, "html.parser")
+
+        # the total time spent working out the dates of each activity from its weeks. Recorded once all the activities are done.
+        expand_weeks_seconds = 0
 
         # the formatting is weird - loads of <table>'s are used.
 
@@ -714,7 +1388,7 @@ class Scraper:
         activities_list = list()
         activities_dict = {day:[] for day in DAYS_OF_THE_WEEK}
 
-        activities_tables = [td.parent.parent for td in soup.find_all("td", text="Planned Size")]
+        activities_tables = [td.parent.parent for td in soup.find_all("td", string="Planned Size")]
 
         for table in activities_tables:
 
@@ -729,7 +1403,7 @@ class Scraper:
 
             for sibling in table.previous_siblings:
                 if sibling.name == "p":
-                    day_of_the_week = sibling.span.string
+                    day_of_the_week = str(sibling.span.string)
                     break
 
             # ----------------------------------- #
@@ -746,7 +1420,10 @@ class Scraper:
 
                 # the <td>'s within the <tr>
                 tds = tr.find_all("td", recursive=False)
-                td_values = [td.string for td in tds] # the text content of each <td>
+                # the text content of each <td>.
+                # `td.string` is a `bs4.NavigableString`, which holds a reference to the whole parse tree, so it's converted to a plain `str`.
+                # otherwise the activities can't be pickled (i.e. sent back from a worker process or stored in a `cache.SQLiteCache`).
+                td_values = [None if (td.string is None) else str(td.string) for td in tds]
 
                 handle_empty = lambda string: "" if (string == "\xa0") else string
                 pad_time     = lambda time: "0"+time if (len(time)==4) else time
@@ -798,28 +1475,12 @@ class Scraper:
                 # e.g. "13-21, 26-35, 41-42"
                 weeks_raw = td_values[ATTRIBUTES.index("Weeks")] # str
 
-                # will be filled with yyyy-mm-dd strings denoting dates on which the activity will take place
-                all_activity_dates = []
+                expand_weeks_start = time.perf_counter()
 
-                for value in weeks_raw.split(", "):
+                # yyyy-mm-dd strings denoting dates on which the activity will take place
+                all_activity_dates = Scraper.get_dates_from_weeks_string(week_patterns, weeks_raw, day_of_the_week)
 
-                    # `value`` will either be a single number-like string (e.g. "42") representing a week number,
-                    # or it'll be something like "12-13" (i.e. the span of weeks in which it takes place).
-
-                    if "-" in value: # if it's a span
-                        lower, upper = value.split("-")
-
-                        # e.g. if value is "41-44", this'd be ["41", "42", "43", "44"]
-                        all_week_numbers = [str(num) for num in range(int(lower), int(upper)+1)]
-
-                        for week in all_week_numbers:
-                            week_activity_date = self.get_datetime_date_from_week_number_and_dotw(week_patterns, week, day_of_the_week)
-                            all_activity_dates.append(week_activity_date.isoformat())
-                
-                    else: # it's a singular week
-                        # week_activity_date = Scraper.get_datetime_date_from_week_number_and_dotw(value, day_of_the_week)
-                        week_activity_date = self.get_datetime_date_from_week_number_and_dotw(week_patterns, value, day_of_the_week)
-                        all_activity_dates.append(week_activity_date.isoformat())
+                expand_weeks_seconds += time.perf_counter() - expand_weeks_start
 
                 # !! "Planned Size" is sometimes empty !!
                 # numeric string denoting the capacity of the room e.g. "50"
@@ -850,6 +1511,8 @@ class Scraper:
                     activities_dict[day_of_the_week].append(activity_dict)
                 else:
                     activities_list.append(activity_dict)
+
+        metrics.STAGE_SECONDS.observe(expand_weeks_seconds, stage="expand_weeks")
         
         # ---------
 
@@ -875,7 +1538,162 @@ class Scraper:
 
     # ----------
 
-    def get_building_code_from_room_string(self, building_codes: 'list[str]', room_string:'str') -> 'str|None':
+    @staticmethod
+    def parse_module_timetable_grid(response_text:'str', list_or_dict:'str' = "dict", print_activities:'bool' = False) -> 'dict[list[dict]]|list[dict]':
+        '''
+        Parses the HTML returned by the `/reporting/` URL for the "Grid (Individual)" report style (`printstyle = "individual"`)
+        into the same activities as `Scraper.parse_module_timetable`.
+
+        ---
+
+        The grid report has a <table> per module. Its columns are the 15-minute periods of the day (period 1 starting at 08:00) and
+        its rows are the days of the week:
+
+        ```
+        <table class='grid-border-args'>
+            <tr> <td class='col-label-one' colspan='4'>08:00</td> ... </tr>
+            <tr> <td class='row-label-one' rowspan='2'>Mon</td> <td class='cell-border'></td> ... <td class='object-cell-border' colspan='4'>...</td> ... </tr>
+            <tr> ... </tr> # a day gets another row when its activities overlap. the day's label only appears in its first row
+            ...
+        </table>
+        ```
+
+        Each activity is a `object-cell-border` cell, spanning the periods it takes place in. Inside it, the <td>s of its nested <table>s
+        are (in order) `GRID_CELL_FIELDS`.
+
+        NB: this has only been checked against the grid pages generated by `benchmarks/make_fixtures.py`, not against a recorded real
+        one. `Scraper.choose_report_style` only picks this style if it gives the same activities as `"textspreadsheet"` for real reports.
+
+        ---
+
+        ### Parameters:
+        - As in `Scraper.parse_module_timetable`.
+        '''
+
+        week_patterns = copy.deepcopy(WEEK_PATTERNS)
+
+        DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        GRID_CELL_FIELDS = ["Activity", "Module", "Description", "Room", "Staff", "Weeks", "Planned Size"]
+
+        # the start of period 1
+        FIRST_PERIOD = datetime.datetime(100, 1, 1, 8, 0)
+        PERIOD_LENGTH = datetime.timedelta(minutes=15)
+
+        handle_empty = lambda string: "" if (string == "\xa0") else string
+
+        from bs4 import BeautifulSoup
+        with metrics.span("parse_html"):
+            soup = BeautifulSoup(response_text, "html.parser")
+
+        activities_list = list()
+
+        for table in soup.find_all("table", class_="grid-border-args"):
+
+            day_of_the_week = None
+
+            for tr in table.find_all("tr", recursive=False):
+                tds = tr.find_all("td", recursive=False)
+
+                if len(tds) == 0 or "col-label-one" in tds[0].get("class", []):
+                    continue
+
+                # e.g. "Mon" --> "Monday"
+                if "row-label-one" in tds[0].get("class", []):
+                    day_abbreviation = tds[0].get_text().strip()
+                    day_of_the_week = next(day for day in DAYS_OF_THE_WEEK if day.startswith(day_abbreviation))
+                    tds = tds[1:]
+
+                # the number of periods before the current <td>
+                period = 0
+
+                for td in tds:
+                    span = int(td.get("colspan", 1))
+
+                    if "object-cell-border" in td.get("class", []):
+                        values = [str(inner_td.get_text()) for inner_td in td.find_all("td")]
+                        fields = {field: handle_empty(value) for field, value in zip(GRID_CELL_FIELDS, values)}
+
+                        start = FIRST_PERIOD + period * PERIOD_LENGTH
+                        end = start + span * PERIOD_LENGTH
+                        duration_minutes = span * 15
+
+                        activities_list.append({
+                            "Day Of The Week": day_of_the_week,
+                            "Activity":        fields["Activity"],
+                            "Description":     fields["Description"],
+                            "Module":          fields["Module"],
+                            "Start":           start.time().isoformat(),
+                            "End":             end.time().isoformat(),
+                            "Duration":        f"{duration_minutes // 60}:{duration_minutes % 60:02d}",
+                            "Room":            fields["Room"],
+                            "Staff":           fields["Staff"],
+                            "Dates":           Scraper.get_dates_from_weeks_string(week_patterns, fields["Weeks"], day_of_the_week),
+                            "Planned Size":    fields["Planned Size"],
+                        })
+
+                    period += span
+
+        activities_list.sort(key = lambda x: x["Start"])
+
+        if list_or_dict == "list":
+            if print_activities:
+                pp.pprint(activities_list)
+            return activities_list
+
+        activities_dict = {day:[] for day in DAYS_OF_THE_WEEK}
+        for activity in activities_list:
+            activities_dict[activity["Day Of The Week"]].append(activity)
+
+        if print_activities:
+            pp.pprint(activities_dict)
+
+        return activities_dict
+
+    # ----------
+
+    @staticmethod
+    def get_dates_from_weeks_string(week_patterns:'dict', weeks_raw:'str', day_of_the_week:'str') -> 'list[str]':
+        '''
+        Given the "Weeks" of an activity in the textspreadsheet report (e.g. `"13-21, 26-35, 41-42"`) and the day it's on,
+        returns every YYYY-MM-DD date on which the activity takes place.
+
+        ---
+
+        ### Parameters:
+        - `week_patterns` (required) --> the week patterns (see `WEEK_PATTERNS`).
+        - `weeks_raw` (required) --> the weeks, as they appear in the report.
+        - `day_of_the_week` (required) --> e.g. `"Monday"`.
+        '''
+
+        # will be filled with yyyy-mm-dd strings denoting dates on which the activity will take place
+        all_activity_dates = []
+
+        for value in weeks_raw.split(", "):
+
+            # `value`` will either be a single number-like string (e.g. "42") representing a week number,
+            # or it'll be something like "12-13" (i.e. the span of weeks in which it takes place).
+
+            if "-" in value: # if it's a span
+                lower, upper = value.split("-")
+
+                # e.g. if value is "41-44", this'd be ["41", "42", "43", "44"]
+                all_week_numbers = [str(num) for num in range(int(lower), int(upper)+1)]
+
+                for week in all_week_numbers:
+                    week_activity_date = Scraper.get_datetime_date_from_week_number_and_dotw(week_patterns, week, day_of_the_week)
+                    all_activity_dates.append(week_activity_date.isoformat())
+                
+            else: # it's a singular week
+                # week_activity_date = Scraper.get_datetime_date_from_week_number_and_dotw(value, day_of_the_week)
+                week_activity_date = Scraper.get_datetime_date_from_week_number_and_dotw(week_patterns, value, day_of_the_week)
+                all_activity_dates.append(week_activity_date.isoformat())
+
+        return all_activity_dates
+
+    # ----------
+
+    @staticmethod
+    def get_building_code_from_room_string(building_codes: 'list[str]', room_string:'str') -> 'str|None':
         ''' Given a room string (e.g. `"D/TLC033"`), returns the corresponding building code (e.g. `"TLC"`) '''
 
         if room_string == "":
@@ -958,10 +1776,31 @@ class Scraper:
         ```
         '''
 
-        URL = "https://www.dur.ac.uk/cis/local/facilities/location/?location_id=1"
+        building_code_dict = self.get_snapshot_page("building codes")
+        if building_code_dict is not MISSING:
+            return building_code_dict
+
+        building_code_dict = self.cache.get("building codes")
+        if building_code_dict is not MISSING:
+            return building_code_dict
+
+        URL = self.university_base_url + "/cis/local/facilities/location/?location_id=1"
 
         html_response = self.handle_request(URL)
-        soup = BeautifulSoup(html_response, "html.parser")
+        building_code_dict = Scraper.parse_building_codes(html_response)
+
+        # pp.pprint(building_code_dict)
+        self.cache.set("building codes", building_code_dict, CACHE_TTLS["buildings"])
+        return building_code_dict
+
+    # ----------
+
+    @staticmethod
+    def parse_building_codes(response_text:'str') -> 'dict[str, str]':
+        ''' Extracts the building codes from the HTML of https://www.dur.ac.uk/cis/local/facilities/location/?location_id=1. See `self.get_building_codes`. '''
+
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response_text, "html.parser")
 
         # the table containing the building codes and the buildings to which they correspond
         # each <tr> has two <td>'s
@@ -988,8 +1827,7 @@ class Scraper:
                 # print(building_code, building_name)
                 for code in building_code.split(", "):
                     building_code_dict[code] = building_name
-        
-        # pp.pprint(building_code_dict)
+
         return building_code_dict
 
     # ----------
@@ -1060,7 +1898,16 @@ class Scraper:
         - Unshortening a URL --> https://stackoverflow.com/a/28918160
         '''
 
-        URL = "https://www.dur.ac.uk/cis/local/facilities/location/?location_id=1"
+        all_urls = self.get_snapshot_page("building location urls")
+        if all_urls is MISSING:
+            all_urls = self.cache.get("building location urls")
+        if all_urls is not MISSING:
+            return all_urls if (building_name is None) else all_urls[building_name]
+
+        URL = self.university_base_url + "/cis/local/facilities/location/?location_id=1"
+
+        import requests
+        from bs4 import BeautifulSoup
 
         html_response = self.handle_request(URL)
         soup = BeautifulSoup(html_response, "html.parser")
@@ -1138,6 +1985,9 @@ class Scraper:
         all_urls["Maths & Computer Science"] = "https://goo.gl/maps/aAMaHNvBYK5SS9q49"
         all_urls['Old Elvet (Sociology)'] = "https://goo.gl/maps/NwH8XqjNzso1TW6YA"
 
+        # unshortening the urls is one request per building, so this is well worth caching
+        self.cache.set("building location urls", all_urls, CACHE_TTLS["buildings"])
+
         if building_name is None:
             return all_urls
         
@@ -1175,9 +2025,18 @@ class Scraper:
         ```
         '''
         
-        response = self.handle_request("https://timetable.dur.ac.uk")
+        response = self.handle_request(self.BASE_URLS[0])
+
+        return Scraper.parse_current_academic_year(response)
+
+    # ----------
+
+    @staticmethod
+    def parse_current_academic_year(response_text:'str') -> 'list[int,int]':
+        ''' Extracts the current academic year from the HTML of https://timetable.dur.ac.uk. See `self.get_current_academic_year`. '''
 
-        soup = BeautifulSoup(response, "html.parser")
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response_text, "html.parser")
 
         # The academic year is in a <div> with class "l2sitename" which will contain text looking someting like this:
         # "2022-23 Teaching Timetable"
@@ -1202,6 +2061,27 @@ class Scraper:
     def get_term_dates(self) -> 'dict':
         ''' Scrapes the current year's term dates from https://www.dur.ac.uk/dates/. '''
 
+        term_dates = self.cache.get("term dates")
+        if term_dates is not MISSING:
+            return term_dates
+
+        academic_year_span = self.get_current_academic_year()
+
+        response = self.handle_request(self.university_base_url + "/dates/")
+
+        term_dates = Scraper.parse_term_dates(response, academic_year_span)
+
+        pp.pprint(term_dates)
+        # print(term_dates)
+        self.cache.set("term dates", term_dates, CACHE_TTLS["term dates"])
+        return term_dates
+
+    # ----------
+
+    @staticmethod
+    def parse_term_dates(response_text:'str', academic_year_span:'list[int,int]') -> 'dict':
+        ''' Extracts the term dates of `academic_year_span` from the HTML of https://www.dur.ac.uk/dates/. See `self.get_term_dates`. '''
+
         def str_to_dt_date(s) -> 'datetime.date':
             '''
             Converts dd/mm/yyyy date to a `datetime.date` object.
@@ -1215,15 +2095,12 @@ class Scraper:
             day, month, year = s.split()
             return datetime.date(int(year), MONTHS.index(month)+1, int(day))
 
-        academic_year_span = self.get_current_academic_year()
-
         # The <table> containing the dates for the current academic year is found
         # in a <div> whose id is "year[first year in academic year span]".
         # e.g. If the academic year is 2022-23, the id will be "year2022".
 
-        response = self.handle_request("https://www.dur.ac.uk/dates/")
-
-        soup = BeautifulSoup(response, "html.parser")
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response_text, "html.parser")
 
         div_id = f"year{academic_year_span[0]}"
         target_div = soup.find(id = div_id)
@@ -1250,8 +2127,6 @@ class Scraper:
             # term_dates[term] = [start_raw, end_raw]
             term_dates[term] = [str_to_dt_date(start_raw), str_to_dt_date(end_raw)]
 
-        pp.pprint(term_dates)
-        # print(term_dates)
         return term_dates
 
 # ----------
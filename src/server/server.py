@@ -1,11 +1,31 @@
 import os
+import time
 import json
 
 import flask
 from flask_cors import CORS #, cross_origin
+from werkzeug.exceptions import BadRequest, NotFound, ServiceUnavailable
 
-from scraper import Scraper
+from scraper import Scraper, UpstreamError
+from request_args import get_local_now, get_local_datetime, get_window, get_coming_week, get_flag, get_time_of_day, get_slot, get_module_codes, get_module_sets, get_credentials
 from env import load_environment_variables
+from cache import cache_from_environment
+from mapped_snapshot import MappedSnapshot
+from store import TimetableStore
+from credential_validator import CredentialValidator, RateLimited
+import metrics
+from profiling import Profiler
+import wire_format
+from clashes import find_clashes
+import clash_matrix
+from room_index import RoomIndex
+from staff_index import StaffIndex, normalise_staff_name
+import occupancy
+import upcoming
+import snapshot_diff
+from snapshot import get_versions
+import free_time
+import batch
 
 # ============================================================
 
@@ -20,9 +40,107 @@ def server():
 
     ---
 
+    #### /validate
+    - Accessed in the `<LoginPage/>` component. The body is a JSON object: `{"username": ..., "password": ...}`.
+    - Passes the `username` and `password` to `CredentialValidator.validate` (which caches successes and rate limits the
+    upstream `Scraper.user_credentials_are_valid` check) and returns a `bool` based on if the credentials indicate that the user is valid or not.
+    - Responds with a 429 if the rate limit has been hit.
+
     #### /validate/<username>/<password>
-    - Accessed in the `<LoginPage/>` component.
-    - Passes the `username` and `password` to the `Scraper.user_credentials_are_valid` method and returns a `bool` based on if the credentials indicate that the user is valid or not.
+    - The old version of `/validate`. It puts the password in the URL (and so in server logs), so use `/validate` instead.
+
+    ---
+
+    #### /get-module-timetables
+    - Accessed in the `<Calendar/>` component. The body is a JSON `list` of module codes.
+    - Returns the timetables from `Scraper.get_module_timetable`.
+    - The optional `from` and `to` query parameters (YYYY-MM-DD dates or week numbers) restrict them to a window of dates,
+    e.g. `/get-module-timetables?from=15&to=15` for week 15 only.
+
+    ---
+
+    #### /batch-module-timetables
+    - The body is a JSON object of named sets of module codes, e.g. `{"Student A": ["COMP2221", ...], "Student B": [...]}` - e.g. for a
+    tutor's dashboard.
+    - Returns `{name: timetable}`, each timetable as from `/get-module-timetables` (and it takes the same `from` and `to` query parameters).
+    - Each module is only got once, however many sets it's in - and concurrent batches share the upstream requests for the modules
+    they have in common (see `batch.py`).
+    - With `Accept: application/x-ndjson`, the sets are streamed one per line instead, as `{"Name": ..., "Timetable": ...}`, so that
+    each can be handled as it's read (though the first is only sent once every module of every set has been got - see `batch.iter_ndjson`).
+
+    ---
+
+    #### /clashes
+    - The body is a JSON `list` of module codes (e.g. the `chosenModules`), as for `/get-module-timetables`.
+    - Returns every pair of their activities that overlap, and the dates they overlap on (see `clashes.find_clashes`).
+    - Takes the same `from` and `to` query parameters as `/get-module-timetables`. Overlapping activities of the same module
+    (e.g. alternative workshop groups) are left out unless `same-module=true` is given.
+
+    ---
+
+    #### /clash-matrix
+    - The body is a JSON `list` of module codes, or `?department=COMP` gives every module whose code starts with `COMP`.
+    - Returns how many minutes each pair of them clash for over the year (see `clash_matrix.py`) - 0 if they can be taken together.
+    - As JSON by default, or as CSV with `?format=csv`. Each matrix is computed once per snapshot and then cached.
+
+    ---
+
+    #### /rooms, /rooms/<room> and /free-rooms
+    - Only available when serving from a snapshot - the rooms are indexed from its timetables (see `room_index.py`).
+    - `/rooms` returns every room that something is timetabled in, or only those in `?building=` (e.g. `TLC`).
+    - `/rooms/<room>` (e.g. `/rooms/D/TLC042`) returns when the room is busy, and with what. Takes the same `from` and `to`
+    query parameters as `/get-module-timetables` (the whole year by default).
+    - `/free-rooms?building=TLC&week=15&day=Tuesday&start=14:00` returns the rooms in the building with nothing on in that slot.
+    `date=YYYY-MM-DD` can be given instead of `week` and `day`, and `end` (HH:MM) defaults to an hour after `start`.
+
+    ---
+
+    #### /free-time
+    - The body is a JSON `list` of `list`s of module codes - the modules of each member of a group.
+    - Returns the periods in which none of them have anything on, longest first (see `free_time.py`).
+    - Takes the same `from` and `to` query parameters as `/get-module-timetables` (by default the coming week - today and the
+    6 days after it - as over the whole year the longest periods are all in the holidays), and:
+        - `earliest` / `latest` --> only periods between these times of day (HH:MM), e.g. `earliest=09:00&latest=18:00`.
+        - `min-minutes` --> only periods at least this long (60 by default).
+        - `limit` --> at most this many periods (20 by default).
+        - `weekends=true` --> include Saturdays and Sundays.
+
+    ---
+
+    #### /staff, /staff/<name> and /staff/<name>/busy
+    - `/staff` returns every member of staff in the snapshot, or only those whose names contain `?search=` (see `staff_index.py`).
+    Only available when serving from a snapshot.
+    - `/staff/<name>` (e.g. `/staff/Smith, Jane`) returns a `list` of the activities they teach. Served from the snapshot if they're
+    in it, and otherwise from the upstream staff report (see `Scraper.get_staff_timetable`).
+    - `/staff/<name>/busy` returns when they're busy, and with what (see `occupancy.get_busy_periods`).
+    - Both take the same `from` and `to` query parameters as `/get-module-timetables`.
+
+    ---
+
+    #### /upcoming
+    - The module codes are either given as `?modules=COMP2221,COMP2261`, or as a JSON `list` in the body.
+    - Returns the next `count` (5 by default) occurrences of their activities starting at or after `after` (a YYYY-MM-DDTHH:MM
+    datetime in Durham's local time, or with a UTC offset - now by default), and every occurrence on the same day as `after`
+    (see `upcoming.py`):
+
+    ```python
+    {"After": "2022-10-25T14:00:00", "Next": [{...}, ...], "Today": [{...}, ...]}
+    ```
+
+    Each occurrence is an activity (without its "Dates") with the "Date" it's on, and its "Starts At" and "Ends At" datetimes.
+
+    ---
+
+    #### /changes
+    - `/changes?since=<version>&modules=COMP2221,COMP2261` returns the activities that were added, removed or changed in those modules
+    (or every module, if `modules` isn't given) between the snapshot `since` and the one being served (see `snapshot_diff.py`).
+    - The response's "Version" is the version being served, i.e. what to pass as `since` next time.
+    - Only available when serving from the snapshots in `APP_SNAPSHOT_DIR`.
+
+    ---
+
+    #### /metrics
+    - Per-stage timings, upstream request/byte counts, cache hits/misses and per-route latencies (see `metrics.py`), in the Prometheus text format.
 
     ---
     '''
@@ -34,8 +152,102 @@ def server():
     scraper = Scraper(
         os.environ.get("APP_SCRAPER_USERNAME"),
         os.environ.get("APP_SCRAPER_PASSWORD"),
+        # set `APP_CACHE_BACKEND=sqlite` to share the cache between worker processes
+        cache = cache_from_environment(),
+        # set `APP_STORE_PATH` (see `store.py`) and/or `APP_SNAPSHOT_DIR` to serve timetables from the latest snapshot written by `crawl.py`
+        # (the snapshot is memory-mapped, so the server is ready straight away and its workers share one copy - see `mapped_snapshot.py`)
+        snapshot = TimetableStore.from_environment() or MappedSnapshot.from_environment(),
     )
 
+    # the style of report timetables are requested in - see `Scraper.configure_report_style`. By default the cheapest is picked,
+    # in the background as it makes a few requests upstream
+    scraper.configure_report_style(os.environ.get("APP_REPORT_STYLE", "auto"), background=True)
+
+    validator = CredentialValidator(scraper)
+
+    # opt-in per-request profiling - see `profiling.py` for the environment variables that switch it on
+    profiler = Profiler.from_environment()
+
+    # the modules being got from upstream by `/batch-module-timetables`, `/clash-matrix` and `/free-time` right now, so that concurrent requests share them (see `batch.py`)
+    in_flight = batch.InFlight()
+
+    # index class (e.g. `RoomIndex`) --> the index of the snapshot. Each is built the first time it's needed,
+    # as it goes through every activity in the snapshot (see `room_index.py` and `staff_index.py`)
+    indexes = dict()
+
+    def get_index(index_class:'type') -> 'RoomIndex|StaffIndex':
+        if scraper.snapshot is None:
+            raise ServiceUnavailable("This can only be looked up when serving from a snapshot (see `crawl.py`).")
+        if index_class not in indexes:
+            indexes[index_class] = index_class.from_snapshot(scraper.snapshot)
+        return indexes[index_class]
+
+    # ----------
+
+    def get_staff_activities(name:'str') -> 'list[dict]':
+        ''' The activities taught by `name` - from the snapshot if they're in it, otherwise from the upstream staff report. '''
+
+        if scraper.snapshot is not None:
+            staff_index = get_index(StaffIndex)
+            if staff_index.has_staff(name):
+                return staff_index.get_activities(name)
+
+        return scraper.get_staff_timetable([normalise_staff_name(name)], "list")
+
+    # ------------------------------
+
+    @app.before_request
+    def start_request_timer() -> None:
+        flask.g.request_start = time.perf_counter()
+
+    # registered before `compress_response`, so that it runs after it (and the compression is included in the time)
+    @app.after_request
+    def record_request_time(response:'flask.Response') -> 'flask.Response':
+        # the route's rule (e.g. "/validate/<username>/<password>") is used rather than the path, so that each route is one set of metrics
+        rule = flask.request.url_rule.rule if (flask.request.url_rule is not None) else "unmatched"
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - flask.g.request_start,
+            route=rule, method=flask.request.method, status=response.status_code,
+        )
+        return response
+
+    # ------------------------------
+
+    @app.before_request
+    def start_profile() -> None:
+        flask.g.profile = profiler.start(flask.request.headers.get("X-Profile"))
+
+    @app.after_request
+    def finish_profile(response:'flask.Response') -> 'flask.Response':
+        if flask.g.profile is not None:
+            # the profile is tagged with the module codes, if the body is a list of them (e.g. `/get-module-timetables`)
+            body_data = flask.request.get_json(silent=True)
+            module_codes = body_data if isinstance(body_data, list) else None
+
+            rule = flask.request.url_rule.rule if (flask.request.url_rule is not None) else "unmatched"
+            profiler.finish(flask.g.profile, time.perf_counter() - flask.g.request_start, rule, module_codes)
+
+        return response
+
+    # ------------------------------
+
+    @app.after_request
+    def compress_response(response:'flask.Response') -> 'flask.Response':
+        ''' Compresses the response body if the client accepts gzip (or brotli). See `wire_format.compress`. '''
+
+        # streamed responses, error pages and anything that's already been encoded are left alone
+        if response.is_streamed or (response.status_code != 200) or ("Content-Encoding" in response.headers):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        body, encoding = wire_format.compress(response.get_data(), flask.request.accept_encodings)
+        if encoding is not None:
+            response.set_data(body)
+            response.headers["Content-Encoding"] = encoding
+
+        return response
+
     # ------------------------------
 
     @app.route("/")
@@ -44,9 +256,33 @@ def server():
 
     # ------------------------------
 
+    @app.errorhandler(RateLimited)
+    def rate_limited(error:'RateLimited') -> 'flask.Response':
+        response = flask.jsonify(str(error))
+        response.status_code = 429
+        response.headers["Retry-After"] = str(int(error.retry_after) + 1)
+        return response
+
+    @app.errorhandler(UpstreamError)
+    def upstream_error(error:'UpstreamError') -> 'flask.Response':
+        response = flask.jsonify(str(error))
+        response.status_code = 502
+        return response
+
+    # ------------------------------
+
+    @app.route("/validate", methods=["POST"])
+    def validate() -> bool:
+        username, password = get_credentials(flask.request.get_json(silent=True))
+
+        data = validator.validate(username, password)
+        return flask.jsonify(data)
+
+    # ------------------------------
+
     @app.route("/validate/<username>/<password>")
-    def validate(username:str, password:str) -> bool:
-        data = scraper.user_credentials_are_valid(username, password)
+    def validate_from_url(username:str, password:str) -> bool:
+        data = validator.validate(username, password)
         return flask.jsonify(data)
 
     # ------------------------------
@@ -67,9 +303,243 @@ def server():
         # list of module codes
         body_data = flask.request.get_json()
 
-        timetables = scraper.get_module_timetable(body_data)
-        
-        return flask.jsonify(timetables)
+        # the optional `from` and `to` query parameters (YYYY-MM-DD dates or week numbers) restrict the timetables to a window of dates.
+        # e.g. `/get-module-timetables?from=15&to=15` for just week 15.
+        window = get_window(flask.request.args)
+
+        if window is None:
+            timetables = scraper.get_module_timetable(body_data)
+        else:
+            timetables = scraper.get_module_timetable_window(body_data, *window)
+
+        # clients can opt in to a more compact format using the `Accept` header - see `wire_format.py`
+        mimetype = wire_format.negotiate_format(flask.request.accept_mimetypes)
+
+        with metrics.span("encode"):
+            if mimetype == wire_format.JSON_MIMETYPE:
+                response = flask.jsonify(timetables)
+            else:
+                response = flask.Response(wire_format.encode_timetables(timetables, mimetype), mimetype=mimetype)
+
+        response.vary.add("Accept")
+        return response
+
+    # ------------------------------
+
+    @app.route("/batch-module-timetables", methods=["POST"])
+    def get_batch_module_timetables() -> flask.Response:
+
+        # set name --> list of module codes
+        module_sets = get_module_sets(flask.request.get_json())
+        window = get_window(flask.request.args)
+
+        with metrics.span("batch"):
+            modules = batch.get_module_activities(scraper, batch.get_batch_module_codes(module_sets), in_flight)
+
+        if flask.request.accept_mimetypes.best_match(["application/json", batch.NDJSON_MIMETYPE]) == batch.NDJSON_MIMETYPE:
+            return flask.Response(batch.iter_ndjson(modules, module_sets, window), mimetype=batch.NDJSON_MIMETYPE)
+
+        return flask.jsonify({name: batch.get_set_timetable(modules, module_codes, window) for name, module_codes in module_sets.items()})
+
+    # ------------------------------
+
+    @app.route("/clashes", methods=["GET", "POST"])
+    def get_clashes() -> list:
+
+        # list of module codes
+        body_data = get_module_codes(flask.request.get_json(silent=True))
+
+        # the same `from`/`to` window as `/get-module-timetables`
+        window = get_window(flask.request.args)
+
+        # the timetables are fetched in the same way as `/get-module-timetables`, so they come from the same cache entries
+        if window is None:
+            timetables = scraper.get_module_timetable(body_data)
+        else:
+            timetables = scraper.get_module_timetable_window(body_data, *window)
+
+        activities = [activity for day in timetables.values() for activity in day]
+        include_same_module = get_flag(flask.request.args, "same-module")
+
+        with metrics.span("find_clashes"):
+            clashes = find_clashes(activities, include_same_module)
+
+        return flask.jsonify(clashes)
+
+    # ------------------------------
+
+    @app.route("/clash-matrix", methods=["GET", "POST"])
+    def get_clash_matrix() -> flask.Response:
+
+        # either a list of module codes in the body, or every module of `?department=`
+        department = flask.request.args.get("department")
+        if department is not None:
+            module_codes = clash_matrix.get_department_module_codes(scraper.get_module_timetable_url_parameters(), department)
+        else:
+            module_codes = flask.request.get_json(silent=True) or []
+
+        with metrics.span("clash_matrix"):
+            matrix = clash_matrix.get_clash_matrix(scraper, module_codes, in_flight)
+
+        if flask.request.args.get("format") == "csv":
+            return flask.Response(matrix.to_csv(), mimetype="text/csv")
+
+        return flask.jsonify(matrix.to_dict())
+
+    # ------------------------------
+
+    @app.route("/rooms", methods=["GET"])
+    def get_rooms() -> list:
+        rooms = (get_index(RoomIndex)).get_rooms(flask.request.args.get("building"))
+        return flask.jsonify(rooms)
+
+    # ------------------------------
+
+    @app.route("/rooms/<path:room>", methods=["GET"])
+    def get_room_busy(room:str) -> list:
+
+        # the whole year, unless `from`/`to` are given
+        start_date, end_date = get_window(flask.request.args, default_whole_year=True)
+
+        busy = (get_index(RoomIndex)).get_busy(room, start_date, end_date)
+        return flask.jsonify(busy)
+
+    # ------------------------------
+
+    @app.route("/free-rooms", methods=["GET"])
+    def get_free_rooms() -> list:
+
+        building = flask.request.args.get("building")
+        if building is None:
+            raise BadRequest("`building` must be given (e.g. TLC).")
+
+        date, start, end = get_slot(flask.request.args)
+
+        free_rooms = (get_index(RoomIndex)).find_free_rooms(building.upper(), date, start, end)
+        return flask.jsonify(free_rooms)
+
+    # ------------------------------
+
+    @app.route("/free-time", methods=["POST"])
+    def get_free_time() -> list:
+
+        # a list of module codes for each member of the group
+        module_sets = flask.request.get_json()
+        if (not isinstance(module_sets, list)) or (not all(isinstance(module_set, list) for module_set in module_sets)):
+            raise BadRequest("The body must be a list of lists of module codes.")
+
+        # the coming week, unless `from`/`to` are given - otherwise the longest periods would all be in the holidays
+        start_date, end_date = get_window(flask.request.args) or get_coming_week()
+
+        args = flask.request.args
+        earliest = get_time_of_day(args, "earliest")
+        latest = get_time_of_day(args, "latest")
+        try:
+            min_minutes = int(args.get("min-minutes", 60))
+            limit = int(args.get("limit", 20))
+        except ValueError:
+            raise BadRequest("`min-minutes` and `limit` must be whole numbers.")
+
+        # each module is got on its own (from the snapshot, its own cache entry, or upstream in URL-length batches - see `batch.py`),
+        # so a big group doesn't need one huge report, and members' modules are shared with everything else asking for them
+        module_codes = free_time.get_module_codes(module_sets)
+        with metrics.span("batch"):
+            modules = batch.get_module_activities(scraper, module_codes, in_flight)
+        activities = [activity for code in module_codes for activity in modules[code]]
+
+        with metrics.span("find_common_free_time"):
+            periods = free_time.find_common_free_time(
+                module_sets, activities, start_date, end_date,
+                earliest = earliest, latest = latest, min_minutes = min_minutes,
+                include_weekends = get_flag(args, "weekends"), limit = limit,
+            )
+
+        return flask.jsonify(periods)
+
+    # ------------------------------
+
+    @app.route("/staff", methods=["GET"])
+    def get_staff() -> list:
+        staff = (get_index(StaffIndex)).get_staff(flask.request.args.get("search"))
+        return flask.jsonify(staff)
+
+    # ------------------------------
+
+    @app.route("/staff/<name>", methods=["GET"])
+    def get_staff_timetable(name:str) -> list:
+
+        activities = get_staff_activities(name)
+
+        window = get_window(flask.request.args)
+        if window is not None:
+            activities = Scraper.slice_module_timetable(activities, *window)
+
+        return flask.jsonify(activities)
+
+    # ------------------------------
+
+    @app.route("/staff/<name>/busy", methods=["GET"])
+    def get_staff_busy(name:str) -> list:
+
+        activities = get_staff_activities(name)
+
+        # the whole year, unless `from`/`to` are given
+        start_date, end_date = get_window(flask.request.args, default_whole_year=True)
+
+        busy = occupancy.get_busy_periods(occupancy.union(occupancy.get_activity_bitmaps(activities)), activities, start_date, end_date)
+        return flask.jsonify(busy)
+
+    # ------------------------------
+
+    @app.route("/upcoming", methods=["GET", "POST"])
+    def get_upcoming() -> dict:
+
+        args = flask.request.args
+
+        # `?modules=COMP2221,COMP2261` (so that it can be polled with a plain GET), or a list of module codes in the body
+        if "modules" in args:
+            module_codes = [code for code in args["modules"].split(",") if code]
+        else:
+            module_codes = flask.request.get_json(silent=True) or []
+
+        # the timetables' times are in Durham (and naive), whatever the timezone of the server or the client
+        after = get_local_datetime(args, "after") or get_local_now()
+        try:
+            count = int(args.get("count", 5))
+        except ValueError:
+            raise BadRequest("`count` must be a whole number.")
+
+        index = upcoming.get_occurrence_index(scraper, module_codes)
+
+        return flask.jsonify({
+            "After": after.isoformat(timespec="seconds"),
+            "Next": index.get_next(after, count),
+            "Today": index.get_day(after.date()),
+        })
+
+    # ------------------------------
+
+    @app.route("/changes", methods=["GET"])
+    def get_changes() -> dict:
+
+        directory = os.environ.get("APP_SNAPSHOT_DIR")
+        if (scraper.snapshot is None) or (directory is None):
+            raise ServiceUnavailable("Changes can only be looked up when serving from the snapshots in `APP_SNAPSHOT_DIR` (see `crawl.py`).")
+
+        args = flask.request.args
+
+        # (checked against the snapshots that exist, as it becomes part of a path)
+        since = args.get("since")
+        if since not in get_versions(directory):
+            raise NotFound(f"There's no snapshot with the version `{since}`.")
+
+        # `?modules=COMP2221,COMP2261`, or every module if not given
+        module_codes = [code for code in args["modules"].split(",") if code] if ("modules" in args) else None
+
+        with metrics.span("get_changes"):
+            changes = snapshot_diff.get_changes(scraper, directory, since, module_codes)
+
+        return flask.jsonify(changes)
 
     # ------------------------------
 
@@ -79,10 +549,18 @@ def server():
         return flask.jsonify(var)
 
     # ------------------------------
+
+    @app.route("/metrics")
+    def get_metrics() -> str:
+        ''' The metrics in `metrics.py`, in the Prometheus text format. '''
+        return flask.Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+    # ------------------------------
     
     return app
 
 # ============================================================
 
 if __name__ == "__main__":
+    # this is Flask's development server - see `async_server.py` for running in production
     server().run(debug=True)
@@ -0,0 +1,212 @@
+'''
+Snapshots of every module's timetable, written by `crawl.py`, so that timetables can be served without scraping them on demand.
+
+Each snapshot is a gzipped JSON file in a snapshot directory, named after its version (the UTC time the crawl finished),
+e.g. `snapshots/20221014T153012Z.json.gz`. Older snapshots are kept, and a file called `LATEST` holds the version of the newest one.
+
+```python
+{
+    "Format": "snapshot-v1",
+    "Version": "20221014T153012Z",
+    "Metadata": {...}, # e.g. how long the crawl took and which report style it used
+    "Pages": {...},    # the other data the servers need, under the keys `Scraper` caches it under - see `PAGE_KEYS`
+    "Modules": {
+        "COMP2221": [...], # the activities of the module, as returned by `Scraper.get_module_timetable(["COMP2221"], "list")`
+        ...
+    }
+}
+```
+
+`Snapshot.from_environment` loads the latest snapshot in the directory given by the `APP_SNAPSHOT_DIR` environment variable,
+which `Scraper` then serves timetables (and the pages in `PAGE_KEYS`) from.
+
+See `mapped_snapshot.py` for the binary version of each snapshot, which the servers memory-map rather than load.
+'''
+
+import os
+import gzip
+import json
+import datetime
+
+from cache import MISSING
+
+FORMAT = "snapshot-v1"
+
+# The pages (other than the timetables) that a snapshot holds. They're stored under the same keys that `Scraper` caches them under.
+PAGE_KEYS = [
+    "catalog",                 # `Scraper.get_module_timetable_url_parameters`
+    "building codes",          # `Scraper.get_building_codes`
+    "building location urls",  # `Scraper.get_building_locations_urls`
+    "week patterns",           # `scraper.WEEK_PATTERNS` - the week patterns the "Dates" of the activities were worked out from
+]
+
+# ============================================================
+
+class Snapshot:
+    '''
+    The timetables of every module at the time of a crawl.
+
+    ---
+
+    ### Parameters:
+    - `version` (required) --> e.g. `"20221014T153012Z"`.
+    - `modules` (required) --> module code --> `list` of activities.
+    - `metadata` (optional) --> anything else worth knowing about the snapshot.
+    - `pages` (optional) --> page key (see `PAGE_KEYS`) --> the page's data.
+    '''
+
+    def __init__(self, version:'str', modules:'dict[str, list[dict]]', metadata:'dict' = None, pages:'dict' = None) -> 'None':
+        self.version = version
+        self.modules = modules
+        self.metadata = metadata or dict()
+        self.pages = pages or dict()
+
+    # ----------
+
+    @staticmethod
+    def load(path:'str') -> 'Snapshot':
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data.get("Format") != FORMAT:
+            raise ValueError(f"{path} isn't a {FORMAT} snapshot")
+
+        pages = {key: decode_page(key, value) for key, value in data.get("Pages", {}).items()}
+        return Snapshot(data["Version"], data["Modules"], data.get("Metadata"), pages)
+
+    # ----------
+
+    @staticmethod
+    def load_latest(directory:'str') -> 'Snapshot|None':
+        ''' Returns the newest snapshot in `directory`, or `None` if there aren't any. '''
+        version = get_latest_version(directory)
+        return None if (version is None) else Snapshot.load(get_path(directory, version))
+
+    # ----------
+
+    @staticmethod
+    def from_environment() -> 'Snapshot|None':
+        ''' Returns the newest snapshot in the `APP_SNAPSHOT_DIR` directory, or `None` if it isn't set (or there aren't any snapshots in it). '''
+        directory = os.environ.get("APP_SNAPSHOT_DIR")
+        return None if (directory is None) else Snapshot.load_latest(directory)
+
+    # ----------
+
+    def write(self, directory:'str') -> 'str':
+        ''' Writes the snapshot to `directory`, makes it the latest one, and returns its path. '''
+
+        os.makedirs(directory, exist_ok=True)
+        path = get_path(directory, self.version)
+
+        data = {"Format": FORMAT, "Version": self.version, "Metadata": self.metadata, "Pages": encode_pages(self.pages), "Modules": self.modules}
+
+        # written to a temporary file first, so that a server loading the snapshot never sees half of it
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+        with open(os.path.join(directory, "LATEST.tmp"), "w") as f:
+            f.write(self.version + "\n")
+        os.replace(os.path.join(directory, "LATEST.tmp"), os.path.join(directory, "LATEST"))
+
+        return path
+
+    # ----------
+
+    def has_modules(self, module_codes:'list[str]') -> 'bool':
+        return all(code in self.modules for code in module_codes)
+
+    # ----------
+
+    def get_module_codes(self) -> 'list[str]':
+        ''' Every module code in the snapshot, in order. '''
+        return sorted(self.modules)
+
+    # ----------
+
+    def get_page(self, key:'str') -> 'object':
+        ''' Returns the page stored under `key` (one of `PAGE_KEYS`), or `cache.MISSING` if the snapshot doesn't have it. '''
+        return self.pages.get(key, MISSING)
+
+    # ----------
+
+    def get_module_timetable(self, module_codes:'list[str]', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable(module_codes, list_or_dict)`, from the snapshot. Every module must be in it (see `self.has_modules`). '''
+
+        DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+        activities = [activity for code in dict.fromkeys(module_codes) for activity in self.modules[code]]
+        activities.sort(key = lambda x: x["Start"])
+
+        if list_or_dict == "list":
+            return activities
+
+        activities_dict = {day:[] for day in DAYS_OF_THE_WEEK}
+        for activity in activities:
+            activities_dict[activity["Day Of The Week"]].append(activity)
+
+        return activities_dict
+
+    # ----------
+
+    def get_module_timetable_window(self, module_codes:'list[str]', start_date:'datetime.date', end_date:'datetime.date', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable_window`, from the snapshot. Every module must be in it (see `self.has_modules`). '''
+        from scraper import Scraper
+        return Scraper.slice_module_timetable(self.get_module_timetable(module_codes, list_or_dict), start_date, end_date)
+
+# ============================================================
+
+def new_version() -> 'str':
+    ''' e.g. `"20221014T153012Z"` - the current UTC time. Versions sort in the order they were made. '''
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+# ----------
+
+def encode_pages(pages:'dict') -> 'dict':
+    ''' Converts `pages` into something that can be written as JSON. The week patterns are the only page with anything (i.e. dates) that can't be. '''
+
+    encoded = dict(pages)
+
+    if "week patterns" in pages:
+        encoded["week patterns"] = {
+            week: {**pattern, "Calendar Date": [date.isoformat() for date in pattern["Calendar Date"]]}
+            for week, pattern in pages["week patterns"].items()
+        }
+
+    return encoded
+
+# ----------
+
+def decode_page(key:'str', value:'object') -> 'object':
+    ''' Undoes `encode_pages` for the page stored under `key`. '''
+
+    if key == "week patterns":
+        return {
+            week: {**pattern, "Calendar Date": [datetime.date.fromisoformat(date) for date in pattern["Calendar Date"]]}
+            for week, pattern in value.items()
+        }
+
+    return value
+
+# ----------
+
+def get_path(directory:'str', version:'str') -> 'str':
+    return os.path.join(directory, version + ".json.gz")
+
+# ----------
+
+def get_versions(directory:'str') -> 'list[str]':
+    ''' The versions of every snapshot in `directory`, oldest first. '''
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".json.gz")] for name in os.listdir(directory) if name.endswith(".json.gz"))
+
+# ----------
+
+def get_latest_version(directory:'str') -> 'str|None':
+    try:
+        with open(os.path.join(directory, "LATEST")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        versions = get_versions(directory)
+        return versions[-1] if versions else None
@@ -0,0 +1,127 @@
+'''
+What changed in the timetables between two snapshots (see `snapshot.py`) - e.g. rooms that moved and sessions that were added -
+so that clients can poll for just the changes since the version they last saw, rather than downloading the whole year again.
+
+Activities are matched up by their "Activity" code (e.g. `"COMP2261/LEC/003"`), which stays the same when e.g. its room changes.
+If a module has more than one activity with the same code, the second, third... (in order of day and time) are matched up as
+`"COMP2261/LEC/003#2"`, `"COMP2261/LEC/003#3"`...
+
+```python
+{
+    "Since": "20221014T153012Z",
+    "Version": "20221021T153208Z",
+    "Modules": {                        # only the modules that changed
+        "COMP2261": {
+            "Added":   [{...}, ...],    # the activities that are new
+            "Removed": ["COMP2261/LEC/004", ...],
+            "Changed": [{"Activity": "COMP2261/LEC/003", "Before": {"Room": "D/CG91"}, "After": {"Room": "D/TLC042"}}, ...],
+        },
+        ...
+    }
+}
+```
+
+When both snapshots are memory-mapped (see `mapped_snapshot.py`), a module whose stored JSON is byte-for-byte the same in both
+is skipped without being decoded - which is most of them.
+'''
+
+from cache import MISSING
+from mapped_snapshot import MappedSnapshot
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ============================================================
+
+def get_keyed_activities(activities:'list[dict]') -> 'dict[str, dict]':
+    ''' key (see the top of this file) --> activity, for each of `activities` (the activities of one module). '''
+
+    by_code = dict()
+    for activity in sorted(activities, key = lambda activity: (DAYS_OF_THE_WEEK.index(activity["Day Of The Week"]), activity["Start"], activity["End"])):
+        by_code.setdefault(activity["Activity"], []).append(activity)
+
+    keyed = dict()
+    for code, same_code in by_code.items():
+        for number, activity in enumerate(same_code, start=1):
+            keyed[code if (number == 1) else f"{code}#{number}"] = activity
+
+    return keyed
+
+# ----------
+
+def diff_activities(before:'list[dict]', after:'list[dict]') -> 'dict|None':
+    ''' The "Added", "Removed" and "Changed" activities of one module (see the top of this file), or `None` if nothing changed. '''
+
+    before_keyed = get_keyed_activities(before)
+    after_keyed = get_keyed_activities(after)
+
+    added = [activity for key, activity in after_keyed.items() if key not in before_keyed]
+    removed = [key for key in before_keyed if key not in after_keyed]
+
+    changed = []
+    for key, activity in after_keyed.items():
+        old_activity = before_keyed.get(key)
+        if (old_activity is None) or (old_activity == activity):
+            continue
+
+        fields = [field for field in dict.fromkeys([*old_activity, *activity]) if old_activity.get(field) != activity.get(field)]
+        changed.append({
+            "Activity": key,
+            "Before": {field: old_activity.get(field) for field in fields},
+            "After": {field: activity.get(field) for field in fields},
+        })
+
+    if not (added or removed or changed):
+        return None
+
+    return {"Added": added, "Removed": removed, "Changed": changed}
+
+# ----------
+
+def get_module_activities(snapshot:'Snapshot|MappedSnapshot|TimetableStore', module_code:'str') -> 'list[dict]':
+    ''' The activities of `module_code` in `snapshot` - none if it isn't in it. '''
+    return snapshot.get_module_timetable([module_code], "list") if snapshot.has_modules([module_code]) else []
+
+# ----------
+
+def diff_snapshots(before:'Snapshot|MappedSnapshot|TimetableStore', after:'Snapshot|MappedSnapshot|TimetableStore', module_codes:'list[str]' = None) -> 'dict':
+    ''' What changed between `before` and `after` (see the top of this file), in `module_codes` - or in every module in either of them if `None`. '''
+
+    if module_codes is None:
+        module_codes = sorted(set(before.get_module_codes()) | set(after.get_module_codes()))
+
+    both_mapped = isinstance(before, MappedSnapshot) and isinstance(after, MappedSnapshot)
+
+    modules = dict()
+    for code in dict.fromkeys(module_codes):
+        if both_mapped and (before.get_module_data(code) == after.get_module_data(code)):
+            continue
+
+        module_diff = diff_activities(get_module_activities(before, code), get_module_activities(after, code))
+        if module_diff is not None:
+            modules[code] = module_diff
+
+    return {"Since": before.version, "Version": after.version, "Modules": modules}
+
+# ============================================================
+
+def get_changes(scraper:'Scraper', directory:'str', since:'str', module_codes:'list[str]' = None) -> 'dict':
+    '''
+    What changed between the snapshot `since` in `directory` and the one `scraper` is serving from (`scraper.snapshot`), in
+    `module_codes` (or every module if `None`).
+
+    The diff of every module is cached (in `scraper.cache`) for as long as the cache keeps it, as neither snapshot ever changes,
+    and `module_codes` are picked out of it. So there's only ever one entry per pair of snapshots, whatever modules clients ask for.
+    '''
+
+    cache_key = f"changes:{since}:{scraper.snapshot.version}"
+
+    changes = scraper.cache.get(cache_key)
+    if changes is MISSING:
+        changes = diff_snapshots(MappedSnapshot.load_version(directory, since), scraper.snapshot)
+        scraper.cache.set(cache_key, changes)
+
+    if module_codes is None:
+        return changes
+
+    modules = {code: changes["Modules"][code] for code in dict.fromkeys(module_codes) if code in changes["Modules"]}
+    return {**changes, "Modules": modules}
@@ -0,0 +1,84 @@
+'''
+Every member of staff's activities, built from a snapshot (see `snapshot.py`), so that a lecturer's timetable doesn't need every module scanned.
+
+The "Staff" of an activity can be several people (e.g. `"Smith, Jane, Jones, Kim"`), so it's split up with `store.split_staff`,
+and each name is normalised (see `normalise_staff_name`) so that e.g. `"smith,  jane"` finds `"Smith, Jane"`.
+
+```python
+index = StaffIndex.from_snapshot(MappedSnapshot.from_environment())
+index.get_activities("Smith, Jane")
+```
+
+Anyone who isn't in the snapshot can still be looked up upstream, with `Scraper.get_staff_timetable` (see `/staff` in `server.py`).
+'''
+
+from store import split_staff
+
+# ============================================================
+
+class StaffIndex:
+    '''
+    Every member of staff in `activities`, and the activities they teach.
+
+    ---
+
+    ### Parameters:
+    - `activities` (required) --> every activity to index, as returned by `Scraper.get_module_timetable(..., "list")`.
+    '''
+
+    def __init__(self, activities:'list[dict]') -> 'None':
+
+        # key (see `get_staff_key`) --> the name as it's written in the timetables
+        self.names = dict()
+        # key --> activities
+        self.activities = dict()
+
+        for activity in activities:
+            for name in get_staff_names(activity["Staff"]):
+                key = get_staff_key(name)
+                self.names.setdefault(key, name)
+                self.activities.setdefault(key, []).append(activity)
+
+    # ----------
+
+    @staticmethod
+    def from_snapshot(snapshot:'Snapshot|MappedSnapshot|TimetableStore') -> 'StaffIndex':
+        ''' Indexes every activity of every module in `snapshot`. '''
+        return StaffIndex(snapshot.get_module_timetable(snapshot.get_module_codes(), "list"))
+
+    # ----------
+
+    def has_staff(self, name:'str') -> 'bool':
+        return get_staff_key(name) in self.names
+
+    # ----------
+
+    def get_staff(self, search:'str' = None) -> 'list[str]':
+        ''' Every member of staff (sorted), or only those whose names contain `search` (ignoring case). '''
+        search = None if (search is None) else get_staff_key(search)
+        return sorted(name for key, name in self.names.items() if (search is None) or (search in key))
+
+    # ----------
+
+    def get_activities(self, name:'str') -> 'list[dict]':
+        ''' The activities taught by `name` (e.g. `"Smith, Jane"`), sorted by their start time. Empty if they aren't in the index. '''
+        return sorted(self.activities.get(get_staff_key(name), []), key = lambda activity: activity["Start"])
+
+# ============================================================
+
+def normalise_staff_name(name:'str') -> 'str':
+    ''' e.g. `"Smith, Jane"` from `" Smith,\\xa0 Jane "` - surrounding whitespace removed, and any run of whitespace made a single space. '''
+    return ", ".join(" ".join(part.split()) for part in name.split(","))
+
+# ----------
+
+def get_staff_key(name:'str') -> 'str':
+    ''' What `name` is looked up by - e.g. `"smith, jane"` for `"Smith,  Jane"`. '''
+    return normalise_staff_name(name).casefold()
+
+# ----------
+
+def get_staff_names(staff:'str|list[str]') -> 'list[str]':
+    ''' The normalised names of everyone in the "Staff" of an activity (which is usually a `str`, but can be a `list` - see `Scraper.get_module_timetable`). '''
+    staff_strings = staff if isinstance(staff, list) else [staff]
+    return [normalise_staff_name(name) for staff_string in staff_strings for name in split_staff(staff_string)]
@@ -0,0 +1,400 @@
+'''
+A persistent, indexed store of timetables in an SQLite database, so that activities can be looked up by module, date, room,
+staff member or building without scraping anything (or loading a whole snapshot into memory).
+
+```python
+store = TimetableStore("timetables.sqlite3")
+store.load_snapshot(Snapshot.load_latest("snapshots"))
+
+store.query(module_codes=["COMP2221", "COMP2261"], start_date=datetime.date(2022, 10, 3), end_date=datetime.date(2022, 10, 9))
+store.query(room="D/TLC042")
+store.query(staff="Smith, Jane")
+store.query(building="TLC", start_date=datetime.date(2022, 10, 3), end_date=datetime.date(2022, 10, 3))
+```
+
+The tables are:
+- `modules` --> every module code that's been loaded (including modules with no activities, so that those can be served too).
+- `activities` --> one row per activity, holding the activity's `dict` (as returned by `Scraper.get_module_timetable(..., "list")`) as JSON.
+- `occurrences` --> one row per date on which an activity takes place.
+- `activity_rooms` / `activity_staff` --> the room(s) (and the building of each) and staff member(s) of each activity.
+
+`TimetableStore` has the same `has_modules`/`get_module_timetable`/`get_module_timetable_window`/`get_page` methods as `snapshot.Snapshot`, so either can be passed to `Scraper`
+as its `snapshot`. `TimetableStore.from_environment` opens the store at `APP_STORE_PATH`, loading the latest snapshot in
+`APP_SNAPSHOT_DIR` into it if it's newer than what's in there.
+
+```
+python store.py --path timetables.sqlite3 --snapshot-dir snapshots
+```
+'''
+
+import os
+import json
+import sqlite3
+import argparse
+import datetime
+import threading
+
+from scraper import Scraper
+from cache import MISSING
+from snapshot import Snapshot, get_latest_version, get_path, encode_pages, decode_page
+
+DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS modules (
+        code TEXT PRIMARY KEY
+    );
+    CREATE TABLE IF NOT EXISTS activities (
+        id     INTEGER PRIMARY KEY,
+        module TEXT NOT NULL,
+        day    TEXT NOT NULL,
+        start  TEXT NOT NULL,
+        end    TEXT NOT NULL,
+        data   TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS occurrences (
+        activity_id INTEGER NOT NULL,
+        date        TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS activity_rooms (
+        activity_id INTEGER NOT NULL,
+        room        TEXT NOT NULL COLLATE NOCASE,
+        building    TEXT COLLATE NOCASE
+    );
+    CREATE TABLE IF NOT EXISTS activity_staff (
+        activity_id INTEGER NOT NULL,
+        staff       TEXT NOT NULL COLLATE NOCASE
+    );
+
+    CREATE INDEX IF NOT EXISTS activities_module      ON activities (module, start);
+    CREATE INDEX IF NOT EXISTS occurrences_date       ON occurrences (date, activity_id);
+    CREATE INDEX IF NOT EXISTS occurrences_activity   ON occurrences (activity_id, date);
+    CREATE INDEX IF NOT EXISTS activity_rooms_room    ON activity_rooms (room, activity_id);
+    CREATE INDEX IF NOT EXISTS activity_rooms_bldg    ON activity_rooms (building, activity_id);
+    CREATE INDEX IF NOT EXISTS activity_rooms_act     ON activity_rooms (activity_id);
+    CREATE INDEX IF NOT EXISTS activity_staff_staff   ON activity_staff (staff, activity_id);
+    CREATE INDEX IF NOT EXISTS activity_staff_act     ON activity_staff (activity_id);
+"""
+
+# ============================================================
+
+class TimetableStore:
+    '''
+    Stores activities in an SQLite database at `path` (see the top of this file).
+
+    Like `cache.SQLiteCache`, the database is in WAL mode, so several server workers can read from the same file.
+
+    ---
+
+    ### Parameters:
+    - `path` (required) --> the path of the database file. It's created if it doesn't exist.
+    '''
+
+    def __init__(self, path:'str') -> 'None':
+        self.path = path
+
+        # SQLite connections can't be shared between threads (or processes), so each thread gets its own.
+        self.local = threading.local()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+
+    # ----------
+
+    def connection(self) -> 'sqlite3.Connection':
+        ''' Returns the connection belonging to the current thread (and process), opening one if needed. '''
+
+        # the pid is checked so that a connection opened before the server forks its workers isn't reused in them
+        pid, connection = getattr(self.local, "connection", (None, None))
+
+        if pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = (os.getpid(), connection)
+
+        return connection
+
+    # ----------
+
+    @staticmethod
+    def from_environment() -> 'TimetableStore|None':
+        '''
+        Returns the store at the `APP_STORE_PATH` environment variable, or `None` if it isn't set.
+
+        If `APP_SNAPSHOT_DIR` is set too, and its latest snapshot isn't the one in the store, the snapshot is loaded into the store first.
+        '''
+
+        path = os.environ.get("APP_STORE_PATH")
+        if path is None:
+            return None
+
+        store = TimetableStore(path)
+
+        # only the latest version's name is read to begin with - the snapshot itself is only decoded if the store needs it
+        directory = os.environ.get("APP_SNAPSHOT_DIR")
+        latest_version = None if (directory is None) else get_latest_version(directory)
+        if (latest_version is not None) and (latest_version != store.version):
+            store.load_snapshot(Snapshot.load(get_path(directory, latest_version)))
+
+        return store
+
+    # ----------
+
+    @property
+    def version(self) -> 'str|None':
+        ''' The version of the snapshot last loaded into the store (see `self.load_snapshot`). '''
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return None if (row is None) else row[0]
+
+    # ============================================================
+    # Loading
+
+    def load_modules(self, modules:'dict[str, list[dict]]', building_codes:'list[str]' = None, replace_all:'bool' = False, version:'str' = None, pages:'dict' = None) -> 'None':
+        '''
+        Stores the activities of each module in `modules`, replacing whatever was stored for those modules before.
+
+        ---
+
+        ### Parameters:
+        - `modules` (required) --> module code --> `list` of activities, as in `Snapshot.modules`.
+        - `building_codes` (optional) --> the building codes (the keys of `Scraper.get_building_codes`), so that the building
+        of each room can be worked out. If `None`, activities can't be queried by building.
+        - `replace_all` (optional) --> if `True`, everything else in the store is removed as well.
+        - `version` (optional) --> the version of the snapshot that `modules` came from (see `self.version`).
+        - `pages` (optional) --> if given, replaces the stored pages (see `snapshot.PAGE_KEYS`). They're written in the same transaction
+        as `modules` and `version`, so nothing ever sees (or is left with, after a crash) the new version without its pages.
+        '''
+
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if replace_all:
+                for table in ["modules", "activities", "occurrences", "activity_rooms", "activity_staff"]:
+                    connection.execute(f"DELETE FROM {table}")
+            else:
+                self.delete_modules(list(modules.keys()))
+
+            connection.executemany("INSERT OR IGNORE INTO modules (code) VALUES (?)", [(code,) for code in modules])
+
+            next_id = connection.execute("SELECT coalesce(max(id), 0) + 1 FROM activities").fetchone()[0]
+
+            activity_rows, occurrence_rows, room_rows, staff_rows = [], [], [], []
+
+            for activities in modules.values():
+                for activity in activities:
+                    activity_id = next_id
+                    next_id += 1
+
+                    activity_rows.append((
+                        activity_id, activity["Module"], activity["Day Of The Week"], activity["Start"], activity["End"],
+                        json.dumps(activity, separators=(",", ":")),
+                    ))
+                    occurrence_rows.extend((activity_id, date) for date in activity["Dates"])
+
+                    for room in split_rooms(activity["Room"]):
+                        building = None if (building_codes is None) else Scraper.get_building_code_from_room_string(building_codes, room)
+                        room_rows.append((activity_id, room, building))
+
+                    staff_rows.extend((activity_id, staff) for staff in split_staff(activity["Staff"]))
+
+            connection.executemany("INSERT INTO activities (id, module, day, start, end, data) VALUES (?, ?, ?, ?, ?, ?)", activity_rows)
+            connection.executemany("INSERT INTO occurrences (activity_id, date) VALUES (?, ?)", occurrence_rows)
+            connection.executemany("INSERT INTO activity_rooms (activity_id, room, building) VALUES (?, ?, ?)", room_rows)
+            connection.executemany("INSERT INTO activity_staff (activity_id, staff) VALUES (?, ?)", staff_rows)
+
+            if pages is not None:
+                connection.execute("DELETE FROM meta WHERE key LIKE 'page:%'")
+                connection.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    [("page:" + key, json.dumps(value, separators=(",", ":"))) for key, value in encode_pages(pages).items()],
+                )
+
+            if version is not None:
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        # so that the query planner knows e.g. that a module has far fewer occurrences than a date does
+        connection.execute("ANALYZE")
+
+    # ----------
+
+    def delete_modules(self, module_codes:'list[str]') -> 'None':
+        ''' Removes `module_codes` and their activities from the store. '''
+
+        connection = self.connection()
+        codes = json.dumps(module_codes)
+
+        activity_ids = "SELECT id FROM activities WHERE module IN (SELECT value FROM json_each(?))"
+        for table in ["occurrences", "activity_rooms", "activity_staff"]:
+            connection.execute(f"DELETE FROM {table} WHERE activity_id IN ({activity_ids})", (codes,))
+
+        connection.execute("DELETE FROM activities WHERE module IN (SELECT value FROM json_each(?))", (codes,))
+        connection.execute("DELETE FROM modules WHERE code IN (SELECT value FROM json_each(?))", (codes,))
+
+    # ----------
+
+    def load_snapshot(self, snapshot:'Snapshot') -> 'None':
+        '''
+        Replaces everything in the store with the contents of `snapshot` (including its pages - see `snapshot.PAGE_KEYS`).
+
+        The building codes are taken from the snapshot's pages, if they're there.
+        '''
+
+        building_codes = snapshot.get_page("building codes")
+        building_codes = None if (building_codes is MISSING) else list(building_codes.keys())
+
+        self.load_modules(snapshot.modules, building_codes, replace_all=True, version=snapshot.version, pages=snapshot.pages)
+
+    # ============================================================
+    # Querying
+
+    def has_modules(self, module_codes:'list[str]') -> 'bool':
+        codes = set(module_codes)
+        row = self.connection().execute("SELECT count(*) FROM modules WHERE code IN (SELECT value FROM json_each(?))", (json.dumps(list(codes)),)).fetchone()
+        return row[0] == len(codes)
+
+    # ----------
+
+    def get_module_codes(self) -> 'list[str]':
+        ''' Every module code in the store, in order. '''
+        return [code for code, in self.connection().execute("SELECT code FROM modules ORDER BY code")]
+
+    # ----------
+
+    def get_page(self, key:'str') -> 'object':
+        ''' Returns the page stored under `key` (one of `snapshot.PAGE_KEYS`) by `self.load_snapshot`, or `cache.MISSING` if there isn't one. '''
+        row = self.connection().execute("SELECT value FROM meta WHERE key = ?", ("page:" + key,)).fetchone()
+        return MISSING if (row is None) else decode_page(key, json.loads(row[0]))
+
+    # ----------
+
+    def query(self, module_codes:'list[str]' = None, start_date:'datetime.date' = None, end_date:'datetime.date' = None, room:'str' = None, staff:'str' = None, building:'str' = None, list_or_dict:'str' = "list") -> 'dict[list[dict]]|list[dict]':
+        '''
+        Returns the activities matching every one of the given filters, sorted by their start time.
+
+        ---
+
+        ### Parameters:
+        - `module_codes` (optional) --> only activities of these modules.
+        - `start_date` / `end_date` (optional) --> only activities taking place between these dates (inclusive).
+        The "Dates" of each activity are narrowed down to the ones between them, as in `Scraper.slice_module_timetable`.
+        - `room` (optional) --> only activities in this room, e.g. `"D/TLC042"`.
+        - `staff` (optional) --> only activities taught by this staff member, e.g. `"Smith, Jane"`.
+        - `building` (optional) --> only activities in this building, e.g. `"TLC"`.
+        - `list_or_dict` (optional) --> either `'list'` or `'dict'`, as in `Scraper.get_module_timetable`.
+        '''
+
+        conditions = []
+        parameters = []
+
+        if module_codes is not None:
+            conditions.append("a.module IN (SELECT value FROM json_each(?))")
+            parameters.append(json.dumps(list(module_codes)))
+        if room is not None:
+            conditions.append("a.id IN (SELECT activity_id FROM activity_rooms WHERE room = ?)")
+            parameters.append(room)
+        if building is not None:
+            conditions.append("a.id IN (SELECT activity_id FROM activity_rooms WHERE building = ?)")
+            parameters.append(building)
+        if staff is not None:
+            conditions.append("a.id IN (SELECT activity_id FROM activity_staff WHERE staff = ?)")
+            parameters.append(staff)
+
+        windowed = (start_date is not None) or (end_date is not None)
+
+        if windowed:
+            # the dates of each activity within the window, in one go
+            conditions.append("o.date BETWEEN ? AND ?")
+            parameters.extend([
+                (start_date or datetime.date.min).isoformat(),
+                (end_date or datetime.date.max).isoformat(),
+            ])
+            sql = "SELECT a.data, group_concat(o.date) FROM activities a JOIN occurrences o ON o.activity_id = a.id"
+        else:
+            sql = "SELECT a.data, NULL FROM activities a"
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if windowed:
+            sql += " GROUP BY a.id"
+        sql += " ORDER BY a.start, a.id"
+
+        activities = []
+        for data, dates in self.connection().execute(sql, parameters):
+            activity = json.loads(data)
+            if windowed:
+                activity["Dates"] = sorted(dates.split(","))
+            activities.append(activity)
+
+        if list_or_dict == "list":
+            return activities
+
+        activities_dict = {day:[] for day in DAYS_OF_THE_WEEK}
+        for activity in activities:
+            activities_dict[activity["Day Of The Week"]].append(activity)
+
+        return activities_dict
+
+    # ----------
+
+    def get_module_timetable(self, module_codes:'list[str]', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable(module_codes, list_or_dict)`, from the store. Every module must be in it (see `self.has_modules`). '''
+        return self.query(module_codes=module_codes, list_or_dict=list_or_dict)
+
+    # ----------
+
+    def get_module_timetable_window(self, module_codes:'list[str]', start_date:'datetime.date', end_date:'datetime.date', list_or_dict:'str' = "dict") -> 'dict[list[dict]]|list[dict]':
+        ''' Returns the same as `Scraper.get_module_timetable_window`, from the store. Every module must be in it (see `self.has_modules`). '''
+        return self.query(module_codes=module_codes, start_date=start_date, end_date=end_date, list_or_dict=list_or_dict)
+
+# ============================================================
+
+def split_rooms(room_string:'str') -> 'list[str]':
+    ''' e.g. `["D/CG91", "D/CG93"]` from `"D/CG91, D/CG93"`. Activities with no room (`"\\xa0"` in the reports) have none. '''
+    return [room.strip() for room in room_string.split(",") if room.strip()]
+
+# ----------
+
+def split_staff(staff_string:'str') -> 'list[str]':
+    '''
+    e.g. `["Smith, Jane", "Jones, Kim"]` from `"Smith, Jane, Jones, Kim"`.
+
+    Each staff member is written as "Surname, Forename", so the parts are paired up. If they can't be (i.e. there's an odd number of them),
+    the whole string is taken to be one staff member.
+    '''
+
+    parts = [part.strip() for part in staff_string.split(",") if part.strip()]
+
+    if len(parts) % 2 != 0:
+        return [staff_string.strip()] if parts else []
+
+    return [f"{parts[i]}, {parts[i + 1]}" for i in range(0, len(parts), 2)]
+
+# ============================================================
+
+def main() -> 'None':
+    parser = argparse.ArgumentParser(description="Loads the latest snapshot into a timetable store.")
+    parser.add_argument("--path", default="timetables.sqlite3", help="the store's database file")
+    parser.add_argument("--snapshot-dir", default="snapshots", help="the directory of snapshots written by crawl.py")
+    args = parser.parse_args()
+
+    snapshot = Snapshot.load_latest(args.snapshot_dir)
+    if snapshot is None:
+        parser.error(f"There are no snapshots in {args.snapshot_dir}")
+
+    store = TimetableStore(args.path)
+    store.load_snapshot(snapshot)
+
+    print(f"Loaded snapshot {snapshot.version} ({len(snapshot.modules)} modules) into {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+'''
+What's coming up next in a set of modules' timetables - e.g. for "what's my next class?" widgets, which ask every few minutes.
+
+Rather than going through every activity's "Dates" each time, every occurrence of every activity is put in order once, as parallel
+sorted `list`s of start times (`"YYYY-MM-DDTHH:MM:SS"` strings, which sort in time order) and activity ids. Then both "the next `n`
+after a given time" and "everything on a given day" are a `bisect` or two.
+
+The index of each set of modules is cached (in `scraper.cache`), per snapshot version, like `clash_matrix.ClashMatrix` - for a day
+(`CACHE_TTLS["derived"]`) rather than for ever, as every widget can ask for a different set.
+
+```python
+index = get_occurrence_index(scraper, ["COMP2221", "COMP2261"])
+index.get_next(datetime.datetime(2022, 10, 25, 14, 0), 3)
+index.get_day(datetime.date(2022, 10, 25))
+```
+'''
+
+import bisect
+import datetime
+
+from cache import MISSING, get_module_codes_digest
+from scraper import CACHE_TTLS
+from clashes import without_dates
+
+# ============================================================
+
+class OccurrenceIndex:
+    '''
+    Every occurrence of every one of `activities`, in order.
+
+    ---
+
+    ### Parameters:
+    - `activities` (required) --> as returned by `Scraper.get_module_timetable(..., "list")`.
+    '''
+
+    def __init__(self, activities:'list[dict]') -> 'None':
+        # activity id --> the activity (without its "Dates", as each occurrence only has the one)
+        self.activities = [without_dates(activity) for activity in activities]
+
+        # (the times are made "HH:MM:SS", whichever the report gave, so that they compare properly with `datetime.isoformat`)
+        occurrences = sorted(
+            (f"{date}T{get_time(activity['Start'])}", f"{date}T{get_time(activity['End'])}", activity_id)
+            for activity_id, activity in enumerate(activities)
+            for date in activity["Dates"]
+        )
+
+        self.starts = [start for start, _, _ in occurrences]
+        self.ends = [end for _, end, _ in occurrences]
+        self.activity_ids = [activity_id for _, _, activity_id in occurrences]
+
+    # ----------
+
+    def get_occurrence(self, position:'int') -> 'dict':
+        ''' The occurrence at `position`: its activity, with the "Date" it's on (and its "Start" and "End" as datetimes too). '''
+        occurrence = dict(self.activities[self.activity_ids[position]])
+        occurrence["Date"] = self.starts[position][:10]
+        occurrence["Starts At"] = self.starts[position]
+        occurrence["Ends At"] = self.ends[position]
+        return occurrence
+
+    # ----------
+
+    def get_next(self, after:'datetime.datetime', count:'int' = 1) -> 'list[dict]':
+        ''' The first `count` occurrences starting at or after `after`. '''
+        position = bisect.bisect_left(self.starts, after.isoformat(timespec="seconds"))
+        return [self.get_occurrence(i) for i in range(position, min(position + count, len(self.starts)))]
+
+    # ----------
+
+    def get_day(self, date:'datetime.date') -> 'list[dict]':
+        ''' Every occurrence on `date`, in order. '''
+        first = bisect.bisect_left(self.starts, date.isoformat())
+        last = bisect.bisect_left(self.starts, (date + datetime.timedelta(days = 1)).isoformat())
+        return [self.get_occurrence(i) for i in range(first, last)]
+
+# ============================================================
+
+def get_time(time_string:'str') -> 'str':
+    ''' e.g. `"09:00:00"` from `"09:00"` (or `"09:00:00"`). '''
+    return datetime.time.fromisoformat(time_string).isoformat(timespec="seconds")
+
+# ----------
+
+def get_occurrence_index_cache_key(module_codes:'list[str]', version:'str|None') -> 'str':
+    digest = get_module_codes_digest(module_codes)
+    return f"occurrences:{version or 'live'}:{digest}"
+
+# ----------
+
+def get_occurrence_index(scraper:'Scraper', module_codes:'list[str]') -> 'OccurrenceIndex':
+    ''' Returns the `OccurrenceIndex` of `module_codes`, from `scraper.cache` if it's already been built (see `clash_matrix.get_clash_matrix`). '''
+
+    version = scraper.get_snapshot_version(module_codes)
+    cache_key = get_occurrence_index_cache_key(module_codes, version)
+
+    index = scraper.cache.get(cache_key)
+    if index is MISSING:
+        index = OccurrenceIndex(scraper.get_module_timetable(module_codes, "list"))
+        scraper.cache.set(cache_key, index, CACHE_TTLS["derived"] if (version is not None) else CACHE_TTLS["timetable"])
+
+    return index
+
+# ----------
+
+async def get_occurrence_index_async(scraper:'Scraper', module_codes:'list[str]', executor:'concurrent.futures.Executor' = None) -> 'OccurrenceIndex':
+    ''' The same as `get_occurrence_index`, but the timetables are got with `Scraper.get_module_timetable_async`. '''
+
+    version = scraper.get_snapshot_version(module_codes)
+    cache_key = get_occurrence_index_cache_key(module_codes, version)
+
+    index = scraper.cache.get(cache_key)
+    if index is MISSING:
+        index = OccurrenceIndex(await scraper.get_module_timetable_async(module_codes, "list", executor=executor))
+        scraper.cache.set(cache_key, index, CACHE_TTLS["derived"] if (version is not None) else CACHE_TTLS["timetable"])
+
+    return index
@@ -0,0 +1,201 @@
+'''
+Compact encodings of the timetables returned by `/get-module-timetables`, and compression of response bodies.
+
+By default the route returns `flask.jsonify(timetables)`, where every activity repeats all of its key names and
+"Dates" holds a full ISO date string for every week the activity takes place in. Clients can opt in to something smaller
+using the `Accept` header:
+
+- `application/json` (the default) --> the day-keyed `dict` from `Scraper.get_module_timetable`, as before.
+- `application/vnd.timetable.columnar+json` --> the columnar format below, as JSON.
+- `application/msgpack` --> the columnar format below, packed with MessagePack (only offered if `msgpack` is installed).
+
+The columnar format looks like this:
+
+```python
+{
+    "Format": "columnar-v1",
+    "Week 1": "2022-07-18", # the Monday of week 1; week `n` starts `7 * (n-1)` days later
+    "Days": {
+        "Monday": {
+            "Activity": ["COMP2181/PRAC/001", ...],
+            "Start":    ["09:00:00", ...],
+            ...
+            "Weeks":    [[[12, 21], [26, 35]], ...], # replaces "Dates" - runs of consecutive week numbers
+        },
+        ...
+    }
+}
+```
+
+`compress` gzips (or brotlis, if `brotli` is installed and the client accepts it) response bodies.
+'''
+
+import gzip
+import json
+import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from scraper import Scraper, WEEK_PATTERNS
+
+JSON_MIMETYPE = "application/json"
+COLUMNAR_JSON_MIMETYPE = "application/vnd.timetable.columnar+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# Bodies smaller than this aren't worth compressing.
+MINIMUM_COMPRESSIBLE_SIZE = 500
+
+# The Monday of week 1 of the academic year. Every other week follows on from it.
+WEEK_1_MONDAY = WEEK_PATTERNS["1"]["Calendar Date"][0]
+
+# ============================================================
+
+def dates_to_week_runs(dates:'list[str]') -> 'list[list[int]]':
+    '''
+    Converts the YYYY-MM-DD dates of an activity (which all fall on the same day of the week) to runs of consecutive week numbers.
+
+    e.g. the dates of weeks 12, 13, 14 and 20 become `[[12, 14], [20, 20]]`.
+    '''
+
+    weeks = sorted({Scraper.get_week_number_from_date(datetime.date.fromisoformat(date)) for date in dates})
+
+    runs = []
+    for week in weeks:
+        if runs and (runs[-1][1] == week - 1):
+            runs[-1][1] = week
+        else:
+            runs.append([week, week])
+
+    return runs
+
+# ----------
+
+def week_runs_to_dates(runs:'list[list[int]]', day_of_the_week:'str') -> 'list[str]':
+    ''' The inverse of `dates_to_week_runs`. `day_of_the_week` is e.g. `"Monday"`. '''
+
+    DAYS_OF_THE_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    day_offset = DAYS_OF_THE_WEEK.index(day_of_the_week)
+
+    dates = []
+    for first, last in runs:
+        for week in range(first, last+1):
+            date = WEEK_1_MONDAY + datetime.timedelta(days = 7*(week-1) + day_offset)
+            dates.append(date.isoformat())
+
+    return dates
+
+# ============================================================
+
+def to_columnar(timetables:'dict[str, list[dict]]') -> 'dict':
+    ''' Converts the day-keyed `dict` returned by `Scraper.get_module_timetable` to the columnar format (see the top of this file). '''
+
+    days = dict()
+
+    for day_of_the_week, activities in timetables.items():
+
+        columns = dict()
+
+        for activity in activities:
+            for key, value in activity.items():
+
+                # the day is already the key of `days`, so there's no need to repeat it
+                if key == "Day Of The Week":
+                    continue
+
+                if key == "Dates":
+                    columns.setdefault("Weeks", []).append(dates_to_week_runs(value))
+                else:
+                    columns.setdefault(key, []).append(value)
+
+        days[day_of_the_week] = columns
+
+    return {
+        "Format": "columnar-v1",
+        "Week 1": WEEK_1_MONDAY.isoformat(),
+        "Days": days,
+    }
+
+# ----------
+
+def from_columnar(columnar:'dict') -> 'dict[str, list[dict]]':
+    ''' The inverse of `to_columnar`. '''
+
+    timetables = dict()
+
+    for day_of_the_week, columns in columnar["Days"].items():
+
+        # all the columns are the same length - the number of activities on this day
+        number_of_activities = len(next(iter(columns.values()), []))
+
+        activities = []
+        for index in range(number_of_activities):
+
+            activity = {"Day Of The Week": day_of_the_week}
+            for key, values in columns.items():
+                if key == "Weeks":
+                    activity["Dates"] = week_runs_to_dates(values[index], day_of_the_week)
+                else:
+                    activity[key] = values[index]
+
+            activities.append(activity)
+
+        timetables[day_of_the_week] = activities
+
+    return timetables
+
+# ============================================================
+
+def negotiate_format(accept_mimetypes:'werkzeug.datastructures.MIMEAccept') -> 'str':
+    '''
+    Returns the mimetype that `/get-module-timetables` should respond with, based on the request's `Accept` header.
+
+    Plain JSON is listed first, so it wins unless the client explicitly prefers one of the compact formats.
+    '''
+
+    offered = [JSON_MIMETYPE, COLUMNAR_JSON_MIMETYPE]
+    if msgpack is not None:
+        offered.append(MSGPACK_MIMETYPE)
+
+    return accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+
+# ----------
+
+def encode_timetables(timetables:'dict[str, list[dict]]', mimetype:'str') -> 'bytes':
+    ''' Encodes `timetables` in the compact format given by `mimetype` (one of the mimetypes returned by `negotiate_format`, other than `JSON_MIMETYPE`). '''
+
+    columnar = to_columnar(timetables)
+
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(columnar)
+
+    # `separators` gets rid of the spaces after the commas and colons
+    return json.dumps(columnar, separators=(",", ":")).encode("utf-8")
+
+# ============================================================
+
+def compress(body:'bytes', accept_encoding:'werkzeug.datastructures.Accept') -> 'tuple[bytes, str|None]':
+    '''
+    Compresses `body` with the best encoding in the request's `Accept-Encoding` header.
+
+    Returns the (possibly) compressed body and the value for the `Content-Encoding` header
+    (`None` if the body has been left as it is).
+    '''
+
+    if len(body) < MINIMUM_COMPRESSIBLE_SIZE:
+        return body, None
+
+    if (brotli is not None) and ("br" in accept_encoding):
+        return brotli.compress(body, quality=5), "br"
+
+    if "gzip" in accept_encoding:
+        return gzip.compress(body, compresslevel=6), "gzip"
+
+    return body, None